@@ -0,0 +1,92 @@
+# throughput of TextChunker on multi-MB documents: whole text vs streamed pages
+#
+#   python -m benchmarks.chunker_throughput [--sizes 1 4 16] [--mode semantic] [--page-size 3000]
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Iterator
+from src.chunking.chunker import TextChunker
+
+WORDS = (
+    "le la les un une des intelligence artificielle modele donnees apprentissage "
+    "reseau neurones recherche document texte question reponse contexte systeme "
+    "entrainement evaluation precision rappel vecteur index requete"
+).split()
+
+
+def generate_pages(size_mb: float, page_size: int, seed: int = 0) -> Iterator[str]:
+    """
+    Pages de texte synthetique (~page_size caracteres): paragraphes courts et
+    longs, pour passer par le regroupement de paragraphes et le decoupage en phrases.
+    """
+    rnd = random.Random(seed)
+    remaining = int(size_mb * 1_000_000)
+    while remaining > 0:
+        paragraphs = []
+        length = 0
+        while length < page_size:
+            sentences = []
+            for _ in range(rnd.choice([1, 2, 4, 12, 30])):
+                words = rnd.choices(WORDS, k=rnd.randint(5, 25))
+                sentences.append(" ".join(words).capitalize() + rnd.choice([".", ".", "!", "?"]))
+            paragraph = " ".join(sentences)
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        page = "\n\n".join(paragraphs) + "\n"
+        remaining -= len(page)
+        yield page
+
+
+def measure(run) -> dict:
+    """Duree d'un appel, puis pic memoire d'un second appel (tracemalloc ralentit)"""
+    start = time.perf_counter()
+    chunks = run()
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"chunks": chunks, "seconds": duration, "peak_mb": peak / 1e6}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Debit du TextChunker sur des documents de plusieurs MB")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="Tailles en MB")
+    parser.add_argument("--mode", default=None, help="semantic ou classic (defaut: settings.chunk_mode)")
+    parser.add_argument("--page-size", type=int, default=3000)
+    args = parser.parse_args(argv)
+
+    chunker = TextChunker(args.mode)
+    report = []
+    for size in args.sizes:
+        pages = list(generate_pages(size, args.page_size))
+        text = "".join(pages)
+        megabytes = len(text.encode("utf-8")) / 1e6
+
+        # tracemalloc ne compte que les allocations faites pendant la mesure:
+        # le texte d'entree n'entre pas dans le pic, la liste des chunks si
+        whole = measure(lambda: len(chunker.chunk(text)))
+        streamed = measure(lambda: sum(1 for _ in chunker.iter_chunks(iter(pages))))
+        identical = chunker.chunk(text) == list(chunker.iter_chunks(pages))
+
+        report.append({
+            "mode": chunker.mode,
+            "size_mb": round(megabytes, 2),
+            "chunks": whole["chunks"],
+            "identical": identical,
+            "whole_mb_per_s": round(megabytes / whole["seconds"], 2),
+            "whole_peak_mb": round(whole["peak_mb"], 2),
+            "streamed_mb_per_s": round(megabytes / streamed["seconds"], 2),
+            "streamed_peak_mb": round(streamed["peak_mb"], 2)
+        })
+        del pages, text
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# cold start of main.py: import time, startup time (lifespan) and latency of the first query
+#
+#   python -m benchmarks.cold_start [--repeat 5] [--model-load-ms 2000] [--reranker] [--output cold.json]
+#
+# Each run is a fresh Python process, started against a fake Ollama whose models
+# are unloaded before every run. Runs with and without prewarm_models are compared.
+# The seeded tenant (Postgres of DATABASE_URL, or the numpy store) is wiped at the end.
+
+# Imports legers seulement: le processus enfant mesure l'import de main
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+# Imports lourds qui ne doivent pas etre faits a l'import de main
+HEAVY_MODULES = (
+    "fitz", "docx", "langchain_text_splitters", "sentence_transformers",
+    "transformers", "torch", "onnxruntime"
+)
+
+
+def child(tenant: str):
+    """Un demarrage mesure dans ce processus; une ligne JSON sur stdout"""
+    start = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - start
+    heavy_modules = sorted(name for name in HEAVY_MODULES if name in sys.modules)
+
+    import requests
+    from benchmarks.suite import start_app
+
+    start = time.perf_counter()
+    base_url = start_app()  # rend la main une fois le lifespan (migration, prewarm) termine
+    startup_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    response = requests.post(
+        f"{base_url}/query",
+        json={"question": f"question {uuid.uuid4().hex}", "user_id": tenant}
+    )
+    response.raise_for_status()
+    first_query_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "import_s": import_s,
+        "startup_s": startup_s,
+        "first_query_s": first_query_s,
+        "heavy_modules": heavy_modules
+    }))
+
+
+def seed(tenant: str, chunks: int = 20):
+    """Quelques chunks dans le tenant: la premiere requete va jusqu'a la generation"""
+    from benchmarks.fake_ollama import fake_embedding
+    from config.settings import settings
+    from src.storage.backend import get_vector_store
+
+    store = get_vector_store()
+    store.ensure_schema()
+    contents = [f"Paragraphe {i} du document de demarrage a froid." for i in range(chunks)]
+    store.add_batch(
+        [
+            {"content": content, "source": "cold-start.txt", "chunk_index": i}
+            for i, content in enumerate(contents)
+        ],
+        [fake_embedding(content, settings.embedding_dim) for content in contents],
+        user_id=tenant
+    )
+    # Le backend numpy n'accepte qu'un processus: les enfants doivent pouvoir l'ouvrir
+    store.close()
+
+
+def run_child(tenant: str, env: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", "--tenant", tenant],
+        env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Demarrage en echec:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Medianes des runs (secondes)"""
+    summary = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ("import_s", "startup_s", "first_query_s")
+    }
+    summary["time_to_first_answer_s"] = statistics.median(
+        run["startup_s"] + run["first_query_s"] for run in runs
+    )
+    summary["heavy_modules"] = sorted({name for run in runs for name in run["heavy_modules"]})
+    summary["runs"] = len(runs)
+    return summary
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Demarrage a froid de main.py: import, lifespan, premiere requete")
+    parser.add_argument("--repeat", type=int, default=5, help="Demarrages par configuration")
+    parser.add_argument("--model-load-ms", type=float, default=2000.0, help="Chargement simule de chaque modele")
+    parser.add_argument("--reranker", action="store_true", help="Active le reranker (modele a charger)")
+    parser.add_argument("--output", help="Fichier JSON des resultats")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--tenant", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.tenant)
+        return
+
+    from benchmarks.fake_ollama import FakeOllama
+    from benchmarks.suite import git_commit
+    from src.storage.backend import get_vector_store
+
+    fake = FakeOllama(model_load_ms=args.model_load_ms).start()
+    tenant = f"bench-{uuid.uuid4().hex[:8]}"
+    seed(tenant)
+    env = {
+        **os.environ,
+        "OLLAMA_BASE_URL": fake.base_url,
+        "USE_RERANKER": str(args.reranker).lower(),
+        # Caches vides a chaque demarrage, comme sur un nouveau worker
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "ANSWER_CACHE_ENABLED": "false"
+    }
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("child", "tenant")}
+        },
+        "scenarios": {}
+    }
+    try:
+        for prewarm in (False, True):
+            runs = []
+            for _ in range(args.repeat):
+                fake.loaded_models.clear()
+                runs.append(run_child(tenant, {**env, "PREWARM_MODELS": str(prewarm).lower()}))
+            results["scenarios"]["prewarm" if prewarm else "lazy"] = summarize(runs)
+    finally:
+        store = get_vector_store()
+        store.clear(user_id=tenant)
+        store.close()
+        fake.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
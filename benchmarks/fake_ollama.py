@@ -0,0 +1,189 @@
+# local stand-in for the Ollama HTTP API, for benchmarks without a GPU or a model
+#
+#   python -m benchmarks.fake_ollama [--port 11434] [--embed-latency-ms 20] [--tokens-per-s 50]
+#                                    [--model-load-ms 3000]
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from config.settings import settings
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    """Vecteur unitaire deterministe derive du texte (meme texte -> meme vecteur)"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeOllama:
+    """
+    Serveur HTTP qui imite /api/embed, /api/embeddings et /api/generate.
+
+    Latences artificielles: embed_latency_ms par appel + embed_item_latency_ms
+    par texte, generate_latency_ms avant le premier token puis answer_tokens
+    tokens au rythme de tokens_per_s (0 = instantane). Le premier appel de
+    chaque modele attend model_load_ms (chargement du modele en memoire).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = None,
+                 embed_latency_ms: float = 0.0, embed_item_latency_ms: float = 0.0,
+                 generate_latency_ms: float = 0.0, tokens_per_s: float = 0.0,
+                 answer_tokens: int = 50, model_load_ms: float = 0.0):
+        self.dim = dim or settings.embedding_dim
+        self.embed_latency_ms = embed_latency_ms
+        self.embed_item_latency_ms = embed_item_latency_ms
+        self.generate_latency_ms = generate_latency_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.model_load_ms = model_load_ms
+        self.loaded_models = set()
+
+        self.requests = {}  # chemin -> nombre d'appels
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def _load(self, model: str):
+        """Les appels concurrents attendent la fin du chargement, comme dans Ollama"""
+        if not self.model_load_ms:
+            return
+        with self._load_lock:
+            if model not in self.loaded_models:
+                time.sleep(self.model_load_ms / 1000)
+                self.loaded_models.add(model)
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        time.sleep((self.embed_latency_ms + self.embed_item_latency_ms * len(texts)) / 1000)
+        return [fake_embedding(text, self.dim) for text in texts]
+
+    def _tokens(self, prompt: str) -> list[str]:
+        words = prompt.split()[-self.answer_tokens:] or ["ok"]
+        return [f" {words[i % len(words)]}" for i in range(self.answer_tokens)]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload: dict, status: int = 200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake._count(self.path)
+                fake._load(body.get("model"))
+
+                if self.path == "/api/embed":
+                    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    self._send_json({"model": body.get("model"), "embeddings": fake._embed(texts)})
+                elif self.path == "/api/embeddings":
+                    self._send_json({"embedding": fake._embed([body["prompt"]])[0]})
+                elif self.path == "/api/generate":
+                    self._generate(body)
+                else:
+                    self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+            def _generate(self, body: dict):
+                time.sleep(fake.generate_latency_ms / 1000)
+                tokens = fake._tokens(body.get("prompt", ""))
+                delay = 1 / fake.tokens_per_s if fake.tokens_per_s else 0.0
+
+                if not body.get("stream", True):
+                    time.sleep(delay * len(tokens))
+                    self._send_json({"model": body.get("model"), "response": "".join(tokens), "done": True})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens + [""]:
+                    if token:
+                        time.sleep(delay)
+                    line = json.dumps({"response": token, "done": not token}).encode() + b"\n"
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                fake._count(self.path)
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": settings.embedding_model}, {"name": settings.llm_model}]})
+                else:
+                    self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+        return Handler
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Faux serveur Ollama pour les benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-item-latency-ms", type=float, default=0.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=0.0)
+    parser.add_argument("--tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--model-load-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server = FakeOllama(
+        args.host, args.port,
+        embed_latency_ms=args.embed_latency_ms,
+        embed_item_latency_ms=args.embed_item_latency_ms,
+        generate_latency_ms=args.generate_latency_ms,
+        tokens_per_s=args.tokens_per_s,
+        answer_tokens=args.answer_tokens,
+        model_load_ms=args.model_load_ms
+    )
+    with server:
+        print(f"Faux Ollama sur {server.base_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# parity and latency of the ONNX reranker backend against PyTorch
+#
+#   python -m benchmarks.reranker_onnx [--fp32] [--runs 10] [--file data/test.txt]
+
+import argparse
+import json
+from src.chunking.chunker import TextChunker
+from src.retrieval.onnx_reranker import compare_backends
+
+QUERIES = [
+    "Qu'est-ce que l'intelligence artificielle ?",
+    "Quelles sont les applications du machine learning ?",
+    "Comment fonctionne le deep learning ?",
+    "Quels sont les risques de l'IA ?",
+]
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Compare les backends PyTorch et ONNX du reranker")
+    parser.add_argument("--file", default="data/test.txt", help="Texte source des passages")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--fp32", action="store_true", help="Sans quantification int8")
+    args = parser.parse_args(argv)
+
+    with open(args.file, encoding="utf-8") as f:
+        passages = TextChunker().chunk(f.read())
+    pairs = [(query, passage) for query in QUERIES for passage in passages]
+
+    report = compare_backends(pairs, quantize=not args.fp32, runs=args.runs)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# end-to-end benchmark of main.py against a fake Ollama and the Postgres of DATABASE_URL
+#
+#   python -m benchmarks.suite [--docs 20] [--doc-size-kb 200] [--queries 200] [--concurrency 8]
+#                              [--output results.json] [--baseline previous.json] [--tolerance 0.2]
+#
+# Scenarios (in a dedicated tenant, wiped at the end): ingest, query, wipe.
+# The JSON output can be passed back as --baseline to compare two commits.
+
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from config.settings import settings
+from benchmarks.chunker_throughput import generate_pages
+from benchmarks.fake_ollama import FakeOllama
+
+# (scenario, metrique, plus grand = meilleur) comparees a la baseline
+COMPARED_METRICS = [
+    ("ingest", "docs_per_s", True),
+    ("ingest", "chunks_per_s", True),
+    ("ingest", "latency_p95_s", False),
+    ("ingest", "peak_rss_mb", False),
+    ("query", "queries_per_s", True),
+    ("query", "latency_p50_s", False),
+    ("query", "latency_p95_s", False),
+    ("query", "latency_p99_s", False),
+    ("query", "peak_rss_mb", False),
+    ("wipe", "seconds", False),
+]
+
+
+def latency_stats(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"latency_p50_s": None, "latency_p95_s": None, "latency_p99_s": None}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"latency_p50_s": float(p50), "latency_p95_s": float(p95), "latency_p99_s": float(p99)}
+
+
+class PeakRss:
+    """Pic de RSS du processus pendant un bloc, echantillonne toutes les `interval` s"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # Sans /proc: pic depuis le demarrage du processus (Ko sous Linux, octets sous macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self._rss())
+
+    def __enter__(self):
+        self.peak_bytes = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._rss())
+
+    @property
+    def peak_mb(self) -> float:
+        return self.peak_bytes / 1e6
+
+
+def start_app(host: str = "127.0.0.1") -> str:
+    """Lance main.app avec uvicorn dans un thread et retourne son URL"""
+    import uvicorn
+    import main
+
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://{host}:{port}"
+
+
+def scenario_ingest(http: requests.Session, base_url: str, tenant: str,
+                    docs: int, doc_size_kb: int) -> dict:
+    """Upload de `docs` fichiers .txt de `doc_size_kb` Ko, puis attente de tous les jobs"""
+    paths = []
+    for i in range(docs):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+            for page in generate_pages(doc_size_kb / 1000, 3000, seed=i):
+                f.write(page)
+            paths.append(f.name)
+    total_mb = sum(os.path.getsize(path) for path in paths) / 1e6
+
+    try:
+        with PeakRss() as rss:
+            start = time.perf_counter()
+            job_ids = []
+            for i, path in enumerate(paths):
+                while True:
+                    with open(path, "rb") as f:
+                        response = http.post(
+                            f"{base_url}/documents/upload",
+                            params={"user_id": tenant},
+                            files={"file": (f"bench-{i}.txt", f)}
+                        )
+                    if response.status_code != 429:  # file d'indexation pleine: reessayer
+                        break
+                    time.sleep(0.1)
+                response.raise_for_status()
+                job_ids.append(response.json()["job_id"])
+
+            jobs = {}
+            while len(jobs) < len(job_ids):
+                for job_id in job_ids:
+                    if job_id not in jobs:
+                        job = http.get(f"{base_url}/jobs/{job_id}").json()
+                        if job["status"] in ("done", "failed"):
+                            jobs[job_id] = job
+                time.sleep(0.05)
+            seconds = time.perf_counter() - start
+    finally:
+        for path in paths:
+            os.unlink(path)
+
+    done = [job for job in jobs.values() if job["status"] == "done"]
+    chunks = sum(job["progress"]["chunks_stored"] for job in done)
+    stage_seconds = {}
+    for job in done:
+        for stage, value in job["stage_timings"].items():
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + value
+
+    return {
+        "docs": docs,
+        "failed": len(jobs) - len(done),
+        "chunks": chunks,
+        "input_mb": round(total_mb, 3),
+        "seconds": seconds,
+        "docs_per_s": len(done) / seconds,
+        "chunks_per_s": chunks / seconds,
+        "mb_per_s": total_mb / seconds,
+        **latency_stats([job["finished_at"] - job["created_at"] for job in done]),
+        "stage_seconds": stage_seconds,
+        "peak_rss_mb": rss.peak_mb
+    }
+
+
+def scenario_query(http: requests.Session, base_url: str, tenant: str,
+                   queries: int, concurrency: int, search_mode: str = None) -> dict:
+    """`queries` questions distinctes sur /query, `concurrency` en parallele"""
+    def ask(i: int) -> tuple[float, bool]:
+        start = time.perf_counter()
+        response = http.post(f"{base_url}/query", json={
+            "question": f"Question {i}: que dit le document sur le modele et les donnees ?",
+            "user_id": tenant,
+            "search_mode": search_mode
+        })
+        return time.perf_counter() - start, response.ok
+
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(ask, range(queries)))
+        seconds = time.perf_counter() - start
+
+    latencies = [latency for latency, ok in outcomes if ok]
+    return {
+        "queries": queries,
+        "concurrency": concurrency,
+        "errors": queries - len(latencies),
+        "seconds": seconds,
+        "queries_per_s": len(latencies) / seconds,
+        **latency_stats(latencies),
+        "peak_rss_mb": rss.peak_mb
+    }
+
+
+def scenario_wipe(http: requests.Session, base_url: str, tenant: str) -> dict:
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        http.delete(f"{base_url}/documents", params={"user_id": tenant}).raise_for_status()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "peak_rss_mb": rss.peak_mb}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Affiche l'ecart a la baseline et retourne les metriques en regression"""
+    regressions = []
+    for scenario, metric, higher_is_better in COMPARED_METRICS:
+        old = baseline.get("scenarios", {}).get(scenario, {}).get(metric)
+        new = results["scenarios"].get(scenario, {}).get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"{scenario:>7}.{metric:<15} {old:12.4f} -> {new:12.4f} ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append(f"{scenario}.{metric}")
+    return regressions
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion / requetes de main.py sans Ollama")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--doc-size-kb", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--search-mode", choices=["vector", "lexical", "hybrid"], default=None)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-item-latency-ms", type=float, default=1.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--caches", action="store_true", help="Garde les caches d'embeddings et de reponses")
+    parser.add_argument("--reranker", action="store_true", help="Active le reranker (modele a charger)")
+    parser.add_argument("--output", help="Fichier JSON des resultats")
+    parser.add_argument("--baseline", help="Resultats JSON d'une execution precedente a comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ecart relatif toléré avant regression")
+    args = parser.parse_args(argv)
+
+    fake = FakeOllama(
+        embed_latency_ms=args.embed_latency_ms,
+        embed_item_latency_ms=args.embed_item_latency_ms,
+        generate_latency_ms=args.generate_latency_ms,
+        tokens_per_s=args.tokens_per_s,
+        answer_tokens=args.answer_tokens
+    ).start()
+
+    # Settings modifies avant l'import de main, qui construit les composants
+    settings.ollama_base_url = fake.base_url
+    settings.use_reranker = args.reranker
+    if not args.caches:
+        settings.embedding_cache_enabled = False
+        settings.answer_cache_enabled = False
+
+    base_url = start_app()
+    tenant = f"bench-{uuid.uuid4().hex[:8]}"
+    http = requests.Session()
+    http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "params": vars(args),
+            "settings": {
+                key: getattr(settings, key) for key in (
+                    "chunk_size", "chunk_overlap", "chunk_mode", "embedding_batch_size",
+                    "embedding_concurrency", "ingestion_max_concurrent_jobs",
+                    "vector_backend", "vector_index_type", "search_mode", "db_pool_size"
+                )
+            }
+        },
+        "scenarios": {}
+    }
+    try:
+        results["scenarios"]["ingest"] = scenario_ingest(http, base_url, tenant, args.docs, args.doc_size_kb)
+        results["scenarios"]["query"] = scenario_query(
+            http, base_url, tenant, args.queries, args.concurrency, args.search_mode
+        )
+    finally:
+        results["scenarios"]["wipe"] = scenario_wipe(http, base_url, tenant)
+        fake.stop()
+    results["meta"]["ollama_requests"] = fake.requests
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
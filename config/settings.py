@@ -2,27 +2,156 @@ from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
-    # Database
-    database_url: str
+    # Demarrage de l'API: schema cree / migre au demarrage (auto_migrate = False ->
+    # "python -m src.storage.maintenance migrate" une fois par deploiement), modeles
+    # d'embedding, LLM et reranker precharges avant la premiere requete
+    auto_migrate: bool = True
+    prewarm_models: bool = True
+
+    # Database (requise par le backend vectoriel "postgres")
+    database_url: str = ""
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Pool du chemin async (requetes des endpoints, driver asyncpg), distinct du pool
+    # synchrone (ingestion, ecritures): par worker, au plus
+    # db_pool_size + db_max_overflow + db_async_pool_size + db_async_max_overflow connexions
+    db_async_pool_size: int = 10
+    db_async_max_overflow: int = 10
+    # Timeout des requetes SQL du chemin async, en secondes (0 = pas de limite)
+    db_command_timeout: float = 30.0
 
     # Ollama
     ollama_base_url: str = "http://localhost:11434"
     embedding_model: str = "nomic-embed-text"
     llm_model: str = "mistral"
     embedding_dim: int = 768
+    ollama_timeout: float = 120.0
+    # Connexions simultanees du client HTTP async (generations en cours)
+    ollama_max_connections: int = 512
+    # Duree pendant laquelle Ollama garde les modeles charges apres un appel
+    # (ex: "30m", "-1m" = sans limite; vide = defaut d'Ollama)
+    ollama_keep_alive: str = ""
+
+    # Embedding client
+    embedding_batch_size: int = 64
+    embedding_concurrency: int = 4
+    embedding_max_retries: int = 3
+    embedding_retry_backoff: float = 0.5
+
+    # Embedding cache (embedding_cache_path vide = pas de niveau disque)
+    embedding_cache_enabled: bool = True
+    embedding_cache_memory_size: int = 10000
+    embedding_cache_path: str = ".cache/embeddings.sqlite3"
+    embedding_cache_max_entries: int = 500000
+
+    # Upload: copie sur disque par blocs (upload_max_bytes = 0 -> pas de limite)
+    upload_chunk_size: int = 1024 * 1024
+    upload_max_bytes: int = 0
+
+    # Extraction: les PDF d'au moins extraction_parallel_min_pages pages sont
+    # extraits par lots de pages dans un pool de processus (extraction_workers <= 1 -> sequentiel)
+    extraction_workers: int = 4
+    extraction_parallel_min_pages: int = 50
+    extraction_pages_per_task: int = 8
+    extraction_max_inflight_pages: int = 64
 
     # Chunking
     chunk_size: int = 500
     chunk_overlap: int = 50
     chunk_mode: str = "semantic"
 
+    # Ingestion jobs
+    ingestion_max_concurrent_jobs: int = 2
+    ingestion_max_pending_jobs: int = 100
+    ingestion_queue_size: int = 8
+    ingestion_job_history: int = 1000
+
+    # Ingestion en masse (/documents/bulk, python -m src.ingestion.bulk): extraction et
+    # chunking dans bulk_workers processus, au plus bulk_max_inflight_files fichiers
+    # en cours (copies temporaires des membres d'archives comprises)
+    bulk_workers: int = 4
+    bulk_max_inflight_files: int = 16
+    bulk_max_concurrent_jobs: int = 1
+    # Membres d'archives decompresses: chacun limite a upload_max_bytes, et au total
+    # bulk_max_extracted_bytes par job (0 -> pas de limite), contre les bombes zip
+    bulk_max_extracted_bytes: int = 10 * 1024 ** 3
+
+    # Catalogue des documents (GET /documents): taille de page par defaut et maximale
+    documents_page_size: int = 50
+    documents_max_page_size: int = 1000
+
+    # Backend des vecteurs: "postgres" (pgvector) ou "numpy" (en memoire, une
+    # matrice mmap par tenant dans numpy_store_path, recherche "vector" seulement)
+    vector_backend: str = "postgres"
+    numpy_store_path: str = ".cache/vectors"
+
+    # Bulk insert
+    bulk_insert_batch_size: int = 1000
+
+    # Partitionnement de document_chunks par project_id (a la creation de la table):
+    # "none", "list" (une partition par projet, creee au premier insert)
+    # ou "hash" (chunk_hash_partitions partitions fixes)
+    chunk_partitioning: str = "none"
+    chunk_hash_partitions: int = 16
+
+    # Vector index: "hnsw", "ivfflat" ou "none" (scan exact)
+    vector_index_type: str = "hnsw"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 40
+    ivfflat_lists: int = 100
+    ivfflat_probes: int = 1
+
+    # Stockage compact des vecteurs (pgvector >= 0.7): "vector" (float32),
+    # "halfvec" (index sur embedding::halfvec) ou "binary" (colonne embedding_bits
+    # binary_quantize(embedding) et son index Hamming). En mode compact l'index
+    # fournit top_k * vector_rescore_factor candidats, rescores sur embedding.
+    vector_storage: str = "vector"
+    vector_rescore_factor: int = 4
+
     # Retrieval
     top_k_results: int = 5
     top_k_rerank: int = 3
 
+    # Assemblage du contexte du prompt: chunks consecutifs fusionnes sans leur
+    # overlap, diversite MMR (context_mmr_lambda = 1 -> pertinence seule),
+    # budget en tokens estimes a context_chars_per_token caracteres (0 = pas de limite)
+    context_assembly_enabled: bool = True
+    context_token_budget: int = 1500
+    context_chars_per_token: float = 4.0
+    context_mmr_lambda: float = 0.7
+
+    # Search mode: "vector", "lexical" ou "hybrid" (fusion RRF des deux)
+    search_mode: str = "vector"
+    hybrid_candidates: int = 50
+    rrf_k: int = 60
+    text_search_config: str = "simple"
+
+    # Batch de questions (/query/batch): taille max et generations simultanees
+    query_batch_max_items: int = 256
+    query_batch_concurrency: int = 4
+
+    # Answer cache (similarite cosinus minimale entre deux questions)
+    answer_cache_enabled: bool = True
+    answer_cache_similarity: float = 0.95
+    answer_cache_ttl: float = 3600.0
+    answer_cache_max_entries: int = 1000
+
     # Reranker
     use_reranker: bool = True
     reranker_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_batch_window_ms: float = 5.0
+    rerank_max_batch_size: int = 128
+
+    # Reranker backend: "torch" ou "onnx" (reranker_onnx_threads = 0 -> defaut onnxruntime)
+    reranker_backend: str = "torch"
+    reranker_onnx_dir: str = ".cache/onnx"
+    reranker_onnx_quantize: bool = True
+    reranker_onnx_threads: int = 0
+    reranker_onnx_batch_size: int = 32
 
     # Prompt
     language: str = "fr"
@@ -1,24 +1,81 @@
 # API FastAPI pour le RAG
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Body, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Literal
+from datetime import datetime
+import asyncio
+import httpx
+import json
 import tempfile
 import os
+from contextlib import asynccontextmanager
 
+from config.settings import settings
 from src.extraction.extractor import TextExtractor
 from src.chunking.chunker import TextChunker
 from src.embedding.embedder import TextEmbedder
-from src.storage.vector_store import VectorStore
+from src.embedding.async_embedder import AsyncTextEmbedder
+from src.storage.backend import get_vector_store
+from src.storage.async_vector_store import get_async_vector_store
 from src.retrieval.rag_chain import RAGChain
-
-app = FastAPI(title="RAG API", description="API pour interroger des documents avec RAG")
+from src.retrieval.async_rag_chain import AsyncRAGChain
+from src.storage.database import async_pool_status, pool_status
+from src.ingestion.jobs import IngestionJobManager, JobQueueFull
+from src.ingestion.bulk import BulkIngestionManager, archive_extension
+from src.monitoring import metrics
 
 # Initialisation des composants
 extractor = TextExtractor()
 chunker = TextChunker()
 embedder = TextEmbedder()
-vector_store = VectorStore()
-rag_chain = RAGChain()
+vector_store = get_vector_store()
+rag_chain = RAGChain(embedder=embedder, vector_store=vector_store)
+ingestion_jobs = IngestionJobManager(extractor, chunker, embedder, vector_store)
+bulk_ingestion = BulkIngestionManager(embedder, vector_store)
+# Chemin async des requetes: memes cache d'embeddings, cache de reponses et reranker
+async_embedder = AsyncTextEmbedder(cache=embedder.cache)
+async_rag_chain = AsyncRAGChain(rag_chain, async_embedder, get_async_vector_store(vector_store))
+metrics.watch(embedding_cache=embedder.cache, answer_cache=rag_chain.answer_cache)
+
+
+async def _prewarm():
+    """Charge le modele d'embedding, le LLM (dans Ollama) et le reranker en parallele"""
+    warmups = [async_embedder.warmup(), async_rag_chain.warmup()]
+    if rag_chain.reranker is not None:
+        warmups.append(asyncio.to_thread(rag_chain.reranker.warmup))
+    for result in await asyncio.gather(*warmups, return_exceptions=True):
+        # Ollama injoignable au demarrage: ses modeles seront charges a la premiere requete
+        if isinstance(result, BaseException) and not isinstance(result, httpx.HTTPError):
+            raise result
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Demarrage: schema de la base (auto_migrate), puis modeles precharges
+    (prewarm_models) pour que la premiere requete ne paie pas leur chargement.
+    Les composants sont construits a l'import sans I/O ni import lourd.
+    """
+    if settings.auto_migrate:
+        await asyncio.to_thread(vector_store.ensure_schema)
+    if settings.prewarm_models:
+        await _prewarm()
+    yield
+    extractor.close()
+    bulk_ingestion.close()
+    await async_embedder.aclose()
+    await async_rag_chain.vector_store.aclose()
+    vector_store.close()
+
+
+app = FastAPI(
+    title="RAG API",
+    description="API pour interroger des documents avec RAG",
+    lifespan=lifespan
+)
 
 
 # Schemas Pydantic
@@ -27,11 +84,37 @@ class QueryRequest(BaseModel):
     top_k: int | None = None
     user_id: str | None = None
     project_id: str | None = None
+    search_mode: Literal["vector", "lexical", "hybrid"] | None = None
+    include_timings: bool = False
 
 
 class QueryResponse(BaseModel):
     answer: str
     sources: list[str]
+    cached: bool = False
+    tokens_saved: int = 0
+    timings: dict[str, float] | None = None
+
+
+class QueryBatchRequest(BaseModel):
+    questions: list[str]
+    top_k: int | None = None
+    user_id: str | None = None
+    project_id: str | None = None
+    search_mode: Literal["vector", "lexical", "hybrid"] | None = None
+
+
+class QueryBatchItem(BaseModel):
+    question: str
+    answer: str | None = None
+    sources: list[str] = []
+    cached: bool = False
+    tokens_saved: int = 0
+    error: str | None = None
+
+
+class QueryBatchResponse(BaseModel):
+    results: list[QueryBatchItem]
 
 
 class UploadRequest(BaseModel):
@@ -42,7 +125,57 @@ class UploadRequest(BaseModel):
 class UploadResponse(BaseModel):
     message: str
     filename: str
-    chunks_count: int
+    job_id: str
+    status: str
+    chunks_count: int | None = None
+    chunks_reused: int | None = None
+    chunks_added: int | None = None
+    chunks_removed: int | None = None
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    filename: str
+    user_id: str | None = None
+    project_id: str | None = None
+    status: str
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    progress: dict[str, int]
+    stage_timings: dict[str, float]
+    error: str | None = None
+
+
+class BulkJobResponse(BaseModel):
+    job_id: str
+    user_id: str | None = None
+    project_id: str | None = None
+    status: str
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    progress: dict[str, int]
+    throughput: dict[str, float | None]
+    stage_timings: dict[str, float]
+    failures: list[dict[str, str]]
+    error: str | None = None
+
+
+class DocumentInfo(BaseModel):
+    id: int
+    source: str | None = None
+    user_id: str | None = None
+    project_id: str | None = None
+    document_hash: str | None = None
+    chunk_count: int
+    size_bytes: int | None = None
+    indexed_at: datetime
+
+
+class DocumentListResponse(BaseModel):
+    documents: list[DocumentInfo]
+    next_after: int | None = None
 
 
 class DeleteRequest(BaseModel):
@@ -53,18 +186,50 @@ class DeleteRequest(BaseModel):
 # Endpoints
 @app.get("/health")
 def health_check():
-    """Verifie que l'API fonctionne"""
-    return {"status": "ok"}
-
-
-@app.post("/documents/upload", response_model=UploadResponse)
+    """Verifie que l'API fonctionne et expose l'occupation des pools de connexions"""
+    if settings.vector_backend != "postgres":
+        return {"status": "ok", "vector_backend": settings.vector_backend}
+    return {"status": "ok", "db_pool": pool_status(), "db_async_pool": async_pool_status()}
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Metriques Prometheus: latences par etage, appels Ollama, pool, caches, chunks indexes"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+def _spool_upload(upload, suffix: str) -> str:
+    """Copie l'upload sur disque par blocs: le fichier n'est jamais entierement en memoire"""
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while block := upload.read(settings.upload_chunk_size):
+                size += len(block)
+                if settings.upload_max_bytes and size > settings.upload_max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Fichier trop volumineux (max {settings.upload_max_bytes} octets)"
+                    )
+                tmp.write(block)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    return tmp.name
+
+
+@app.post("/documents/upload", response_model=UploadResponse, status_code=202)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...),
     user_id: str | None = Query(None, description="ID de l'utilisateur"),
-    project_id: str | None = Query(None, description="ID du projet")
+    project_id: str | None = Query(None, description="ID du projet"),
+    wait: bool = Query(False, description="Attendre la fin de l'indexation avant de repondre")
 ):
     """
-    Upload et indexe un document (PDF, DOCX, TXT)
+    Upload un document (PDF, DOCX, TXT) et le met en file d'indexation.
+    L'avancement est consultable via GET /jobs/{job_id}.
     """
     # Verifier l'extension
     allowed_extensions = [".pdf", ".docx", ".txt"]
@@ -76,58 +241,249 @@ async def upload_document(
             detail=f"Format non supporte. Formats acceptes: {allowed_extensions}"
         )
 
-    # Sauvegarder temporairement le fichier
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    # Sauvegarder temporairement le fichier (supprime par le job une fois indexe)
+    tmp_path = await run_in_threadpool(_spool_upload, file.file, file_ext)
 
     try:
-        # 1. Extraire le texte
-        text = extractor.extract(tmp_path)
+        job = ingestion_jobs.submit(
+            tmp_path,
+            file.filename,
+            user_id=user_id,
+            project_id=project_id
+        )
+    except JobQueueFull as exc:
+        os.unlink(tmp_path)
+        raise HTTPException(status_code=429, detail=f"File d'indexation pleine: {exc}")
 
-        # 2. Decouper en chunks
-        chunks = chunker.chunk_with_metadata(text, source=file.filename)
+    if not wait:
+        return UploadResponse(
+            message="Document en cours d'indexation",
+            filename=file.filename,
+            job_id=job.id,
+            status=job.status
+        )
 
-        if not chunks:
-            raise HTTPException(status_code=400, detail="Aucun texte extrait du document")
+    try:
+        await asyncio.wrap_future(job.future)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    response.status_code = 200
+    return UploadResponse(
+        message="Document indexe avec succes",
+        filename=file.filename,
+        job_id=job.id,
+        status=job.status,
+        chunks_count=job.chunks_stored,
+        chunks_reused=job.chunks_reused,
+        chunks_added=job.chunks_added,
+        chunks_removed=job.chunks_removed
+    )
 
-        # 3. Generer les embeddings
-        texts = [chunk["content"] for chunk in chunks]
-        embeddings = embedder.embed_batch(texts)
 
-        # 4. Stocker dans la base vectorielle
-        vector_store.add_batch(chunks, embeddings, user_id=user_id, project_id=project_id)
+@app.post("/documents/bulk", response_model=BulkJobResponse, status_code=202)
+async def upload_documents_bulk(
+    response: Response,
+    files: list[UploadFile] = File(...),
+    user_id: str | None = Query(None, description="ID de l'utilisateur"),
+    project_id: str | None = Query(None, description="ID du projet"),
+    wait: bool = Query(False, description="Attendre la fin de l'ingestion avant de repondre")
+):
+    """
+    Indexe un lot de documents (PDF, DOCX, TXT) et/ou d'archives zip/tar en un job.
+    Un fichier en echec est liste dans failures sans interrompre le lot.
+    L'avancement et le debit sont consultables via GET /documents/bulk/{job_id}.
+    """
+    inputs = []
+    try:
+        for file in files:
+            suffix = archive_extension(file.filename) or os.path.splitext(file.filename)[1].lower()
+            inputs.append((await run_in_threadpool(_spool_upload, file.file, suffix), file.filename))
+        job = bulk_ingestion.submit(inputs, user_id=user_id, project_id=project_id)
+    except BaseException as exc:
+        for tmp_path, _ in inputs:
+            os.unlink(tmp_path)
+        if isinstance(exc, JobQueueFull):
+            raise HTTPException(status_code=429, detail=f"File d'indexation pleine: {exc}")
+        raise
+
+    if wait:
+        try:
+            await asyncio.wrap_future(job.future)
+        except Exception:
+            pass  # echec global du lot (base injoignable...): rapporte par status et error
+        response.status_code = 200
+    return BulkJobResponse(**job.to_dict())
+
+
+@app.get("/documents/bulk/{job_id}", response_model=BulkJobResponse)
+def get_bulk_job(job_id: str):
+    """Etat, compteurs, debit et echecs par fichier d'une ingestion en masse"""
+    job = bulk_ingestion.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return BulkJobResponse(**job.to_dict())
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_job(job_id: str):
+    """Etat, progression et temps par etage d'un job d'indexation"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return JobStatusResponse(**job.to_dict())
+
+
+async def _cancel_on_disconnect(http_request: Request, coro):
+    """
+    Attend coro, annulee si le client se deconnecte avant la reponse:
+    la generation en cours chez Ollama est alors interrompue.
+    """
+    task = asyncio.ensure_future(coro)
 
-        return UploadResponse(
-            message="Document indexe avec succes",
-            filename=file.filename,
-            chunks_count=len(chunks)
-        )
+    async def watch():
+        # Le corps est deja lu: le prochain message est la deconnexion
+        while (await http_request.receive())["type"] != "http.disconnect":
+            pass
+        task.cancel()
 
+    watcher = asyncio.create_task(watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if not watcher.done():
+            raise
+        raise HTTPException(status_code=499, detail="Client deconnecte")
     finally:
-        # Nettoyer le fichier temporaire
-        os.unlink(tmp_path)
+        watcher.cancel()
 
 
 @app.post("/query", response_model=QueryResponse)
-def query_documents(request: QueryRequest):
+async def query_documents(request: QueryRequest, http_request: Request):
     """
-    Pose une question et obtient une reponse basee sur les documents indexes
+    Pose une question et obtient une reponse basee sur les documents indexes.
+    Avec include_timings, la reponse detaille le temps passe par etage (secondes).
     """
-    result = rag_chain.query(
+    with metrics.collect_timings() as timings:
+        result = await _cancel_on_disconnect(http_request, async_rag_chain.query(
+            request.question,
+            request.top_k,
+            user_id=request.user_id,
+            project_id=request.project_id,
+            search_mode=request.search_mode
+        ))
+
+    return QueryResponse(
+        answer=result["answer"],
+        sources=result["sources"],
+        cached=result["cached"],
+        tokens_saved=result.get("tokens_saved", 0),
+        timings={k: round(v, 4) for k, v in timings.items()} if request.include_timings else None
+    )
+
+
+@app.post("/query/batch", response_model=QueryBatchResponse)
+async def query_documents_batch(request: QueryBatchRequest, http_request: Request):
+    """
+    Pose plusieurs questions en une requete: embeddings et recherche groupes,
+    generations en parallele. Les resultats suivent l'ordre des questions,
+    une question en echec a un champ error.
+    """
+    if len(request.questions) > settings.query_batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Trop de questions (max {settings.query_batch_max_items})"
+        )
+
+    results = await _cancel_on_disconnect(http_request, async_rag_chain.query_batch(
+        request.questions,
+        request.top_k,
+        user_id=request.user_id,
+        project_id=request.project_id,
+        search_mode=request.search_mode
+    ))
+
+    return QueryBatchResponse(results=[
+        QueryBatchItem(
+            question=question,
+            answer=result.get("answer"),
+            sources=result.get("sources", []),
+            cached=result.get("cached", False),
+            tokens_saved=result.get("tokens_saved", 0),
+            error=result.get("error")
+        )
+        for question, result in zip(request.questions, results)
+    ])
+
+
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest, http_request: Request):
+    """
+    Comme /query mais la reponse est envoyee au fil de la generation:
+    d'abord les sources, puis les tokens. NDJSON par defaut,
+    Server-Sent Events si le client envoie Accept: text/event-stream.
+    Si le client se deconnecte, StreamingResponse annule le flux et la generation.
+    """
+    events = async_rag_chain.query_stream(
         request.question,
         request.top_k,
         user_id=request.user_id,
-        project_id=request.project_id
+        project_id=request.project_id,
+        search_mode=request.search_mode
     )
 
-    return QueryResponse(
-        answer=result["answer"],
-        sources=result["sources"]
+    async def with_errors():
+        # Les en-tetes sont deja partis: une erreur devient un evenement du flux
+        try:
+            async for event in events:
+                yield event
+        except Exception as exc:
+            yield {"type": "error", "detail": str(exc)}
+        finally:
+            await events.aclose()
+
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        body = (
+            f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            async for event in with_errors()
+        )
+        return StreamingResponse(body, media_type="text/event-stream")
+
+    body = (json.dumps(event, ensure_ascii=False) + "\n" async for event in with_errors())
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+
+@app.get("/documents", response_model=DocumentListResponse)
+def list_documents(
+    user_id: str | None = Query(None, description="ID de l'utilisateur"),
+    project_id: str | None = Query(None, description="ID du projet"),
+    limit: int = Query(settings.documents_page_size, ge=1, le=settings.documents_max_page_size),
+    after: int | None = Query(None, description="Dernier id de la page precedente (next_after)")
+):
+    """
+    Documents indexes, lus dans le catalogue (sans parcourir les chunks), par id croissant.
+    next_after est a repasser en after pour la page suivante (null sur la derniere page).
+    """
+    documents = vector_store.list_documents(user_id=user_id, project_id=project_id, limit=limit, after=after)
+    return DocumentListResponse(
+        documents=[DocumentInfo(**document) for document in documents],
+        next_after=documents[-1]["id"] if len(documents) == limit else None
     )
 
 
+@app.delete("/documents/{document_id}", response_model=DocumentInfo)
+def delete_document(
+    document_id: int,
+    user_id: str | None = Query(None, description="ID de l'utilisateur (doit correspondre si fourni)"),
+    project_id: str | None = Query(None, description="ID du projet (doit correspondre si fourni)")
+):
+    """Supprime un document et ses chunks"""
+    document = vector_store.delete_document(document_id, user_id=user_id, project_id=project_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document introuvable")
+    return DocumentInfo(**document)
+
+
 @app.delete("/documents")
 def clear_documents(
     user_id: str | None = Query(None, description="ID de l'utilisateur"),
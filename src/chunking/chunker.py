@@ -1,127 +1,179 @@
 # chunks the texte for RAG - Chunking sémantique adaptatif
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from typing import Iterable, Iterator
 from config.settings import settings
 import re
 
+# Fin de phrase suivie d'une majuscule / séparation entre paragraphes
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-ZÀ-ÿ])')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
 
 class TextChunker:
     """Chunker avec support pour chunking classique et sémantique"""
 
-    def __init__(self, mode: str = "semantic"):
+    def __init__(self, mode: str = None):
         """
         Args:
             mode: "classic" pour RecursiveCharacterTextSplitter,
                   "semantic" pour chunking par phrases/paragraphes
+                  (défaut: settings.chunk_mode)
         """
-        self.mode = mode
+        self.mode = mode or settings.chunk_mode
         self.chunk_size = settings.chunk_size
         self.chunk_overlap = settings.chunk_overlap
 
-        # Splitter classique comme fallback
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        # Splitter classique comme fallback, cree au premier usage
+        self._splitter = None
+
+    @property
+    def splitter(self):
+        """RecursiveCharacterTextSplitter (import de langchain differe: lent au demarrage)"""
+        if self._splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+                separators=["\n\n", "\n", ". ", " ", ""]
+            )
+        return self._splitter
 
     def _split_into_sentences(self, text: str) -> list[str]:
         """Découpe le texte en phrases de manière intelligente"""
-        # Pattern pour détecter les fins de phrases
-        sentence_endings = re.compile(r'(?<=[.!?])\s+(?=[A-ZÀ-ÿ])')
-        sentences = sentence_endings.split(text)
+        sentences = (s.strip() for s in SENTENCE_END.split(text))
 
         # Nettoyer les phrases vides
-        return [s.strip() for s in sentences if s.strip()]
+        return [s for s in sentences if s]
 
     def _split_into_paragraphs(self, text: str) -> list[str]:
         """Découpe le texte en paragraphes"""
-        paragraphs = re.split(r'\n\s*\n', text)
-        return [p.strip() for p in paragraphs if p.strip()]
+        return list(self._iter_paragraphs([text]))
+
+    def _iter_paragraphs(self, texts: Iterable[str]) -> Iterator[str]:
+        """
+        Paragraphes du texte formé par la concaténation de `texts`, sans le
+        reconstituer: un paragraphe peut être à cheval sur plusieurs morceaux.
+        """
+        parts = []  # paragraphe en cours, jusqu'à son dernier caractère non blanc
+        blank = ""  # blancs en fin de morceau: peut-être le début d'un séparateur
+
+        for piece in texts:
+            text = blank + piece
+            # Les blancs après le dernier caractère non blanc peuvent encore
+            # s'étendre au morceau suivant: leur séparateur éventuel est reporté
+            end = len(text.rstrip())
+            start = 0
+            for match in PARAGRAPH_BREAK.finditer(text, 0, end):
+                parts.append(text[start:match.start()])
+                paragraph = "".join(parts).strip()
+                if paragraph:
+                    yield paragraph
+                parts = []
+                start = match.end()
+
+            if start < end:
+                parts.append(text[start:end])
+            blank = text[end:]
+
+        paragraph = "".join(parts).strip()
+        if paragraph:
+            yield paragraph
 
     def _semantic_chunk(self, text: str) -> list[str]:
         """
         Chunking sémantique: regroupe les phrases en chunks cohérents
         tout en respectant les limites de taille
         """
-        # D'abord découper en paragraphes
-        paragraphs = self._split_into_paragraphs(text)
+        return list(self._iter_semantic([text]))
 
-        chunks = []
-        current_chunk = ""
+    def _iter_semantic(self, texts: Iterable[str]) -> Iterator[str]:
+        """
+        Chunking sémantique en une passe: les morceaux du chunk en cours sont
+        accumulés dans une liste (avec leur longueur totale) et joints une
+        seule fois, l'overlap est appliqué au fil de l'eau.
+        """
+        parts = []  # morceaux du chunk en cours, séparateurs compris
+        length = 0
+        previous = None  # chunk précédent, avant overlap
 
-        for paragraph in paragraphs:
+        for paragraph in self._iter_paragraphs(texts):
             # Si le paragraphe est trop long, le découper en phrases
             if len(paragraph) > self.chunk_size:
-                sentences = self._split_into_sentences(paragraph)
-
-                for sentence in sentences:
-                    # Si ajouter cette phrase dépasse la limite
-                    if len(current_chunk) + len(sentence) + 1 > self.chunk_size:
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = sentence
-                    else:
-                        current_chunk = f"{current_chunk} {sentence}".strip()
+                separator, pieces = " ", self._split_into_sentences(paragraph)
             else:
-                # Ajouter le paragraphe entier si possible
-                if len(current_chunk) + len(paragraph) + 2 > self.chunk_size:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = paragraph
+                separator, pieces = "\n\n", (paragraph,)
+
+            for piece in pieces:
+                # Si ajouter ce morceau dépasse la limite
+                if length + len(piece) + len(separator) > self.chunk_size:
+                    if parts:
+                        chunk = "".join(parts)
+                        yield self._overlap(previous, chunk)
+                        previous = chunk
+                    parts = [piece]
+                    length = len(piece)
+                elif parts:
+                    parts.append(separator)
+                    parts.append(piece)
+                    length += len(separator) + len(piece)
                 else:
-                    current_chunk = f"{current_chunk}\n\n{paragraph}".strip()
+                    parts = [piece]
+                    length = len(piece)
 
         # Ajouter le dernier chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-
-        # Appliquer l'overlap entre les chunks
-        if self.chunk_overlap > 0 and len(chunks) > 1:
-            chunks = self._apply_overlap(chunks)
-
-        return chunks
-
-    def _apply_overlap(self, chunks: list[str]) -> list[str]:
-        """Applique un overlap entre les chunks pour préserver le contexte"""
-        overlapped_chunks = [chunks[0]]
+        if parts:
+            yield self._overlap(previous, "".join(parts))
 
-        for i in range(1, len(chunks)):
-            prev_chunk = chunks[i - 1]
-            current_chunk = chunks[i]
+    def _overlap(self, previous: str | None, chunk: str) -> str:
+        """Préfixe le chunk par la fin du chunk précédent pour préserver le contexte"""
+        if previous is None or self.chunk_overlap <= 0:
+            return chunk
 
-            # Prendre les derniers mots du chunk précédent
-            overlap_text = prev_chunk[-self.chunk_overlap:] if len(prev_chunk) > self.chunk_overlap else prev_chunk
+        # Prendre les derniers mots du chunk précédent
+        overlap_text = previous[-self.chunk_overlap:] if len(previous) > self.chunk_overlap else previous
 
-            # Trouver un point de coupure propre (début de mot)
-            space_idx = overlap_text.find(' ')
-            if space_idx != -1:
-                overlap_text = overlap_text[space_idx + 1:]
+        # Trouver un point de coupure propre (début de mot)
+        space_idx = overlap_text.find(' ')
+        if space_idx != -1:
+            overlap_text = overlap_text[space_idx + 1:]
 
-            # Ajouter l'overlap au début du chunk actuel
-            overlapped_chunk = f"{overlap_text} {current_chunk}".strip()
-            overlapped_chunks.append(overlapped_chunk)
+        return f"{overlap_text} {chunk}".strip()
 
-        return overlapped_chunks
+    def _apply_overlap(self, chunks: list[str]) -> list[str]:
+        """Applique un overlap entre les chunks pour préserver le contexte"""
+        return chunks[:1] + [
+            self._overlap(chunks[i - 1], chunks[i]) for i in range(1, len(chunks))
+        ]
 
     def chunk(self, text: str) -> list[str]:
         """Découpe le texte en chunks selon le mode configuré"""
+        return list(self.iter_chunks(text))
+
+    def iter_chunks(self, texts: str | Iterable[str]) -> Iterator[str]:
+        """
+        Chunks du texte formé par la concaténation de `texts` (pages,
+        paragraphes...), produits au fil de la lecture en mode sémantique.
+        Même résultat que chunk("".join(texts)).
+        """
+        if isinstance(texts, str):
+            texts = [texts]
         if self.mode == "semantic":
-            return self._semantic_chunk(text)
-        return self.splitter.split_text(text)
+            return self._iter_semantic(texts)
+        # Le splitter classique a besoin du texte complet
+        return iter(self.splitter.split_text("".join(texts)))
 
     def chunk_with_metadata(self, text: str, source: str) -> list[dict]:
         """Découpe le texte avec métadonnées enrichies"""
-        chunks = self.chunk(text)
+        return list(self.iter_chunks_with_metadata(text, source))
 
-        return [
-            {
+    def iter_chunks_with_metadata(self, texts: str | Iterable[str], source: str) -> Iterator[dict]:
+        """Comme chunk_with_metadata, en flux (voir iter_chunks)"""
+        for i, chunk in enumerate(self.iter_chunks(texts)):
+            yield {
                 "content": chunk,
                 "source": source,
                 "chunk_index": i,
                 "chunk_mode": self.mode,
                 "char_count": len(chunk)
             }
-            for i, chunk in enumerate(chunks)
-        ]
@@ -0,0 +1,117 @@
+# generates the vectors (embeddings) via Ollama, asyncio version for the async endpoints
+
+import asyncio
+import httpx
+from config.settings import settings
+from src.embedding.cache import EmbeddingCache
+from src.monitoring.metrics import ollama_request
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_ollama_client() -> httpx.AsyncClient:
+    """
+    Client HTTP async partage: pool de connexions keep-alive vers Ollama.
+    Le timeout s'applique a chaque appel (connexion, attente d'une connexion
+    du pool, lecture entre deux fragments).
+    """
+    return httpx.AsyncClient(
+        base_url=settings.ollama_base_url,
+        timeout=httpx.Timeout(settings.ollama_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.ollama_max_connections,
+            max_keepalive_connections=settings.ollama_max_connections
+        )
+    )
+
+
+class AsyncTextEmbedder:
+    """
+    Equivalent de TextEmbedder pour la boucle asyncio: memes lots, meme cache
+    (partageable avec le TextEmbedder de l'ingestion), memes retries.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None, cache: EmbeddingCache = None):
+        self.model = settings.embedding_model
+        self.batch_size = settings.embedding_batch_size
+        self.concurrency = max(1, settings.embedding_concurrency)
+        self.client = client or build_ollama_client()
+        self.cache = cache
+        if self.cache is None and settings.embedding_cache_enabled:
+            self.cache = EmbeddingCache()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _embed_request(self, texts: list[str]) -> list[list[float]]:
+        """Un seul appel a /api/embed, retry avec backoff exponentiel (comme urllib3 Retry)"""
+        attempt = 0
+        while True:
+            try:
+                with ollama_request("embed"):
+                    response = await self.client.post("/api/embed", json={
+                        "model": self.model,
+                        "input": texts,
+                        "keep_alive": settings.ollama_keep_alive or None
+                    })
+                    response.raise_for_status()
+                    return response.json()["embeddings"]
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                retryable = (
+                    not isinstance(exc, httpx.HTTPStatusError)
+                    or exc.response.status_code in RETRY_STATUSES
+                )
+                if not retryable or attempt >= settings.embedding_max_retries:
+                    raise
+            attempt += 1
+            if attempt > 1:
+                await asyncio.sleep(settings.embedding_retry_backoff * 2 ** (attempt - 1))
+
+    async def warmup(self):
+        """Charge le modele d'embedding dans Ollama (a appeler au demarrage)"""
+        await self._embed_request(["warmup"])
+
+    async def embed(self, text: str) -> list[float]:
+        """Genere l'embedding d'un seul texte via Ollama"""
+        return (await self.embed_batch([text]))[0]
+
+    async def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Genere les embeddings de plusieurs textes (voir TextEmbedder.embed_batch).
+        Les acces au cache, qui peuvent lire le niveau SQLite, passent par un thread.
+        """
+        if self.cache is None:
+            return await self._embed_uncached(texts)
+
+        embeddings = await asyncio.to_thread(self.cache.get_many, texts)
+        missing = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+        if missing:
+            computed = await self._embed_uncached(missing)
+            await asyncio.to_thread(self.cache.put_many, missing, computed)
+            by_text = dict(zip(missing, computed))
+            embeddings = [
+                embedding if embedding is not None else by_text[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        return embeddings
+
+    async def _embed_uncached(self, texts: list[str]) -> list[list[float]]:
+        """Appels Ollama par lots, au plus `embedding_concurrency` lots en vol par appel"""
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) <= 1:
+            return [e for batch in batches for e in await self._embed_request(batch)]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(batch):
+            async with semaphore:
+                return await self._embed_request(batch)
+
+        # gather() conserve l'ordre des lots quel que soit l'ordre de completion
+        results = await asyncio.gather(*(limited(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
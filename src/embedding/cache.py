@@ -0,0 +1,186 @@
+# content-addressed cache for embeddings: in-process LRU + SQLite on disk
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from config.settings import settings
+
+
+class EmbeddingCache:
+    """
+    Cache d'embeddings a deux niveaux, adresse par sha256(embedding_model, texte).
+
+    - niveau memoire: LRU borne a `memory_size` entrees
+    - niveau disque: table SQLite bornee a `max_entries` entrees (eviction LRU)
+
+    Le modele et la dimension sont enregistres dans le fichier: si
+    `settings.embedding_model` ou `settings.embedding_dim` changent, le niveau
+    disque est vide a l'ouverture.
+    """
+
+    def __init__(self, path: str = None, memory_size: int = None,
+                 max_entries: int = None, model: str = None, dim: int = None):
+        self.model = model or settings.embedding_model
+        self.dim = dim or settings.embedding_dim
+        self.memory_size = settings.embedding_cache_memory_size if memory_size is None else memory_size
+        self.max_entries = settings.embedding_cache_max_entries if max_entries is None else max_entries
+        self.path = settings.embedding_cache_path if path is None else path
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = self._open_db(self.path) if self.path else None
+
+    def _open_db(self, path: str) -> sqlite3.Connection:
+        """Ouvre le niveau disque et l'invalide si le modele ou la dimension ont change"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access INTEGER NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings (last_access)")
+
+        meta = dict(db.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("model") != self.model or meta.get("dim") != str(self.dim):
+            with db:
+                db.execute("BEGIN")
+                db.execute("DELETE FROM embeddings")
+                db.executemany(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    [("model", self.model), ("dim", str(self.dim))]
+                )
+
+        row = db.execute("SELECT MAX(last_access) FROM embeddings").fetchone()
+        self._tick = row[0] or 0
+        return db
+
+    def key(self, text: str) -> str:
+        """Cle de contenu: hash du couple (modele, texte)"""
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """Retourne l'embedding en cache de chaque texte, ou None si absent"""
+        keys = [self.key(text) for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self._db is not None:
+                found = self._disk_get(list(missing))
+                for key, vector in found.items():
+                    for i in missing.pop(key):
+                        results[i] = vector
+                        self.disk_hits += 1
+                    self._remember(key, vector)
+
+            self.misses += sum(len(positions) for positions in missing.values())
+
+        return results
+
+    def put_many(self, texts: list[str], embeddings: list[list[float]]):
+        """Enregistre les embeddings calcules dans les deux niveaux"""
+        rows = []
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                if len(embedding) != self.dim:
+                    continue
+                key = self.key(text)
+                self._remember(key, embedding)
+                self._tick += 1
+                rows.append((key, array("f", embedding).tobytes(), self._tick))
+
+            if rows and self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    rows
+                )
+                self._evict()
+
+    def _remember(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        # SQLite limite le nombre de parametres par requete
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                if len(vector) == self.dim:
+                    found[key] = vector.tolist()
+
+        if found:
+            touched = []
+            for key in found:
+                self._tick += 1
+                touched.append((self._tick, key))
+            self._db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", touched)
+        return found
+
+    def _evict(self):
+        """Supprime les entrees les moins recemment utilisees au-dela de max_entries"""
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evincer 10% de marge pour ne pas payer ce DELETE a chaque insertion
+        excess = count - int(self.max_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+
+    def clear(self):
+        """Vide les deux niveaux du cache"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+
+    def stats(self) -> dict:
+        """Compteurs de hits/miss et taille des niveaux"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            disk_entries = (
+                self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._db is not None else 0
+            )
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries
+            }
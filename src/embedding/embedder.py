@@ -1,7 +1,12 @@
 # generates the vectors (embeddings) via Ollama
 
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config.settings import settings
+from src.embedding.cache import EmbeddingCache
+from src.monitoring.metrics import ollama_request
 
 
 class TextEmbedder:
@@ -9,22 +14,88 @@ class TextEmbedder:
     def __init__(self):
         self.base_url = settings.ollama_base_url
         self.model = settings.embedding_model
+        self.batch_size = settings.embedding_batch_size
+        self.concurrency = max(1, settings.embedding_concurrency)
+        self.timeout = settings.ollama_timeout
+        self.session = self._build_session()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix="embedder"
+        )
+        self.cache = EmbeddingCache() if settings.embedding_cache_enabled else None
+
+    def _build_session(self) -> requests.Session:
+        """Session HTTP partagee: pool de connexions + retry avec backoff exponentiel"""
+        retry = Retry(
+            total=settings.embedding_max_retries,
+            backoff_factor=settings.embedding_retry_backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None  # POST inclus: un appel d'embedding est idempotent
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.concurrency,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _embed_request(self, texts: list[str]) -> list[list[float]]:
+        """Un seul appel a /api/embed pour plusieurs textes"""
+        with ollama_request("embed"):
+            response = self.session.post(
+                f"{self.base_url}/api/embed",
+                json={
+                    "model": self.model,
+                    "input": texts,
+                    "keep_alive": settings.ollama_keep_alive or None
+                },
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()["embeddings"]
 
     def embed(self, text: str) -> list[float]:
         """Genere l'embedding d'un seul texte via Ollama"""
-        response = requests.post(
-            f"{self.base_url}/api/embeddings",
-            json={"model": self.model, "prompt": text}
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
+        return self.embed_batch([text])[0]
 
     def embed_batch(self, texts: list[str]) -> list[list[float]]:
-        """Genere les embeddings de plusieurs textes"""
-        embeddings = []
-        for text in texts:
-            embedding = self.embed(text)
-            embeddings.append(embedding)
+        """
+        Genere les embeddings de plusieurs textes.
+
+        Les textes deja en cache ne sont pas renvoyes a Ollama. Les autres sont
+        envoyes par lots de `embedding_batch_size`, avec au plus
+        `embedding_concurrency` lots en vol. L'ordre du resultat suit celui de `texts`.
+        """
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        embeddings = self.cache.get_many(texts)
+        # Dedoublonner les textes manquants (un meme chunk peut apparaitre plusieurs fois)
+        missing = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+        if missing:
+            computed = self._embed_uncached(missing)
+            self.cache.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            embeddings = [
+                embedding if embedding is not None else by_text[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
         return embeddings
-    
 
+    def _embed_uncached(self, texts: list[str]) -> list[list[float]]:
+        """Appels Ollama par lots, en parallele"""
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) <= 1:
+            return [e for batch in batches for e in self._embed_request(batch)]
+
+        # map() conserve l'ordre des lots quel que soit l'ordre de completion
+        results = self._executor.map(self._embed_request, batches)
+        return [embedding for batch in results for embedding in batch]
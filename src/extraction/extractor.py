@@ -1,15 +1,40 @@
 # extracts the text from the documents (.pdf, .docx, .txt)
 
-import fitz #pymupdf
-from docx import Document
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator
+from config.settings import settings
+
+#size (in characters) of the sections yielded for .docx and .txt files
+SECTION_SIZE = 64 * 1024
+
+
+def _extract_pdf_pages(file_path:str, start:int, stop:int)-> list[str]:
+    #runs in a worker process: text of the pages [start, stop)
+    import fitz #pymupdf
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
 
 class TextExtractor:
 
+    def __init__(self, workers:int=None):
+        #process pool for big pdf, created on first use
+        self.workers = settings.extraction_workers if workers is None else workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
     def extract(self, file_path:str)-> str:
         #extract the text from a file with respect to its extension
-        path = Path(file_path)
-        extension = path.suffix.lower()
+        return "".join(self.extract_pages(file_path))
+
+    def extract_pages(self, file_path:str)-> Iterator[str]:
+        #yields the text page by page (pdf) or section by section (docx, txt),
+        #so the next stages can start before the end; "".join(...) == extract()
+        extension = Path(file_path).suffix.lower()
 
         if extension == ".pdf":
             return self._extract_pdf(file_path)
@@ -19,24 +44,72 @@ class TextExtractor:
             return self._extract_txt(file_path)
         else:
             raise ValueError(f"Formant not supported {extension}")
-        
-    def _extract_pdf(self, file_path:str)->str:
-        #extract text from a .pdf file
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc:
-            text +=page.get_text()
-        doc.close()
-        return text
-
-    def _extract_docx(self, file_path:str)->str:
-        doc=Document(file_path)
-        text="" 
+
+    def _extract_pdf(self, file_path:str)-> Iterator[str]:
+        #extract text from a .pdf file, across the process pool if it is big
+        #pymupdf and python-docx are imported on first use (slow imports, not needed at startup)
+        import fitz #pymupdf
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+            if self.workers <= 1 or page_count < settings.extraction_parallel_min_pages:
+                for page in doc:
+                    yield page.get_text()
+                return
+
+        yield from self._extract_pdf_parallel(file_path, page_count)
+
+    def _extract_pdf_parallel(self, file_path:str, page_count:int)-> Iterator[str]:
+        #pages are extracted by batches in the pool, and yielded in order;
+        #at most extraction_max_inflight_pages pages are submitted and not yet consumed
+        step = max(1, settings.extraction_pages_per_task)
+        max_tasks = max(1, settings.extraction_max_inflight_pages // step)
+        pool = self._get_pool()
+        pending = deque()
+        try:
+            for start in range(0, page_count, step):
+                pending.append(pool.submit(_extract_pdf_pages, file_path, start, min(start + step, page_count)))
+                if len(pending) >= max_tasks:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            #consumer stopped early: don't extract the rest
+            for future in pending:
+                future.cancel()
+
+    def _extract_docx(self, file_path:str)-> Iterator[str]:
+        from docx import Document
+        doc = Document(file_path)
+        section = []
+        size = 0
         for paragraph in doc.paragraphs:
-            text+=paragraph.text+"\n"
-        return text
-    
-    def _extract_txt(self, file_path:str)->str:
+            section.append(paragraph.text + "\n")
+            size += len(section[-1])
+            if size >= SECTION_SIZE:
+                yield "".join(section)
+                section = []
+                size = 0
+        if section:
+            yield "".join(section)
+
+    def _extract_txt(self, file_path:str)-> Iterator[str]:
         with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-        
+            while block := f.read(SECTION_SIZE):
+                yield block
+
+    def _get_pool(self)-> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                #spawn: forking a process that runs threads (ingestion jobs) is not safe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def close(self):
+        #stops the process pool
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,596 @@
+# bulk ingestion: many documents or zip/tar archives in one job. Extraction and chunking
+# run across a process pool; embedding batches are shared between files.
+#
+#   python -m src.ingestion.bulk PATH [PATH ...] [--user-id USER] [--project-id PROJECT]
+#
+# PATH: a document (.pdf, .docx, .txt), a directory (walked recursively) or an archive
+# (.zip, .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz) whose members are read one at a time.
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import IO, Iterable, Iterator
+from config.settings import settings
+from src.extraction.extractor import TextExtractor
+from src.chunking.chunker import TextChunker
+from src.embedding.embedder import TextEmbedder
+from src.storage.backend import VectorStoreBackend, get_vector_store
+from src.storage.hashing import content_hash
+from src.ingestion.jobs import JobQueueFull, _prefetch
+from src.monitoring.metrics import record_bulk_job
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def archive_extension(name: str) -> str | None:
+    """Extension d'archive reconnue du nom (".tar.gz" compris), None sinon"""
+    lowered = name.lower()
+    return next((ext for ext in ARCHIVE_EXTENSIONS if lowered.endswith(ext)), None)
+
+
+def member_source(name: str, member: str) -> str:
+    """
+    Source d'un fichier d'un dossier ou d'une archive: "<nom de l'entree>/<chemin>".
+    Le chemin est normalise ("./a.txt" d'un tar et "a.txt" d'un zip donnent la meme source).
+    """
+    parts = [
+        part for part in PurePosixPath(member.replace("\\", "/")).parts
+        if part not in ("/", "..")
+    ]
+    return str(PurePosixPath(name, *parts))
+
+
+def iter_archive(path: str, name: str) -> Iterator[tuple[str, IO[bytes]]]:
+    """
+    (nom, flux) des fichiers d'une archive, un par un: un membre n'est lu
+    que lorsque le precedent a ete consomme, rien n'est decompresse a l'avance.
+    """
+    if archive_extension(name) == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+        return
+
+    # Mode flux "r|*": membres lus dans l'ordre de l'archive, sans index ni retour arriere
+    with tarfile.open(path, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member)
+
+
+# Composants d'un processus du pool, crees au premier document
+_extractor = None
+_chunker = None
+
+
+def extract_and_chunk(file_path: str, source: str) -> dict:
+    """Dans un processus du pool: pages, chunks (avec content_hash) et duree pour un document"""
+    global _extractor, _chunker
+    if _extractor is None:
+        # Pas de pool imbrique: le document est extrait dans ce processus
+        _extractor, _chunker = TextExtractor(workers=1), TextChunker()
+
+    start = time.perf_counter()
+    pages = [0]
+
+    def counted(texts: Iterable[str]) -> Iterator[str]:
+        for text in texts:
+            pages[0] += 1
+            yield text
+
+    chunks = []
+    texts = counted(_extractor.extract_pages(file_path))
+    for chunk in _chunker.iter_chunks_with_metadata(texts, source=source):
+        chunk["content_hash"] = content_hash(chunk["content"])
+        chunks.append(chunk)
+    return {"pages": pages[0], "chunks": chunks, "seconds": time.perf_counter() - start}
+
+
+@dataclass
+class _Document:
+    """Un document du lot, d'un etage du pipeline a l'autre"""
+    source: str
+    path: str
+    cleanup: bool
+    size: int = 0
+    document_hash: str | None = None
+    existing: list = field(default_factory=list)
+    chunks: list = field(default_factory=list)
+    pairs: list = field(default_factory=list)
+    error: str | None = None
+
+
+@dataclass
+class BulkIngestionJob:
+    """Etat, compteurs agreges et echecs par fichier d'une ingestion en masse"""
+    id: str
+    user_id: str | None = None
+    project_id: str | None = None
+    status: str = "queued"  # queued | running | done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    files_seen: int = 0
+    files_indexed: int = 0
+    files_unchanged: int = 0
+    files_failed: int = 0
+    files_ignored: int = 0
+    bytes_read: int = 0
+    pages_extracted: int = 0
+    chunks_embedded: int = 0
+    chunks_added: int = 0
+    chunks_reused: int = 0
+    chunks_removed: int = 0
+    failures: list = field(default_factory=list)
+    stage_timings: dict = field(default_factory=dict)
+    error: str | None = None
+    future: Future | None = field(default=None, repr=False)
+    sources: set = field(default_factory=set, repr=False)  # sources deja vues dans le lot
+    extracted_bytes: int = field(default=0, repr=False)  # membres d'archives decompresses
+    # Les etages du pipeline tournent dans des threads differents: compteurs modifies sous verrou
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def count(self, **increments: int):
+        """Ajoute increments (nom du compteur -> valeur) aux compteurs"""
+        with self.lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def add_timing(self, stage: str, seconds: float):
+        with self.lock:
+            self.stage_timings[stage] = self.stage_timings.get(stage, 0.0) + seconds
+
+    def fail_file(self, source: str, error: str, seen: bool = False):
+        """Fichier en echec; seen s'il n'a pas encore ete compte dans files_seen"""
+        with self.lock:
+            self.files_seen += int(seen)
+            self.files_failed += 1
+            self.failures.append({"filename": source, "error": error})
+
+    def claim(self, source: str) -> bool:
+        """
+        Reserve une source pour ce lot. Une source deja vue est un echec: sinon le
+        second fichier remplacerait le premier dans le meme job.
+        """
+        with self.lock:
+            duplicate = source in self.sources
+            self.sources.add(source)
+        if duplicate:
+            self.fail_file(source, "Source en double dans le lot (ignoree)", seen=True)
+        return not duplicate
+
+    def to_dict(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        def rate(value: float) -> float | None:
+            return round(value / elapsed, 2) if elapsed else None
+
+        with self.lock:
+            return {
+                "job_id": self.id,
+                "user_id": self.user_id,
+                "project_id": self.project_id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "progress": {
+                    "files_seen": self.files_seen,
+                    "files_indexed": self.files_indexed,
+                    "files_unchanged": self.files_unchanged,
+                    "files_failed": self.files_failed,
+                    "files_ignored": self.files_ignored,
+                    "bytes_read": self.bytes_read,
+                    "pages_extracted": self.pages_extracted,
+                    "chunks_embedded": self.chunks_embedded,
+                    "chunks_added": self.chunks_added,
+                    "chunks_reused": self.chunks_reused,
+                    "chunks_removed": self.chunks_removed
+                },
+                "throughput": {
+                    "files_per_s": rate(self.files_indexed + self.files_unchanged + self.files_failed),
+                    "chunks_per_s": rate(self.chunks_added + self.chunks_reused),
+                    "mb_per_s": rate(self.bytes_read / 1e6)
+                },
+                "stage_timings": {k: round(v, 4) for k, v in self.stage_timings.items()},
+                "failures": list(self.failures),
+                "error": self.error
+            }
+
+
+class BulkIngestionManager:
+    """
+    Jobs d'ingestion en masse executes en arriere-plan (bulk_max_concurrent_jobs a la fois).
+
+    Pipeline d'un job, chaque etage dans son thread, relies par des files bornees:
+    1. lecture des entrees (fichiers, dossiers, membres d'archives copies un par un
+       dans des fichiers temporaires), hash, fichiers inchanges ecartes
+    2. extraction + chunking dans bulk_workers processus, au plus
+       bulk_max_inflight_files fichiers en cours
+    3. embeddings par lots partages entre fichiers
+    4. ecriture document par document (sync_document): une transaction par fichier,
+       un fichier en echec n'annule pas les autres
+    """
+
+    def __init__(self, embedder: TextEmbedder = None, vector_store: VectorStoreBackend = None,
+                 workers: int = None):
+        self.embedder = embedder or TextEmbedder()
+        self.vector_store = vector_store or get_vector_store()
+        self.workers = max(1, settings.bulk_workers if workers is None else workers)
+        self.max_inflight = max(1, settings.bulk_max_inflight_files)
+        self.queue_size = settings.ingestion_queue_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.bulk_max_concurrent_jobs),
+            thread_name_prefix="bulk-ingestion"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: forker un processus qui fait tourner des threads n'est pas sur
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def close(self):
+        """Arrete le pool de processus"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def submit(self, inputs: list[tuple[str, str]], user_id: str = None, project_id: str = None,
+               cleanup: bool = True) -> BulkIngestionJob:
+        """
+        Met en file un lot d'entrees (chemin, nom): documents, dossiers ou archives.
+        Si cleanup, les chemins sont supprimes a la fin du job.
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if pending >= settings.ingestion_max_pending_jobs:
+                raise JobQueueFull(f"{pending} jobs deja en attente")
+            job = BulkIngestionJob(id=uuid.uuid4().hex, user_id=user_id, project_id=project_id)
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+
+        job.future = self._executor.submit(self.run, job, inputs, cleanup)
+        return job
+
+    def get(self, job_id: str) -> BulkIngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        excess = len(self._jobs) - settings.ingestion_job_history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("done", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def run(self, job: BulkIngestionJob, inputs: list[tuple[str, str]],
+            cleanup: bool = False) -> BulkIngestionJob:
+        """Execute le job dans le thread appelant (utilise tel quel par la CLI)"""
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            documents = _prefetch(self._read_inputs(job, inputs), self.queue_size)
+            extracted = _prefetch(self._extract(job, documents), self.queue_size)
+            for document in _prefetch(self._embed(job, extracted), self.queue_size):
+                self._store(job, document)
+            job.status = "done"
+            return job
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc) or exc.__class__.__name__
+            raise
+        finally:
+            job.finished_at = time.time()
+            job.add_timing("total", job.finished_at - job.started_at)
+            with job.lock:
+                record_bulk_job(job)
+            if cleanup:
+                for path, _ in inputs:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.unlink(path)
+
+    # 1. Entrees -> documents sur disque
+
+    def _read_inputs(self, job: BulkIngestionJob, inputs: list[tuple[str, str]]) -> Iterator[_Document]:
+        for path, name in inputs:
+            try:
+                if os.path.isdir(path):
+                    yield from self._read_directory(job, path, name)
+                elif archive_extension(name):
+                    for member_name, member in iter_archive(path, name):
+                        if self._extraction_limit_reached(job):
+                            # Rien de plus n'est decompresse, ni de cette archive ni des suivantes
+                            job.fail_file(name, "Limite d'octets decompresses atteinte: membres restants ignores")
+                            break
+                        document = self._spool(job, member_source(name, member_name), member)
+                        if document is not None:
+                            yield document
+                elif Path(name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                    if not job.claim(name):
+                        continue
+                    document = self._local(job, path, name)
+                    if document is not None:
+                        yield document
+                else:
+                    job.fail_file(name, f"Format non supporte (formats acceptes: {SUPPORTED_EXTENSIONS})", seen=True)
+            except Exception as exc:
+                # Archive impossible a ouvrir ou a parcourir, dossier inaccessible:
+                # les autres entrees continuent (un membre illisible est un echec de _spool)
+                job.fail_file(name, str(exc) or exc.__class__.__name__)
+
+    def _read_directory(self, job: BulkIngestionJob, directory: str, name: str) -> Iterator[_Document]:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                if Path(filename).suffix.lower() not in SUPPORTED_EXTENSIONS:
+                    job.count(files_ignored=1)
+                    continue
+                source = member_source(name, Path(os.path.relpath(path, directory)).as_posix())
+                if not job.claim(source):
+                    continue
+                document = self._local(job, path, source)
+                if document is not None:
+                    yield document
+
+    def _local(self, job: BulkIngestionJob, path: str, source: str) -> _Document | None:
+        """Document deja sur disque (lu sur place, jamais supprime)"""
+        start = time.perf_counter()
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while block := f.read(settings.upload_chunk_size):
+                digest.update(block)
+        job.add_timing("read", time.perf_counter() - start)
+        return self._accept(job, _Document(source, path, cleanup=False, size=os.path.getsize(path)),
+                            digest.hexdigest())
+
+    def _spool(self, job: BulkIngestionJob, source: str, stream: IO[bytes]) -> _Document | None:
+        """Membre d'archive copie (et hashe) dans un fichier temporaire"""
+        suffix = Path(source).suffix.lower()
+        if suffix not in SUPPORTED_EXTENSIONS:
+            job.count(files_ignored=1)
+            return None
+        if not job.claim(source):
+            return None
+        start = time.perf_counter()
+        digest = hashlib.sha256()
+        size = 0
+        error = None
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        try:
+            with tmp:
+                # La taille annoncee par l'archive n'est pas fiable: on compte ce qui est decompresse
+                while block := stream.read(settings.upload_chunk_size):
+                    size += len(block)
+                    job.count(extracted_bytes=len(block))
+                    if self._extraction_limit_reached(job):
+                        error = f"Limite de {settings.bulk_max_extracted_bytes} octets decompresses du lot atteinte"
+                        break
+                    if settings.upload_max_bytes and size > settings.upload_max_bytes:
+                        error = f"Fichier trop volumineux (max {settings.upload_max_bytes} octets)"
+                        break
+                    digest.update(block)
+                    tmp.write(block)
+        except Exception as exc:
+            # Membre illisible (CRC, donnees tronquees): echec de ce fichier, pas de l'archive
+            error = str(exc) or exc.__class__.__name__
+        job.add_timing("read", time.perf_counter() - start)
+        if error is not None:
+            os.unlink(tmp.name)
+            job.fail_file(source, error, seen=True)
+            return None
+        return self._accept(job, _Document(source, tmp.name, cleanup=True, size=size), digest.hexdigest())
+
+    def _extraction_limit_reached(self, job: BulkIngestionJob) -> bool:
+        limit = settings.bulk_max_extracted_bytes
+        return bool(limit) and job.extracted_bytes > limit
+
+    def _accept(self, job: BulkIngestionJob, document: _Document, document_hash: str) -> _Document | None:
+        """Ecarte un document identique a celui deja indexe (ni extraction ni embedding)"""
+        job.count(files_seen=1, bytes_read=document.size)
+        document.document_hash = document_hash
+        start = time.perf_counter()
+        try:
+            indexed = self.vector_store.document(
+                document.source, user_id=job.user_id, project_id=job.project_id
+            )
+            if indexed is not None and indexed["document_hash"] == document_hash:
+                job.count(files_unchanged=1, chunks_reused=indexed["chunk_count"])
+                self._discard(document)
+                return None
+            if indexed is not None:
+                document.existing = self.vector_store.document_chunks(
+                    document.source, user_id=job.user_id, project_id=job.project_id
+                )
+        except Exception:
+            self._discard(document)
+            raise
+        finally:
+            job.add_timing("hash", time.perf_counter() - start)
+        return document
+
+    def _discard(self, document: _Document):
+        if document.cleanup and os.path.exists(document.path):
+            os.unlink(document.path)
+
+    # 2. Extraction + chunking dans le pool de processus
+
+    def _extract(self, job: BulkIngestionJob, documents: Iterator[_Document]) -> Iterator[_Document]:
+        """Documents extraits et chunkes, dans l'ordre de fin de traitement"""
+        pool = self._get_pool()
+        inflight = {}
+        try:
+            for document in documents:
+                inflight[pool.submit(extract_and_chunk, document.path, document.source)] = document
+                while len(inflight) >= self.max_inflight:
+                    yield from self._completed(job, inflight)
+            while inflight:
+                yield from self._completed(job, inflight)
+        finally:
+            # Job interrompu: ne pas extraire le reste, supprimer les copies
+            for future, document in inflight.items():
+                future.cancel()
+                self._discard(document)
+
+    def _completed(self, job: BulkIngestionJob, inflight: dict) -> Iterator[_Document]:
+        done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+        for future in done:
+            document = inflight.pop(future)
+            try:
+                result = future.result()
+            except Exception as exc:
+                # Les erreurs citent la copie temporaire: nommer le fichier du lot
+                document.error = (str(exc) or exc.__class__.__name__).replace(document.path, document.source)
+            else:
+                document.chunks = result["chunks"]
+                job.count(pages_extracted=result["pages"])
+                # Temps CPU cumule dans les processus (en parallele, > temps ecoule)
+                job.add_timing("extract_chunk", result["seconds"])
+                if not document.chunks:
+                    document.error = "Aucun texte extrait du document"
+            finally:
+                self._discard(document)
+            yield document
+
+    # 3. Embeddings partages entre fichiers
+
+    def _embed(self, job: BulkIngestionJob, documents: Iterator[_Document]) -> Iterator[_Document]:
+        """
+        Regroupe les chunks a embedder de plusieurs fichiers en appels de
+        embedding_batch_size * embedding_concurrency textes; un document sort
+        quand tous ses chunks ont leur embedding (ou reprennent une ligne existante).
+        """
+        limit = settings.embedding_batch_size * max(1, settings.embedding_concurrency)
+        ready, pending = [], []
+        for document in documents:
+            if document.error is None:
+                pending.extend(self._pair(document))
+            ready.append(document)
+            if len(pending) >= limit:
+                self._embed_pending(job, ready, pending)
+                yield from ready
+                ready, pending = [], []
+        self._embed_pending(job, ready, pending)
+        yield from ready
+
+    def _pair(self, document: _Document) -> list[tuple[_Document, int]]:
+        """
+        Remplit document.pairs (chunk, None): un chunk dont le hash existe deja
+        reprend l'id de la ligne existante. Retourne (document, position) des chunks a embedder.
+        """
+        reusable = {}
+        for row in document.existing:
+            if row["content_hash"]:
+                reusable.setdefault(row["content_hash"], []).append(row["id"])
+        missing = []
+        for chunk in document.chunks:
+            ids = reusable.get(chunk["content_hash"])
+            if ids:
+                chunk["id"] = ids.pop()
+            else:
+                missing.append((document, len(document.pairs)))
+            document.pairs.append((chunk, None))
+        return missing
+
+    def _embed_pending(self, job: BulkIngestionJob, ready: list[_Document],
+                       pending: list[tuple[_Document, int]]):
+        if not pending:
+            return
+        start = time.perf_counter()
+        try:
+            vectors = self.embedder.embed_batch([
+                document.pairs[i][0]["content"] for document, i in pending
+            ])
+        except Exception as exc:
+            # Ollama en echec: seuls les fichiers de ce lot echouent
+            for document in {id(document): document for document, _ in pending}.values():
+                document.error = f"Embedding: {str(exc) or exc.__class__.__name__}"
+            return
+        finally:
+            job.add_timing("embed", time.perf_counter() - start)
+        for (document, i), vector in zip(pending, vectors):
+            document.pairs[i] = (document.pairs[i][0], vector)
+        job.count(chunks_embedded=len(pending))
+
+    # 4. Ecriture
+
+    def _store(self, job: BulkIngestionJob, document: _Document):
+        if document.error is not None:
+            job.fail_file(document.source, document.error)
+            return
+        start = time.perf_counter()
+        try:
+            stats = self.vector_store.sync_document(
+                document.source,
+                document.pairs,
+                user_id=job.user_id,
+                project_id=job.project_id,
+                document_hash=document.document_hash,
+                size_bytes=document.size
+            )
+        except Exception as exc:
+            job.fail_file(document.source, str(exc) or exc.__class__.__name__)
+            return
+        finally:
+            job.add_timing("store", time.perf_counter() - start)
+            document.chunks = document.pairs = document.existing = []
+        job.count(
+            files_indexed=1,
+            chunks_added=stats["added"],
+            chunks_reused=stats["reused"],
+            chunks_removed=stats["removed"]
+        )
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Indexe des documents, dossiers et archives zip/tar en un lot")
+    parser.add_argument("paths", nargs="+", help="Documents, dossiers ou archives")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--project-id", default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Processus d'extraction (defaut: bulk_workers)")
+    args = parser.parse_args(argv)
+
+    manager = BulkIngestionManager(workers=args.workers)
+    if settings.auto_migrate:
+        manager.vector_store.ensure_schema()
+    job = BulkIngestionJob(id=uuid.uuid4().hex, user_id=args.user_id, project_id=args.project_id)
+    try:
+        manager.run(job, [(path, os.path.basename(os.path.normpath(path))) for path in args.paths])
+    finally:
+        manager.close()
+        print(json.dumps(job.to_dict(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
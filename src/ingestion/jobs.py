@@ -0,0 +1,348 @@
+# background ingestion jobs: extraction -> chunking -> embedding -> storage, pipelined
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from config.settings import settings
+from src.extraction.extractor import TextExtractor
+from src.chunking.chunker import TextChunker
+from src.embedding.embedder import TextEmbedder
+from src.storage.backend import VectorStoreBackend, get_vector_store
+from src.storage.hashing import content_hash, file_hash
+from src.monitoring.metrics import record_ingestion_job
+
+
+class JobQueueFull(Exception):
+    """Trop de jobs en attente: l'upload doit etre retente plus tard"""
+
+
+@dataclass
+class IngestionJob:
+    """Etat et progression d'une indexation de document"""
+    id: str
+    filename: str
+    user_id: str | None = None
+    project_id: str | None = None
+    status: str = "queued"  # queued | running | done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    pages_extracted: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    chunks_reused: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    stage_timings: dict = field(default_factory=dict)
+    error: str | None = None
+    future: Future | None = field(default=None, repr=False)
+
+    def add_timing(self, stage: str, seconds: float):
+        self.stage_timings[stage] = self.stage_timings.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "user_id": self.user_id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "pages_extracted": self.pages_extracted,
+                "chunks_created": self.chunks_created,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_stored": self.chunks_stored,
+                "chunks_reused": self.chunks_reused,
+                "chunks_added": self.chunks_added,
+                "chunks_removed": self.chunks_removed
+            },
+            "stage_timings": {k: round(v, 4) for k, v in self.stage_timings.items()},
+            "error": self.error
+        }
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_DONE = object()
+
+
+def _prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    Consomme `iterable` dans un thread dedie et transmet ses elements via une
+    file bornee: l'etage amont avance pendant que l'aval travaille, sans jamais
+    avoir plus de `maxsize` elements en memoire entre les deux.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as exc:
+            put(_Failure(exc))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        # L'aval s'arrete (fin, erreur ou abandon): liberer le producteur
+        stop.set()
+
+
+class IngestionJobManager:
+    """
+    File de jobs d'indexation executes en arriere-plan.
+
+    Au plus `ingestion_max_concurrent_jobs` documents sont indexes en meme temps;
+    au-dela, les jobs attendent (dans la limite de `ingestion_max_pending_jobs`).
+    Chaque job enchaine TextExtractor -> TextChunker -> TextEmbedder -> VectorStore,
+    chaque etage dans son propre thread, relies par des files bornees.
+    """
+
+    def __init__(self, extractor: TextExtractor = None, chunker: TextChunker = None,
+                 embedder: TextEmbedder = None, vector_store: VectorStoreBackend = None):
+        self.extractor = extractor or TextExtractor()
+        self.chunker = chunker or TextChunker()
+        self.embedder = embedder or TextEmbedder()
+        self.vector_store = vector_store or get_vector_store()
+
+        self.queue_size = settings.ingestion_queue_size
+        self.max_pending = settings.ingestion_max_pending_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.ingestion_max_concurrent_jobs,
+            thread_name_prefix="ingestion"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, filename: str, user_id: str = None,
+               project_id: str = None, cleanup: bool = True) -> IngestionJob:
+        """
+        Met un fichier en file d'indexation et retourne immediatement le job.
+        Si cleanup, le fichier est supprime a la fin du job.
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job.status == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs deja en attente")
+
+            job = IngestionJob(
+                id=uuid.uuid4().hex,
+                filename=filename,
+                user_id=user_id,
+                project_id=project_id
+            )
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+
+        job.future = self._executor.submit(self._run, job, file_path, cleanup)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        """Garde un historique borne: oublie les jobs termines les plus anciens"""
+        excess = len(self._jobs) - settings.ingestion_job_history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("done", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _run(self, job: IngestionJob, file_path: str, cleanup: bool) -> IngestionJob:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            self._index(job, file_path)
+            job.status = "done"
+            return job
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc) or exc.__class__.__name__
+            raise
+        finally:
+            job.finished_at = time.time()
+            job.add_timing("total", job.finished_at - job.started_at)
+            record_ingestion_job(job)
+            if cleanup:
+                os.unlink(file_path)
+
+    @contextmanager
+    def _timed(self, job: IngestionJob, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            job.add_timing(stage, time.perf_counter() - start)
+
+    def _index(self, job: IngestionJob, file_path: str):
+        """
+        Indexation incrementale: seuls les chunks nouveaux ou modifies sont
+        embeddes et inseres; les chunks disparus de (source, user_id, project_id)
+        sont supprimes dans la meme transaction.
+        """
+        with self._timed(job, "hash"):
+            document_hash = file_hash(file_path)
+            document = self.vector_store.document(
+                job.filename, user_id=job.user_id, project_id=job.project_id
+            )
+
+        # Fichier identique a celui deja indexe: rien a extraire ni a embedder
+        if document is not None and document["document_hash"] == document_hash:
+            job.chunks_reused = job.chunks_stored = document["chunk_count"]
+            return
+
+        with self._timed(job, "hash"):
+            existing = self.vector_store.document_chunks(
+                job.filename, user_id=job.user_id, project_id=job.project_id
+            ) if document is not None else []
+
+        reusable = {}
+        for row in existing:
+            if row["content_hash"]:
+                reusable.setdefault(row["content_hash"], []).append(row["id"])
+
+        pages = _prefetch(self._extract(job, file_path), self.queue_size)
+        chunk_batches = _prefetch(self._chunk(job, pages), self.queue_size)
+        embedded = _prefetch(self._embed(job, chunk_batches, reusable), self.queue_size)
+
+        start = time.perf_counter()
+        waiting = [0.0]
+        stats = self.vector_store.sync_document(
+            job.filename,
+            self._track_stored(job, embedded, waiting),
+            user_id=job.user_id,
+            project_id=job.project_id,
+            document_hash=document_hash,
+            size_bytes=os.path.getsize(file_path)
+        )
+        # Temps propre a l'ecriture: hors attente des etages amont
+        job.add_timing("store", time.perf_counter() - start - waiting[0])
+
+        job.chunks_added = stats["added"]
+        job.chunks_reused = stats["reused"]
+        job.chunks_removed = stats["removed"]
+
+    def _extract(self, job: IngestionJob, file_path: str) -> Iterator[str]:
+        pages = self.extractor.extract_pages(file_path)
+        while True:
+            with self._timed(job, "extract"):
+                page = next(pages, None)
+            if page is None:
+                return
+            job.pages_extracted += 1
+            yield page
+
+    def _chunk(self, job: IngestionJob, pages: Iterator[str]) -> Iterator[list[dict]]:
+        """
+        Chunking en flux sur l'ensemble des pages: un paragraphe a cheval sur
+        deux pages reste entier, comme avec chunk(extract(file)).
+        """
+        batch_size = settings.embedding_batch_size
+        waiting = [0.0]
+        chunks = self.chunker.iter_chunks_with_metadata(
+            self._pull(pages, waiting), source=job.filename
+        )
+        batch = []
+        while True:
+            start, waited = time.perf_counter(), waiting[0]
+            chunk = next(chunks, None)
+            # Temps propre au chunking: hors attente de l'extraction
+            job.add_timing("chunk", time.perf_counter() - start - (waiting[0] - waited))
+            if chunk is None:
+                break
+            chunk["content_hash"] = content_hash(chunk["content"])
+            job.chunks_created += 1
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _pull(self, items: Iterator, waiting: list[float]) -> Iterator:
+        """Relaie `items` en cumulant dans waiting[0] le temps passe a les attendre"""
+        while True:
+            start = time.perf_counter()
+            item = next(items, _DONE)
+            waiting[0] += time.perf_counter() - start
+            if item is _DONE:
+                return
+            yield item
+
+    def _embed(self, job: IngestionJob, chunk_batches: Iterator[list[dict]],
+               reusable: dict[str, list[int]]) -> Iterator[list[tuple[dict, list[float] | None]]]:
+        """
+        Embedde les chunks nouveaux. Un chunk dont le hash existe deja pour ce
+        document reprend l'id de la ligne existante et n'est pas embedde (embedding None).
+        """
+        for chunks in chunk_batches:
+            new_chunks = []
+            for chunk in chunks:
+                ids = reusable.get(chunk["content_hash"])
+                if ids:
+                    chunk["id"] = ids.pop()
+                else:
+                    new_chunks.append(chunk)
+
+            embeddings = {}
+            if new_chunks:
+                with self._timed(job, "embed"):
+                    vectors = self.embedder.embed_batch([chunk["content"] for chunk in new_chunks])
+                embeddings = {id(chunk): vector for chunk, vector in zip(new_chunks, vectors)}
+                job.chunks_embedded += len(new_chunks)
+
+            yield [(chunk, embeddings.get(id(chunk))) for chunk in chunks]
+
+    def _track_stored(self, job: IngestionJob, embedded: Iterator[list],
+                      waiting: list[float]) -> Iterator[tuple[dict, list[float] | None]]:
+        while True:
+            start = time.perf_counter()
+            pairs = next(embedded, None)
+            waiting[0] += time.perf_counter() - start
+            if pairs is None:
+                break
+            yield from pairs
+            job.chunks_stored += len(pairs)
+
+        # Lever ici annule la transaction: un document vide ne supprime pas l'ancien
+        if job.chunks_stored == 0:
+            raise ValueError("Aucun texte extrait du document")
@@ -0,0 +1,194 @@
+# Prometheus metrics of the pipeline (exposed by GET /metrics)
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from config.settings import settings
+from src.storage.database import async_pool_status, pool_status
+
+# Du cache (< 1 ms) a la generation LLM (dizaines de secondes)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Duree des etages du pipeline (query: par requete, ingestion: cumul par document)",
+    ["pipeline", "stage"],
+    buckets=STAGE_BUCKETS
+)
+OLLAMA_REQUESTS = Counter(
+    "rag_ollama_requests_total",
+    "Appels HTTP a Ollama par endpoint et issue (ok, error, cancelled)",
+    ["endpoint", "outcome"]
+)
+OLLAMA_SECONDS = Histogram(
+    "rag_ollama_request_duration_seconds",
+    "Duree des appels HTTP a Ollama",
+    ["endpoint"],
+    buckets=STAGE_BUCKETS
+)
+INGESTION_JOBS = Counter(
+    "rag_ingestion_jobs_total",
+    "Jobs d'indexation termines par statut",
+    ["status"]
+)
+CHUNKS_INDEXED = Counter(
+    "rag_chunks_indexed_total",
+    "Chunks traites par les jobs d'indexation (added, reused, removed)",
+    ["operation"]
+)
+BULK_FILES = Counter(
+    "rag_bulk_files_total",
+    "Fichiers des ingestions en masse par issue (indexed, unchanged, failed, ignored)",
+    ["outcome"]
+)
+
+# Temps par etage de la requete en cours (None hors de collect_timings)
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage_timer(pipeline: str, stage: str) -> Iterator[None]:
+    """Mesure un bloc dans l'histogramme et dans le detail de la requete en cours"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def collect_timings() -> Iterator[dict]:
+    """
+    Detail par etage des stage_timer executes dans le bloc (meme thread ou
+    contexte copie), plus "total". Les threads de pools ne sont pas suivis.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] = time.perf_counter() - start
+        _request_timings.reset(token)
+
+
+def observe_stage(pipeline: str, stage: str, seconds: float):
+    STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+
+
+@contextmanager
+def ollama_request(endpoint: str) -> Iterator[None]:
+    """Compte un appel a Ollama et son issue; une exception est remontee telle quelle"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except (GeneratorExit, asyncio.CancelledError):
+        # Flux abandonne ou requete annulee (client deconnecte)
+        outcome = "cancelled"
+        raise
+    finally:
+        OLLAMA_REQUESTS.labels(endpoint, outcome).inc()
+        OLLAMA_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+
+
+def record_ingestion_job(job):
+    """Temps par etage cumules sur le document, statut et chunks d'un job termine"""
+    INGESTION_JOBS.labels(job.status).inc()
+    for stage, seconds in job.stage_timings.items():
+        observe_stage("ingestion", stage, seconds)
+    if job.status == "done":
+        CHUNKS_INDEXED.labels("added").inc(job.chunks_added)
+        CHUNKS_INDEXED.labels("reused").inc(job.chunks_reused)
+        CHUNKS_INDEXED.labels("removed").inc(job.chunks_removed)
+
+
+def record_bulk_job(job):
+    """Fichiers par issue, chunks et temps par etage cumules d'une ingestion en masse terminee"""
+    for outcome in ("indexed", "unchanged", "failed", "ignored"):
+        BULK_FILES.labels(outcome).inc(getattr(job, f"files_{outcome}"))
+    for stage, seconds in job.stage_timings.items():
+        observe_stage("bulk", stage, seconds)
+    CHUNKS_INDEXED.labels("added").inc(job.chunks_added)
+    CHUNKS_INDEXED.labels("reused").inc(job.chunks_reused)
+    CHUNKS_INDEXED.labels("removed").inc(job.chunks_removed)
+
+
+class _ComponentsCollector:
+    """Pool de connexions et caches, lus au moment du scrape"""
+
+    def __init__(self):
+        self.embedding_cache = None
+        self.answer_cache = None
+
+    def collect(self):
+        if settings.vector_backend == "postgres":
+            connections = GaugeMetricFamily(
+                "rag_db_pool_connections", "Connexions des pools SQLAlchemy", labels=["pool", "state"]
+            )
+            # sync: ingestion et ecritures; async: requetes des endpoints
+            for name, pool in (("sync", pool_status()), ("async", async_pool_status())):
+                for state in ("checked_out", "checked_in", "overflow", "capacity"):
+                    connections.add_metric([name, state], pool[state])
+            yield connections
+
+        if self.embedding_cache is not None:
+            stats = self.embedding_cache.stats()
+            lookups = CounterMetricFamily(
+                "rag_embedding_cache_lookups", "Recherches dans le cache d'embeddings", labels=["result"]
+            )
+            lookups.add_metric(["memory_hit"], stats["memory_hits"])
+            lookups.add_metric(["disk_hit"], stats["disk_hits"])
+            lookups.add_metric(["miss"], stats["misses"])
+            yield lookups
+            yield GaugeMetricFamily(
+                "rag_embedding_cache_hit_ratio", "Taux de hit du cache d'embeddings", value=stats["hit_rate"]
+            )
+            entries = GaugeMetricFamily(
+                "rag_embedding_cache_entries", "Entrees du cache d'embeddings", labels=["tier"]
+            )
+            entries.add_metric(["memory"], stats["memory_entries"])
+            entries.add_metric(["disk"], stats["disk_entries"])
+            yield entries
+
+        if self.answer_cache is not None:
+            stats = self.answer_cache.stats()
+            lookups = CounterMetricFamily(
+                "rag_answer_cache_lookups", "Recherches dans le cache de reponses", labels=["result"]
+            )
+            lookups.add_metric(["hit"], stats["hits"])
+            lookups.add_metric(["miss"], stats["misses"])
+            yield lookups
+            yield GaugeMetricFamily(
+                "rag_answer_cache_hit_ratio", "Taux de hit du cache de reponses", value=stats["hit_rate"]
+            )
+            yield GaugeMetricFamily(
+                "rag_answer_cache_entries", "Entrees du cache de reponses", value=stats["entries"]
+            )
+
+
+_components = _ComponentsCollector()
+REGISTRY.register(_components)
+
+
+def watch(embedding_cache=None, answer_cache=None):
+    """Expose les compteurs des caches des composants de l'application"""
+    if embedding_cache is not None:
+        _components.embedding_cache = embedding_cache
+    if answer_cache is not None:
+        _components.answer_cache = answer_cache
+
+
+def render() -> tuple[bytes, str]:
+    """Corps et content-type de la reponse /metrics"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,150 @@
+# semantic answer cache: reuse an answer when a close enough question was already asked
+
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config.settings import settings
+
+
+class AnswerCache:
+    """
+    Cache des reponses RAG par tenant (user_id, project_id) et par options de
+    recherche (top_k, mode...): deux requetes aux options differentes ne
+    partagent pas leurs reponses.
+
+    Une question dont l'embedding a une similarite cosinus >= `similarity`
+    avec une question deja en cache du meme tenant reutilise sa reponse.
+    Eviction LRU au-dela de `max_entries` et expiration apres `ttl` secondes.
+
+    `invalidate(user_id, project_id)` est branche sur les modifications du
+    VectorStore: une reponse ne survit pas a un changement des documents
+    qu'elle a pu consulter. Les ecritures des autres processus (workers,
+    CLI d'ingestion) sont couvertes par `data_version`: chaque reponse est
+    stockee avec la version des donnees lue avant sa recherche, et n'est plus
+    servie quand la version passee a lookup() est differente.
+    """
+
+    def __init__(self, similarity: float = None, ttl: float = None, max_entries: int = None):
+        self.similarity = settings.answer_cache_similarity if similarity is None else similarity
+        self.ttl = settings.answer_cache_ttl if ttl is None else ttl
+        self.max_entries = settings.answer_cache_max_entries if max_entries is None else max_entries
+
+        self._entries = OrderedDict()  # id -> (tenant, vecteur normalise, resultat, expiration, data_version)
+        self._by_tenant = {}  # tenant -> {"ids": [...], "matrix": np.ndarray | None}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        """Change a chaque invalidation: a relever avant de calculer une reponse"""
+        return self._version
+
+    def lookup(self, query_embedding: list[float], user_id: str = None,
+               project_id: str = None, options: tuple = (), data_version: int = None) -> dict | None:
+        """
+        Retourne la reponse d'une question proche deja en cache, sinon None.
+        Avec `data_version`, les reponses d'une autre version des donnees sont supprimees.
+        """
+        tenant = (user_id, project_id, options)
+        query = self._normalize(query_embedding)
+        now = time.time()
+
+        with self._lock:
+            bucket = self._by_tenant.get(tenant)
+            if bucket is not None:
+                self._drop_stale(bucket, now, data_version)
+            if not bucket or not bucket["ids"]:
+                self.misses += 1
+                return None
+
+            if bucket["matrix"] is None:
+                bucket["matrix"] = np.vstack([self._entries[i][1] for i in bucket["ids"]])
+            similarities = bucket["matrix"] @ query
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.similarity:
+                self.misses += 1
+                return None
+
+            entry_id = bucket["ids"][best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id][2]
+
+    def store(self, query_embedding: list[float], result: dict, user_id: str = None,
+              project_id: str = None, options: tuple = (), version: int = None,
+              data_version: int = None):
+        """
+        Met une reponse en cache. Si `version` ne correspond plus (documents
+        modifies pendant la generation), la reponse est ignoree. `data_version`
+        est la version des donnees relevee avant la recherche.
+        """
+        tenant = (user_id, project_id, options)
+        vector = self._normalize(query_embedding)
+
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (tenant, vector, result, time.time() + self.ttl, data_version)
+            bucket = self._by_tenant.setdefault(tenant, {"ids": [], "matrix": None})
+            bucket["ids"].append(entry_id)
+            bucket["matrix"] = None
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, user_id: str = None, project_id: str = None):
+        """
+        Supprime les reponses qui ont pu lire des documents du tenant modifie.
+        None = tous: clear() sans filtre vide tout le cache, et une reponse
+        calculee sans filtre projet est invalidee par n'importe quel projet.
+        """
+        with self._lock:
+            self._version += 1
+            for tenant in list(self._by_tenant):
+                cached_user, cached_project, _ = tenant
+                if user_id is not None and cached_user is not None and cached_user != user_id:
+                    continue
+                if project_id is not None and cached_project is not None and cached_project != project_id:
+                    continue
+                for entry_id in list(self._by_tenant[tenant]["ids"]):
+                    self._remove(entry_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries)
+            }
+
+    def _normalize(self, embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop_stale(self, bucket: dict, now: float, data_version: int = None):
+        for entry_id in [
+            i for i in bucket["ids"]
+            if self._entries[i][3] <= now
+            or (data_version is not None and self._entries[i][4] != data_version)
+        ]:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        tenant = self._entries.pop(entry_id)[0]
+        bucket = self._by_tenant[tenant]
+        bucket["ids"].remove(entry_id)
+        bucket["matrix"] = None
+        if not bucket["ids"]:
+            del self._by_tenant[tenant]
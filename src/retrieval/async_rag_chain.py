@@ -0,0 +1,279 @@
+# RAG pipeline on asyncio: embed -> search -> generate without holding a thread
+
+import asyncio
+import json
+from typing import AsyncIterator
+import httpx
+from config.settings import settings
+from src.embedding.async_embedder import AsyncTextEmbedder
+from src.storage.async_vector_store import AsyncVectorStore, ThreadedAsyncVectorStore
+from src.retrieval.rag_chain import NO_CONTEXT_ANSWER, RAGChain
+from src.monitoring.metrics import ollama_request, stage_timer
+
+
+class AsyncRAGChain:
+    """
+    Version asyncio de RAGChain, pour les endpoints. Les appels a Ollama et a
+    Postgres sont des coroutines: une requete en attente de generation ne
+    bloque aucun thread, et l'annulation de la tache (client deconnecte)
+    ferme la connexion a Ollama, ce qui interrompt la generation.
+
+    Le cache de reponses, le reranker, l'assembleur et les etapes sans I/O
+    sont ceux du RAGChain (cache partage et invalide par les ecritures de
+    l'ingestion). Le reranking, calcul CPU, passe par un thread.
+    """
+
+    def __init__(self, chain: RAGChain, embedder: AsyncTextEmbedder,
+                 vector_store: AsyncVectorStore | ThreadedAsyncVectorStore,
+                 client: httpx.AsyncClient = None):
+        self.chain = chain
+        self.embedder = embedder
+        self.vector_store = vector_store
+        # Pool HTTP partage avec l'embedder par defaut
+        self.client = client or embedder.client
+        self.model = settings.llm_model
+        # Limite globale des generations lancees par query_batch
+        self._batch_semaphore = asyncio.Semaphore(settings.query_batch_concurrency)
+
+    @property
+    def reranker(self):
+        return self.chain.reranker
+
+    @property
+    def answer_cache(self):
+        return self.chain.answer_cache
+
+    async def retrieve(self, query: str, top_k: int = None,
+                       user_id: str = None, project_id: str = None,
+                       query_embedding: list[float] = None,
+                       search_mode: str = None) -> list[dict]:
+        """Voir RAGChain.retrieve"""
+        if query_embedding is None:
+            with stage_timer("query", "embed"):
+                query_embedding = await self.embedder.embed(query)
+
+        final_k, fetch_k = self.chain.search_k(top_k)
+        with stage_timer("query", "search"):
+            candidates = await self.vector_store.search(
+                query_embedding,
+                fetch_k,
+                user_id=user_id,
+                project_id=project_id,
+                query_text=query,
+                mode=search_mode,
+                with_embeddings=self.chain.with_embeddings
+            )
+        if self.reranker is None:
+            return candidates
+        with stage_timer("query", "rerank"):
+            return await asyncio.to_thread(self.reranker.rerank, query, candidates, top_k=final_k)
+
+    async def _data_version(self, user_id: str, project_id: str) -> int | None:
+        """Voir RAGChain.data_version (lue par le driver async)"""
+        if self.answer_cache is None:
+            return None
+        return await self.vector_store.data_version(user_id, project_id)
+
+    async def warmup(self):
+        """Charge le LLM dans Ollama: une requete sans prompt ne fait que le charger"""
+        with ollama_request("load"):
+            response = await self.client.post("/api/generate", json={
+                "model": self.model,
+                "stream": False,
+                "keep_alive": settings.ollama_keep_alive or None
+            })
+            response.raise_for_status()
+
+    async def generate(self, query: str, context: list[dict]) -> str:
+        """Genere une reponse basee sur le contexte recupere"""
+        with ollama_request("generate"):
+            response = await self.client.post(
+                "/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": self.chain.build_prompt(query, context),
+                    "stream": False,
+                    "keep_alive": settings.ollama_keep_alive or None
+                }
+            )
+            response.raise_for_status()
+            return response.json()["response"]
+
+    async def generate_stream(self, query: str, context: list[dict]) -> AsyncIterator[str]:
+        """Genere la reponse token par token (streaming Ollama)"""
+        with ollama_request("generate_stream"):
+            async with self.client.stream(
+                "POST",
+                "/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": self.chain.build_prompt(query, context),
+                    "stream": True,
+                    "keep_alive": settings.ollama_keep_alive or None
+                }
+            ) as response:
+                response.raise_for_status()
+                # Ollama envoie une ligne JSON par fragment, la derniere a "done": true
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(data["error"])
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        return
+
+    async def query(self, question: str, top_k: int = None,
+                    user_id: str = None, project_id: str = None,
+                    search_mode: str = None) -> dict:
+        """Pipeline RAG complet: recuperation + generation"""
+        with stage_timer("query", "embed"):
+            query_embedding = await self.embedder.embed(question)
+        options = (top_k, search_mode or settings.search_mode)
+
+        with stage_timer("query", "answer_cache"):
+            cached, cache_version = self.chain.cached_answer(
+                query_embedding, options, user_id, project_id,
+                await self._data_version(user_id, project_id)
+            )
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        context = await self.retrieve(
+            question,
+            top_k,
+            user_id=user_id,
+            project_id=project_id,
+            query_embedding=query_embedding,
+            search_mode=search_mode
+        )
+
+        result = await self._answer(question, context)
+        self.chain.store_answer(query_embedding, result, options, user_id, project_id, cache_version)
+        return {**result, "cached": False}
+
+    async def _answer(self, question: str, context: list[dict], pipeline: str = "query") -> dict:
+        """Genere la reponse a partir du contexte recupere"""
+        if not context:
+            return self.chain.answer_result(NO_CONTEXT_ANSWER, [], 0)
+
+        context, tokens_saved = self.chain.assemble(context, pipeline)
+        with stage_timer(pipeline, "generate"):
+            answer = await self.generate(question, context)
+        return self.chain.answer_result(answer, context, tokens_saved)
+
+    async def query_batch(self, questions: list[str], top_k: int = None,
+                          user_id: str = None, project_id: str = None,
+                          search_mode: str = None) -> list[dict]:
+        """Voir RAGChain.query_batch"""
+        if not questions:
+            return []
+        with stage_timer("query_batch", "embed"):
+            query_embeddings = await self.embedder.embed_batch(questions)
+        options = (top_k, search_mode or settings.search_mode)
+
+        results = [None] * len(questions)
+        pending = {}  # question -> positions; une question repetee n'est traitee qu'une fois
+        cache_version = None
+        data_version = await self._data_version(user_id, project_id)
+        for i, query_embedding in enumerate(query_embeddings):
+            # Toutes les versions sont relevees avant la recherche: la derniere vaut pour le lot
+            cached, cache_version = self.chain.cached_answer(
+                query_embedding, options, user_id, project_id, data_version
+            )
+            if cached is not None:
+                results[i] = {**cached, "cached": True}
+            else:
+                pending.setdefault(questions[i], []).append(i)
+        if not pending:
+            return results
+
+        final_k, fetch_k = self.chain.search_k(top_k)
+        with stage_timer("query_batch", "search"):
+            candidates = await self.vector_store.search_batch(
+                [query_embeddings[positions[0]] for positions in pending.values()],
+                fetch_k,
+                user_id=user_id,
+                project_id=project_id,
+                query_texts=list(pending),
+                mode=search_mode,
+                with_embeddings=self.chain.with_embeddings
+            )
+        answers = await asyncio.gather(
+            *(
+                self._answer_batch_item(question, context, final_k)
+                for question, context in zip(pending, candidates)
+            ),
+            return_exceptions=True
+        )
+
+        for positions, answer in zip(pending.values(), answers):
+            if isinstance(answer, asyncio.CancelledError):
+                raise answer
+            if isinstance(answer, Exception):
+                result = {"error": str(answer) or answer.__class__.__name__}
+            else:
+                result = {**answer, "cached": False}
+                self.chain.store_answer(
+                    query_embeddings[positions[0]], result, options,
+                    user_id, project_id, cache_version
+                )
+            for i in positions:
+                results[i] = result
+        return results
+
+    async def _answer_batch_item(self, question: str, candidates: list[dict], final_k: int) -> dict:
+        async with self._batch_semaphore:
+            if self.reranker is not None:
+                with stage_timer("query_batch", "rerank"):
+                    candidates = await asyncio.to_thread(
+                        self.reranker.rerank, question, candidates, top_k=final_k
+                    )
+            return await self._answer(question, candidates, pipeline="query_batch")
+
+    async def query_stream(self, question: str, top_k: int = None,
+                           user_id: str = None, project_id: str = None,
+                           search_mode: str = None) -> AsyncIterator[dict]:
+        """Voir RAGChain.query_stream"""
+        with stage_timer("query", "embed"):
+            query_embedding = await self.embedder.embed(question)
+        options = (top_k, search_mode or settings.search_mode)
+
+        with stage_timer("query", "answer_cache"):
+            cached, cache_version = self.chain.cached_answer(
+                query_embedding, options, user_id, project_id,
+                await self._data_version(user_id, project_id)
+            )
+        if cached is not None:
+            for event in self.chain.cached_events(cached):
+                yield event
+            return
+
+        context = await self.retrieve(
+            question,
+            top_k,
+            user_id=user_id,
+            project_id=project_id,
+            query_embedding=query_embedding,
+            search_mode=search_mode
+        )
+        context, tokens_saved = self.chain.assemble(context)
+        sources = self.chain.sources(context)
+        yield {"type": "sources", "sources": sources}
+
+        if not context:
+            answer = NO_CONTEXT_ANSWER
+            yield {"type": "token", "content": answer}
+        else:
+            tokens = []
+            with stage_timer("query", "generate"):
+                async for token in self.generate_stream(question, context):
+                    tokens.append(token)
+                    yield {"type": "token", "content": token}
+            answer = "".join(tokens)
+
+        result = self.chain.answer_result(answer, context, tokens_saved)
+        self.chain.store_answer(query_embedding, result, options, user_id, project_id, cache_version)
+        yield {"type": "done", "cached": False, "tokens_saved": tokens_saved}
@@ -0,0 +1,77 @@
+# micro-batching of cross-encoder calls across concurrent requests
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+
+class RerankBatcher:
+    """
+    Regroupe les paires (query, passage) de requetes concurrentes en un seul
+    appel au modele.
+
+    Le premier appel ouvre une fenetre de `window_ms`; les paires arrivees
+    pendant la fenetre (jusqu'a `max_batch_size`) partent dans le meme
+    predict(), et chaque appelant recupere ses propres scores.
+    """
+
+    def __init__(self, score_fn: Callable[[list[tuple[str, str]]], Sequence[float]],
+                 window_ms: float, max_batch_size: int):
+        self.score_fn = score_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._requests = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        """Bloque jusqu'a ce que le lot contenant ces paires soit score"""
+        if not pairs:
+            return []
+        self._ensure_worker()
+        future = Future()
+        self._requests.put((pairs, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="rerank-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.window
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            self._run(batch)
+
+    def _run(self, batch: list[tuple[list, Future]]):
+        all_pairs = [pair for pairs, _ in batch for pair in pairs]
+        try:
+            scores = [float(score) for score in self.score_fn(all_pairs)]
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        offset = 0
+        for pairs, future in batch:
+            future.set_result(scores[offset:offset + len(pairs)])
+            offset += len(pairs)
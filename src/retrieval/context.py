@@ -0,0 +1,133 @@
+# context assembly: adjacent chunks merged without their overlap, MMR diversity, token budget
+
+import math
+import numpy as np
+from config.settings import settings
+
+
+def estimate_tokens(text: str) -> int:
+    """Nombre de tokens estime (le tokenizer du LLM n'est pas disponible cote API)"""
+    return math.ceil(len(text) / settings.context_chars_per_token)
+
+
+def overlap_length(previous: str, following: str, max_overlap: int, min_overlap: int = 4) -> int:
+    """
+    Longueur du debut de `following` qui repete la fin de `previous` (l'overlap
+    ajoute par TextChunker), arretee en fin de mot: avant un blanc ou une
+    ponctuation (le splitter classique garde le ". " en tete du chunk suivant).
+    En dessous de min_overlap caracteres, une repetition peut etre fortuite
+    ("un" en fin de chunk et en debut du suivant): elle est gardee. 0 sinon.
+    """
+    for k in range(min(max_overlap, len(previous), len(following)), min_overlap - 1, -1):
+        word_end = (
+            k == len(following)
+            or not (following[k - 1].isalnum() and following[k].isalnum())
+        )
+        if word_end and previous.endswith(following[:k]):
+            return k
+    return 0
+
+
+class ContextAssembler:
+    """
+    Construit le contexte du prompt a partir des chunks recuperes:
+
+    1. ordre de selection MMR: pertinence (rerank_score ou score) penalisee par
+       la similarite cosinus aux chunks deja choisis (embeddings des candidats)
+    2. selection tant que le contexte tient dans token_budget (le premier
+       chunk est toujours garde)
+    3. les chunks consecutifs d'une meme source (chunk_index) sont fusionnes
+       en un bloc, sans le texte repete par l'overlap
+    4. blocs tries par (source, chunk_index): un meme ensemble de chunks donne
+       toujours le meme prompt, ce qui favorise la reutilisation du cache d'Ollama
+    """
+
+    def __init__(self, token_budget: int = None, mmr_lambda: float = None, max_overlap: int = None):
+        self.token_budget = settings.context_token_budget if token_budget is None else token_budget
+        self.mmr_lambda = settings.context_mmr_lambda if mmr_lambda is None else mmr_lambda
+        # L'overlap du splitter classique peut depasser chunk_overlap de quelques caracteres
+        self.max_overlap = 2 * settings.chunk_overlap if max_overlap is None else max_overlap
+
+    @property
+    def needs_embeddings(self) -> bool:
+        return self.mmr_lambda < 1
+
+    def assemble(self, chunks: list[dict]) -> dict:
+        """
+        Retourne {"context": blocs, "tokens": tokens du contexte, "tokens_saved":
+        tokens des chunks bruts - tokens du contexte}. Un bloc a content, source,
+        chunk_indexes et score (le meilleur de ses chunks).
+        """
+        if not chunks:
+            return {"context": [], "tokens": 0, "tokens_saved": 0}
+
+        selected, blocks, tokens = [], [], 0
+        for i in self._mmr_order(chunks):
+            candidate_blocks = self._merge(selected + [chunks[i]])
+            candidate_tokens = sum(estimate_tokens(block["content"]) for block in candidate_blocks)
+            if selected and self.token_budget and candidate_tokens > self.token_budget:
+                continue
+            selected.append(chunks[i])
+            blocks, tokens = candidate_blocks, candidate_tokens
+
+        raw_tokens = sum(estimate_tokens(chunk["content"]) for chunk in chunks)
+        return {"context": blocks, "tokens": tokens, "tokens_saved": raw_tokens - tokens}
+
+    def _mmr_order(self, chunks: list[dict]) -> list[int]:
+        """Indices des chunks dans l'ordre de selection MMR"""
+        relevance = np.array(
+            [chunk.get("rerank_score", chunk.get("score", 0.0)) for chunk in chunks], dtype=np.float32
+        )
+        span = relevance.max() - relevance.min()
+        relevance = (relevance - relevance.min()) / span if span > 0 else np.ones_like(relevance)
+
+        if not self.needs_embeddings or any(chunk.get("embedding") is None for chunk in chunks):
+            return np.argsort(-relevance, kind="stable").tolist()
+
+        vectors = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+
+        order = []
+        redundancy = np.zeros(len(chunks), dtype=np.float32)  # similarite max aux chunks choisis
+        available = np.ones(len(chunks), dtype=bool)
+        for _ in range(len(chunks)):
+            scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            best = int(np.argmax(np.where(available, scores, -np.inf)))
+            order.append(best)
+            available[best] = False
+            redundancy = np.maximum(redundancy, similarity[best])
+        return order
+
+    def _merge(self, chunks: list[dict]) -> list[dict]:
+        """Blocs tries par (source, chunk_index), chunks consecutifs fusionnes"""
+        ordered = sorted(chunks, key=lambda chunk: (
+            chunk.get("source") or "",
+            chunk.get("chunk_index") is None,
+            chunk.get("chunk_index") or 0
+        ))
+        blocks = []
+        for chunk in ordered:
+            index = chunk.get("chunk_index")
+            score = chunk.get("rerank_score", chunk.get("score"))
+            last = blocks[-1] if blocks else None
+            if (
+                last is not None and index is not None
+                and last["source"] == chunk.get("source")
+                and last["chunk_indexes"][-1] is not None
+                and index - last["chunk_indexes"][-1] in (0, 1)
+            ):
+                if index != last["chunk_indexes"][-1]:  # meme chunk deux fois: ignore
+                    overlap = overlap_length(last["content"], chunk["content"], self.max_overlap)
+                    last["content"] += chunk["content"][overlap:] if overlap else "\n" + chunk["content"]
+                    last["chunk_indexes"].append(index)
+                if score is not None:
+                    last["score"] = max(last["score"], score) if last["score"] is not None else score
+                continue
+            blocks.append({
+                "content": chunk["content"],
+                "source": chunk.get("source"),
+                "chunk_indexes": [index],
+                "score": score
+            })
+        return blocks
@@ -0,0 +1,195 @@
+# ONNX Runtime backend for the cross-encoder reranker (CPU, optional int8 quantization)
+
+import json
+import statistics
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from config.settings import settings
+from src.retrieval.reranker import Reranker
+
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+class OnnxReranker(Reranker):
+    """
+    Meme API que Reranker (rerank, rerank_with_fusion, predict), mais
+    l'inference passe par onnxruntime au lieu de PyTorch.
+
+    Au premier usage, le cross-encoder est exporte en ONNX dans
+    `reranker_onnx_dir` (puis quantifie en int8 si `reranker_onnx_quantize`);
+    les demarrages suivants chargent directement le fichier exporte.
+    """
+
+    def __init__(self, model_name: str = None, onnx_dir: str = None,
+                 quantize: bool = None, num_threads: int = None):
+        super().__init__(model_name)
+        self.quantize = settings.reranker_onnx_quantize if quantize is None else quantize
+        self.num_threads = settings.reranker_onnx_threads if num_threads is None else num_threads
+        self.export_dir = Path(onnx_dir or settings.reranker_onnx_dir) / self.model_name.replace("/", "__")
+
+        self._session = None
+        self._tokenizer = None
+        self._meta = None
+        # Le RerankBatcher et les threads des requetes peuvent demander la session en meme temps
+        self._session_lock = threading.Lock()
+
+    @property
+    def model_path(self) -> Path:
+        return self.export_dir / ("model.int8.onnx" if self.quantize else "model.onnx")
+
+    def export(self) -> Path:
+        """Exporte le modele PyTorch en ONNX (et en int8) s'il ne l'est pas deja"""
+        fp32_path = self.export_dir / "model.onnx"
+        if not fp32_path.exists():
+            self._export_fp32(fp32_path)
+
+        if self.quantize and not self.model_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(str(fp32_path), str(self.model_path), weight_type=QuantType.QInt8)
+
+        return self.model_path
+
+    def _export_fp32(self, path: Path):
+        import torch
+
+        cross_encoder = self.model  # modele PyTorch (sentence_transformers.CrossEncoder)
+        tokenizer = cross_encoder.tokenizer
+        hf_model = cross_encoder.model.eval()
+
+        class LogitsOnly(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids=None):
+                return self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    token_type_ids=token_type_ids
+                ).logits
+
+        sample = tokenizer(
+            [("query", "passage")], padding=True, truncation=True, return_tensors="pt"
+        )
+        input_names = [name for name in INPUT_NAMES if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                LogitsOnly(hf_model),
+                tuple(sample[name] for name in input_names),
+                str(path),
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17
+            )
+
+        # Le tokenizer et la fonction d'activation accompagnent le modele exporte
+        tokenizer.save_pretrained(str(path.parent))
+        activation = getattr(cross_encoder, "activation_fn", None) or getattr(
+            cross_encoder, "default_activation_function", None
+        )
+        meta = {
+            "max_length": getattr(cross_encoder, "max_length", None) or tokenizer.model_max_length,
+            "sigmoid": isinstance(activation, torch.nn.Sigmoid)
+        }
+        (path.parent / "reranker_onnx.json").write_text(json.dumps(meta))
+
+    @property
+    def session(self):
+        """
+        Charge (et exporte si besoin) le modele ONNX de maniere paresseuse.
+        Un seul thread exporte et cree la session; _session est assignee en
+        dernier, apres le tokenizer et les metadonnees.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._load()
+        return self._session
+
+    def _load(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = self.export()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+
+        self._tokenizer = AutoTokenizer.from_pretrained(str(self.export_dir))
+        self._meta = json.loads((self.export_dir / "reranker_onnx.json").read_text())
+        self._session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+    def _score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        session = self.session
+        input_names = {i.name for i in session.get_inputs()}
+        scores = np.empty(len(pairs), dtype=np.float32)
+
+        # Trier par longueur limite le padding dans chaque sous-lot
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        batch_size = settings.reranker_onnx_batch_size
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            encoded = self._tokenizer(
+                [pairs[i] for i in indices],
+                padding=True,
+                truncation=True,
+                max_length=self._meta["max_length"],
+                return_tensors="np"
+            )
+            feed = {
+                name: encoded[name].astype(np.int64)
+                for name in INPUT_NAMES if name in input_names
+            }
+            logits = session.run(["logits"], feed)[0][:, 0]
+            scores[indices] = logits
+
+        if self._meta["sigmoid"]:
+            scores = 1 / (1 + np.exp(-scores))
+        return scores.tolist()
+
+
+def compare_backends(pairs: list[tuple[str, str]], model_name: str = None,
+                     quantize: bool = None, runs: int = 5) -> dict:
+    """
+    Compare le backend ONNX au backend PyTorch sur les memes paires:
+    ecart maximal des scores, accord sur le classement, latence mediane.
+    """
+    torch_reranker = Reranker(model_name)
+    onnx_reranker = OnnxReranker(model_name, quantize=quantize)
+
+    def timed(score_fn) -> tuple[list[float], float]:
+        scores = [float(s) for s in score_fn(pairs)]  # premier appel: chargement + warmup
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            score_fn(pairs)
+            durations.append(time.perf_counter() - start)
+        return scores, statistics.median(durations)
+
+    torch_scores, torch_latency = timed(torch_reranker._score)
+    onnx_scores, onnx_latency = timed(onnx_reranker._score)
+
+    torch_order = np.argsort(torch_scores)[::-1]
+    onnx_order = np.argsort(onnx_scores)[::-1]
+    return {
+        "pairs": len(pairs),
+        "quantized": onnx_reranker.quantize,
+        "max_abs_diff": float(np.max(np.abs(np.array(torch_scores) - np.array(onnx_scores)))),
+        "same_top1": bool(torch_order[0] == onnx_order[0]),
+        "same_ranking": bool((torch_order == onnx_order).all()),
+        "torch_latency_ms": torch_latency * 1000,
+        "onnx_latency_ms": onnx_latency * 1000,
+        "speedup": torch_latency / onnx_latency if onnx_latency else None
+    }
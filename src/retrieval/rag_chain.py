@@ -1,33 +1,315 @@
 # RAG Chain - pipeline complet: query -> retrieval -> generation
 
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 import requests
 from config.settings import settings
 from src.embedding.embedder import TextEmbedder
-from src.storage.vector_store import VectorStore
+from src.storage.backend import VectorStoreBackend, get_vector_store
+from src.retrieval.answer_cache import AnswerCache
+from src.retrieval.context import ContextAssembler
+from src.retrieval.reranker import Reranker, get_reranker
+from src.monitoring.metrics import ollama_request, stage_timer
+
+NO_CONTEXT_ANSWER = "Aucun document pertinent trouve pour repondre a cette question."
 
 
 class RAGChain:
+    """
+    Pipeline RAG synchrone. Les etapes sans I/O (search_k, assemble,
+    build_prompt, sources, cached_answer, store_answer) sont publiques:
+    AsyncRAGChain, la version asyncio, les reutilise avec les memes composants.
+    """
+
+    def __init__(self, embedder: TextEmbedder = None, vector_store: VectorStoreBackend = None,
+                 answer_cache: AnswerCache = None, reranker: Reranker = None,
+                 assembler: ContextAssembler = None):
+        # Composants injectables pour partager le pool HTTP et le pool de connexions
+        self.embedder = embedder or TextEmbedder()
+        self.vector_store = vector_store or get_vector_store()
+        self.reranker = reranker
+        if self.reranker is None and settings.use_reranker:
+            self.reranker = get_reranker()
 
-    def __init__(self):
-        self.embedder = TextEmbedder()
-        self.vector_store = VectorStore()
+        # Cache semantique des reponses, invalide a chaque ecriture dans le store
+        self.answer_cache = answer_cache
+        if self.answer_cache is None and settings.answer_cache_enabled:
+            self.answer_cache = AnswerCache()
+        if self.answer_cache is not None:
+            self.vector_store.add_change_listener(self.answer_cache.invalidate)
+        # Fusion / dedoublonnage / budget du contexte avant la generation
+        self.assembler = assembler
+        if self.assembler is None and settings.context_assembly_enabled:
+            self.assembler = ContextAssembler()
         self.base_url = settings.ollama_base_url
         self.model = settings.llm_model
+        # Connexions HTTP reutilisees entre les appels au LLM
+        self.session = requests.Session()
+        # Limite globale des generations lancees par query_batch
+        self._batch_executor = ThreadPoolExecutor(
+            max_workers=settings.query_batch_concurrency,
+            thread_name_prefix="rag-batch"
+        )
 
     def retrieve(self, query: str, top_k: int = None,
-                 user_id: str = None, project_id: str = None) -> list[dict]:
-        """Recherche les chunks les plus pertinents pour une question"""
-        query_embedding = self.embedder.embed(query)
-        results = self.vector_store.search(
-            query_embedding,
+                 user_id: str = None, project_id: str = None,
+                 query_embedding: list[float] = None,
+                 search_mode: str = None) -> list[dict]:
+        """
+        Recherche les chunks les plus pertinents pour une question.
+
+        search_mode: "vector", "lexical" ou "hybrid" (defaut settings.search_mode).
+        Avec le reranker: voir search_k.
+        """
+        if query_embedding is None:
+            with stage_timer("query", "embed"):
+                query_embedding = self.embedder.embed(query)
+
+        final_k, fetch_k = self.search_k(top_k)
+        with stage_timer("query", "search"):
+            candidates = self.vector_store.search(
+                query_embedding,
+                fetch_k,
+                user_id=user_id,
+                project_id=project_id,
+                query_text=query,
+                mode=search_mode,
+                with_embeddings=self.with_embeddings
+            )
+        if self.reranker is None:
+            return candidates
+        with stage_timer("query", "rerank"):
+            return self.reranker.rerank(query, candidates, top_k=final_k)
+
+    def generate(self, query: str, context: list[dict]) -> str:
+        """Genere une reponse basee sur le contexte recupere"""
+        with ollama_request("generate"):
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": self.build_prompt(query, context),
+                    "stream": False,
+                    "keep_alive": settings.ollama_keep_alive or None
+                },
+                timeout=settings.ollama_timeout
+            )
+            response.raise_for_status()
+            return response.json()["response"]
+
+    def generate_stream(self, query: str, context: list[dict]) -> Iterator[str]:
+        """Genere la reponse token par token (streaming Ollama)"""
+        with ollama_request("generate_stream"), self.session.post(
+            f"{self.base_url}/api/generate",
+            json={
+                "model": self.model,
+                "prompt": self.build_prompt(query, context),
+                "stream": True,
+                "keep_alive": settings.ollama_keep_alive or None
+            },
+            stream=True,
+            timeout=settings.ollama_timeout
+        ) as response:
+            response.raise_for_status()
+            # Ollama envoie une ligne JSON par fragment, la derniere a "done": true
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    return
+
+    def query(self, question: str, top_k: int = None,
+              user_id: str = None, project_id: str = None,
+              search_mode: str = None) -> dict:
+        """Pipeline RAG complet: recuperation + generation"""
+        with stage_timer("query", "embed"):
+            query_embedding = self.embedder.embed(question)
+        options = (top_k, search_mode or settings.search_mode)
+
+        # 0. Reponse deja calculee pour une question proche
+        with stage_timer("query", "answer_cache"):
+            cached, cache_version = self.cached_answer(
+                query_embedding, options, user_id, project_id,
+                self.data_version(user_id, project_id)
+            )
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        # 1. Recuperer les chunks pertinents
+        context = self.retrieve(
+            question,
             top_k,
             user_id=user_id,
-            project_id=project_id
+            project_id=project_id,
+            query_embedding=query_embedding,
+            search_mode=search_mode
         )
+
+        result = self._answer(question, context)
+        self.store_answer(query_embedding, result, options, user_id, project_id, cache_version)
+        return {**result, "cached": False}
+
+    def _answer(self, question: str, context: list[dict], pipeline: str = "query") -> dict:
+        """Genere la reponse a partir du contexte recupere"""
+        if not context:
+            return self.answer_result(NO_CONTEXT_ANSWER, [], 0)
+
+        # 2. Assembler le contexte puis generer la reponse
+        context, tokens_saved = self.assemble(context, pipeline)
+        with stage_timer(pipeline, "generate"):
+            answer = self.generate(question, context)
+        return self.answer_result(answer, context, tokens_saved)
+
+    def query_batch(self, questions: list[str], top_k: int = None,
+                    user_id: str = None, project_id: str = None,
+                    search_mode: str = None) -> list[dict]:
+        """
+        Pipeline RAG pour une liste de questions: un seul appel d'embedding,
+        une seule requete SQL pour toutes les recherches, puis reranking et
+        generation en parallele (au plus query_batch_concurrency a la fois).
+
+        Les resultats sont dans l'ordre des questions; une question en echec
+        donne {"error": ...} sans faire echouer les autres.
+        """
+        if not questions:
+            return []
+        with stage_timer("query_batch", "embed"):
+            query_embeddings = self.embedder.embed_batch(questions)
+        options = (top_k, search_mode or settings.search_mode)
+
+        results = [None] * len(questions)
+        pending = {}  # question -> positions; une question repetee n'est traitee qu'une fois
+        cache_version = None
+        data_version = self.data_version(user_id, project_id)
+        for i, query_embedding in enumerate(query_embeddings):
+            # Toutes les versions sont relevees avant la recherche: la derniere vaut pour le lot
+            cached, cache_version = self.cached_answer(
+                query_embedding, options, user_id, project_id, data_version
+            )
+            if cached is not None:
+                results[i] = {**cached, "cached": True}
+            else:
+                pending.setdefault(questions[i], []).append(i)
+        if not pending:
+            return results
+
+        final_k, fetch_k = self.search_k(top_k)
+        with stage_timer("query_batch", "search"):
+            candidates = self.vector_store.search_batch(
+                [query_embeddings[positions[0]] for positions in pending.values()],
+                fetch_k,
+                user_id=user_id,
+                project_id=project_id,
+                query_texts=list(pending),
+                mode=search_mode,
+                with_embeddings=self.with_embeddings
+            )
+        futures = [
+            self._batch_executor.submit(self._answer_batch_item, question, context, final_k)
+            for question, context in zip(pending, candidates)
+        ]
+
+        for positions, future in zip(pending.values(), futures):
+            try:
+                result = {**future.result(), "cached": False}
+            except Exception as exc:
+                result = {"error": str(exc) or exc.__class__.__name__}
+            else:
+                self.store_answer(
+                    query_embeddings[positions[0]], result, options,
+                    user_id, project_id, cache_version
+                )
+            for i in positions:
+                results[i] = result
         return results
 
-    def generate(self, query: str, context: list[dict]) -> str:
-        """Genere une reponse basee sur le contexte recupere"""
+    def _answer_batch_item(self, question: str, candidates: list[dict], final_k: int) -> dict:
+        # Reranking dans les threads du batch: le RerankBatcher regroupe leurs paires
+        if self.reranker is not None:
+            with stage_timer("query_batch", "rerank"):
+                candidates = self.reranker.rerank(question, candidates, top_k=final_k)
+        return self._answer(question, candidates, pipeline="query_batch")
+
+    def query_stream(self, question: str, top_k: int = None,
+                     user_id: str = None, project_id: str = None,
+                     search_mode: str = None) -> Iterator[dict]:
+        """
+        Pipeline RAG en streaming: un evenement "sources" des que la recherche
+        est terminee, puis un evenement "token" par fragment de reponse, puis "done".
+        """
+        with stage_timer("query", "embed"):
+            query_embedding = self.embedder.embed(question)
+        options = (top_k, search_mode or settings.search_mode)
+
+        with stage_timer("query", "answer_cache"):
+            cached, cache_version = self.cached_answer(
+                query_embedding, options, user_id, project_id,
+                self.data_version(user_id, project_id)
+            )
+        if cached is not None:
+            yield from self.cached_events(cached)
+            return
+
+        context = self.retrieve(
+            question,
+            top_k,
+            user_id=user_id,
+            project_id=project_id,
+            query_embedding=query_embedding,
+            search_mode=search_mode
+        )
+        context, tokens_saved = self.assemble(context)
+        sources = self.sources(context)
+        yield {"type": "sources", "sources": sources}
+
+        if not context:
+            answer = NO_CONTEXT_ANSWER
+            yield {"type": "token", "content": answer}
+        else:
+            # Inclut le temps d'envoi des tokens au client
+            tokens = []
+            with stage_timer("query", "generate"):
+                for token in self.generate_stream(question, context):
+                    tokens.append(token)
+                    yield {"type": "token", "content": token}
+            answer = "".join(tokens)
+
+        result = self.answer_result(answer, context, tokens_saved)
+        self.store_answer(query_embedding, result, options, user_id, project_id, cache_version)
+        yield {"type": "done", "cached": False, "tokens_saved": tokens_saved}
+
+    @property
+    def with_embeddings(self) -> bool:
+        """Les embeddings des candidats ne sont lus que pour la diversite MMR"""
+        return self.assembler is not None and self.assembler.needs_embeddings
+
+    def search_k(self, top_k: int = None) -> tuple[int | None, int | None]:
+        """
+        (final_k, fetch_k): nombre de chunks gardes et de candidats a recuperer.
+        Avec le reranker, top_k_results candidats sont reordonnes par le
+        cross-encoder et top_k (defaut top_k_rerank) sont gardes.
+        """
+        if self.reranker is None:
+            return top_k, top_k
+        final_k = top_k or settings.top_k_rerank
+        return final_k, max(settings.top_k_results, final_k)
+
+    def assemble(self, context: list[dict], pipeline: str = "query") -> tuple[list[dict], int]:
+        """Contexte du prompt et tokens economises par l'assemblage"""
+        if self.assembler is None or not context:
+            return context, 0
+        with stage_timer(pipeline, "assemble"):
+            assembled = self.assembler.assemble(context)
+        return assembled["context"], assembled["tokens_saved"]
+
+    def build_prompt(self, query: str, context: list[dict]) -> str:
+        """Construit le prompt RAG a partir des chunks recuperes"""
         # Construire le contexte a partir des chunks
         context_text = "\n\n---\n\n".join([
             f"Source: {chunk.get('source', 'Unknown')}\n{chunk['content']}"
@@ -35,7 +317,7 @@ class RAGChain:
         ])
 
         # Prompt pour le RAG
-        prompt = f"""Tu es un assistant qui repond aux questions en te basant uniquement sur le contexte fourni.
+        return f"""Tu es un assistant qui repond aux questions en te basant uniquement sur le contexte fourni.
 Si l'information n'est pas dans le contexte, dis-le clairement.
 Reponds de maniere concise et precise.
 
@@ -46,45 +328,55 @@ Question: {query}
 
 Reponds en te basant sur le contexte ci-dessus."""
 
-        # Appel au LLM via Ollama
-        response = requests.post(
-            f"{self.base_url}/api/generate",
-            json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        response.raise_for_status()
-
-        return response.json()["response"]
+    def sources(self, context: list[dict]) -> list[str]:
+        """Sources uniques des chunks de contexte"""
+        return list(set(chunk.get("source") for chunk in context if chunk.get("source")))
 
-    def query(self, question: str, top_k: int = None,
-              user_id: str = None, project_id: str = None) -> dict:
-        """Pipeline RAG complet: recuperation + generation"""
-        # 1. Recuperer les chunks pertinents
-        context = self.retrieve(
-            question,
-            top_k,
-            user_id=user_id,
-            project_id=project_id
-        )
+    def answer_result(self, answer: str, context: list[dict], tokens_saved: int) -> dict:
+        """Resultat d'une question, tel que mis en cache"""
+        return {
+            "answer": answer,
+            "sources": self.sources(context),
+            "context": context,
+            "tokens_saved": tokens_saved
+        }
 
-        if not context:
-            return {
-                "answer": "Aucun document pertinent trouve pour repondre a cette question.",
-                "sources": [],
-                "context": []
-            }
+    def cached_events(self, cached: dict) -> list[dict]:
+        """Evenements de query_stream pour une reponse trouvee dans le cache"""
+        return [
+            {"type": "sources", "sources": cached["sources"]},
+            {"type": "token", "content": cached["answer"]},
+            {"type": "done", "cached": True, "tokens_saved": cached.get("tokens_saved", 0)}
+        ]
 
-        # 2. Generer la reponse
-        answer = self.generate(question, context)
+    def data_version(self, user_id: str, project_id: str) -> int | None:
+        """Version partagee des donnees du tenant (ecritures des autres processus)"""
+        if self.answer_cache is None:
+            return None
+        return self.vector_store.data_version(user_id, project_id)
 
-        # 3. Extraire les sources uniques
-        sources = list(set(chunk.get("source") for chunk in context if chunk.get("source")))
+    def cached_answer(self, query_embedding: list[float], options: tuple,
+                      user_id: str, project_id: str,
+                      data_version: int = None) -> tuple[dict | None, tuple | None]:
+        """
+        Reponse en cache (ou None) et versions a repasser a store_answer.
+        data_version (VectorStoreBackend.data_version) doit etre relevee avant la recherche.
+        """
+        if self.answer_cache is None:
+            return None, None
+        version = (self.answer_cache.version, data_version)
+        cached = self.answer_cache.lookup(
+            query_embedding, user_id=user_id, project_id=project_id,
+            options=options, data_version=data_version
+        )
+        return cached, version
 
-        return {
-            "answer": answer,
-            "sources": sources,
-            "context": context
-        }
+    def store_answer(self, query_embedding: list[float], result: dict, options: tuple,
+                     user_id: str, project_id: str, version: tuple | None):
+        if self.answer_cache is None:
+            return
+        cache_version, data_version = version
+        self.answer_cache.store(
+            query_embedding, result, user_id=user_id, project_id=project_id,
+            options=options, version=cache_version, data_version=data_version
+        )
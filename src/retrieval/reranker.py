@@ -1,7 +1,7 @@
 # Reranker cross-encoder pour améliorer la pertinence des résultats RAG
 
-from sentence_transformers import CrossEncoder
 from config.settings import settings
+from src.retrieval.batcher import RerankBatcher
 
 
 class Reranker:
@@ -24,13 +24,37 @@ class Reranker:
         )
         self._model = None  # Lazy loading
 
+        # Regroupe les appels concurrents en un seul predict() (0 = desactive)
+        self._batcher = None
+        if settings.rerank_batch_window_ms > 0:
+            self._batcher = RerankBatcher(
+                self._score,
+                window_ms=settings.rerank_batch_window_ms,
+                max_batch_size=settings.rerank_max_batch_size
+            )
+
     @property
-    def model(self) -> CrossEncoder:
-        """Charge le modèle de manière paresseuse"""
+    def model(self):
+        """Charge le modèle de manière paresseuse (sentence-transformers et torch compris)"""
         if self._model is None:
+            from sentence_transformers import CrossEncoder
             self._model = CrossEncoder(self.model_name)
         return self._model
 
+    def _score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        """Appel direct au modele"""
+        return self.model.predict(pairs, batch_size=settings.rerank_max_batch_size)
+
+    def predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        """Scores de pertinence des paires (query, document), via le micro-batcher si actif"""
+        if self._batcher is not None:
+            return self._batcher.predict(pairs)
+        return [float(score) for score in self._score(pairs)]
+
+    def warmup(self):
+        """Charge le modele et execute une premiere inference (a appeler au demarrage)"""
+        self._score([("warmup", "warmup")])
+
     def rerank(
         self,
         query: str,
@@ -57,7 +81,7 @@ class Reranker:
         pairs = [(query, doc['content']) for doc in documents]
 
         # Calculer les scores de pertinence
-        scores = self.model.predict(pairs)
+        scores = self.predict(pairs)
 
         # Ajouter les scores aux documents
         for doc, score in zip(documents, scores):
@@ -102,7 +126,7 @@ class Reranker:
 
         # Calculer les scores de reranking
         pairs = [(query, doc['content']) for doc in documents]
-        rerank_scores = self.model.predict(pairs)
+        rerank_scores = self.predict(pairs)
 
         # Normaliser les scores de reranking entre 0 et 1
         min_score = min(rerank_scores)
@@ -127,3 +151,12 @@ class Reranker:
             fused = fused[:top_k]
 
         return fused
+
+
+def get_reranker() -> Reranker:
+    """Reranker du backend configure: "torch" (sentence-transformers) ou "onnx" (onnxruntime)"""
+    if settings.reranker_backend == "onnx":
+        # Import local: onnxruntime n'est requis que pour ce backend
+        from src.retrieval.onnx_reranker import OnnxReranker
+        return OnnxReranker()
+    return Reranker()
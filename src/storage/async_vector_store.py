@@ -0,0 +1,99 @@
+# read path of the vector store for the asyncio endpoints (asyncpg driver)
+
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncEngine
+from config.settings import settings
+from src.storage.backend import VectorStoreBackend
+from src.storage.database import get_async_engine
+
+
+class AsyncVectorStore:
+    """
+    Recherche de VectorStore sur l'engine asyncio: memes requetes SQL (construites
+    par le VectorStore synchrone), executees sans bloquer la boucle.
+    Les ecritures restent sur le VectorStore synchrone (jobs d'ingestion).
+    """
+
+    def __init__(self, store, engine: AsyncEngine = None):
+        self.store = store
+        self.engine = engine or get_async_engine()
+
+    async def aclose(self):
+        await self.engine.dispose()
+
+    async def search(self, query_embedding: list[float], top_k: int = None,
+                     user_id: str = None, project_id: str = None,
+                     ef_search: int = None, probes: int = None,
+                     query_text: str = None, mode: str = None,
+                     with_embeddings: bool = False) -> list[dict]:
+        """Voir VectorStore.search"""
+        if top_k is None:
+            top_k = settings.top_k_results
+
+        mode = self.store.search_mode(mode, bool(query_text))
+        statement = self.store.search_statement(
+            query_embedding, top_k, user_id, project_id, query_text, mode, with_embeddings
+        )
+        async with self.engine.begin() as conn:
+            await self._tune_search(conn, top_k, mode, ef_search, probes)
+            results = (await conn.execute(statement)).all()
+        return [self.store.hit(r, with_embeddings) for r in results]
+
+    async def search_batch(self, query_embeddings: list[list[float]], top_k: int = None,
+                           user_id: str = None, project_id: str = None,
+                           ef_search: int = None, probes: int = None,
+                           query_texts: list[str] = None, mode: str = None,
+                           with_embeddings: bool = False) -> list[list[dict]]:
+        """Voir VectorStore.search_batch"""
+        if not query_embeddings:
+            return []
+        if top_k is None:
+            top_k = settings.top_k_results
+
+        mode = self.store.search_mode(mode, query_texts is not None and all(query_texts))
+        statement = self.store.search_batch_statement(
+            query_embeddings, top_k, user_id, project_id, query_texts, mode, with_embeddings
+        )
+        results = [[] for _ in query_embeddings]
+        async with self.engine.begin() as conn:
+            await self._tune_search(conn, top_k, mode, ef_search, probes)
+            for r in (await conn.execute(statement)).all():
+                results[r.idx].append(self.store.hit(r, with_embeddings))
+        return results
+
+    async def data_version(self, user_id: str = None, project_id: str = None) -> int:
+        """Voir VectorStore.data_version"""
+        async with self.engine.connect() as conn:
+            return int((await conn.execute(self.store.data_version_statement(user_id, project_id))).scalar())
+
+    async def _tune_search(self, conn, top_k: int, mode: str, ef_search: int = None, probes: int = None):
+        tuning = self.store.search_tuning(top_k, mode, ef_search=ef_search, probes=probes)
+        if tuning is not None:
+            await conn.execute(tuning)
+
+
+class ThreadedAsyncVectorStore:
+    """Backend sans driver async (numpy): recherches synchrones dans un thread"""
+
+    def __init__(self, store: VectorStoreBackend):
+        self.store = store
+
+    async def aclose(self):
+        pass
+
+    async def search(self, query_embedding: list[float], top_k: int = None, **kwargs) -> list[dict]:
+        return await asyncio.to_thread(self.store.search, query_embedding, top_k, **kwargs)
+
+    async def search_batch(self, query_embeddings: list[list[float]], top_k: int = None,
+                           **kwargs) -> list[list[dict]]:
+        return await asyncio.to_thread(self.store.search_batch, query_embeddings, top_k, **kwargs)
+
+    async def data_version(self, user_id: str = None, project_id: str = None) -> int | None:
+        return await asyncio.to_thread(self.store.data_version, user_id, project_id)
+
+
+def get_async_vector_store(store: VectorStoreBackend) -> AsyncVectorStore | ThreadedAsyncVectorStore:
+    """Lecture async du store: asyncpg pour le backend postgres, un thread sinon"""
+    if settings.vector_backend == "postgres":
+        return AsyncVectorStore(store)
+    return ThreadedAsyncVectorStore(store)
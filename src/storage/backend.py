@@ -0,0 +1,122 @@
+# common interface of the vector store backends (pgvector, in-process NumPy)
+
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable
+from config.settings import settings
+
+VECTOR_BACKENDS = ("postgres", "numpy")
+
+
+class VectorStoreBackend(ABC):
+    """
+    Ce qu'attendent RAGChain et IngestionJobManager d'un store de chunks.
+
+    Les chunks sont isoles par (user_id, project_id); en recherche, un filtre
+    None signifie "tous". Les ecouteurs enregistres par add_change_listener
+    sont appeles apres chaque ecriture.
+    """
+
+    def __init__(self):
+        self._change_listeners = []
+
+    def add_change_listener(self, listener: Callable[[str | None, str | None], None]):
+        """Register listener(user_id, project_id), called after each committed write"""
+        self._change_listeners.append(listener)
+
+    def _notify_change(self, user_id: str = None, project_id: str = None):
+        for listener in self._change_listeners:
+            listener(user_id, project_id)
+
+    def data_version(self, user_id: str = None, project_id: str = None) -> int | None:
+        """
+        Version of the data readable with this filter, shared by all processes
+        writing to the store and changed by each write. None when the store is
+        written by a single process: the change listeners are enough.
+        """
+        return None
+
+    def ensure_schema(self):
+        """Create the storage structures if missing (idempotent); nothing to do by default"""
+
+    def close(self):
+        """Release the resources held by the store; nothing to do by default"""
+
+    @abstractmethod
+    def add_batch(self, chunks: list[dict], embeddings: list[list[float]],
+                  user_id: str = None, project_id: str = None) -> int:
+        """Add many chunks at once, returns the number of inserted rows"""
+
+    @abstractmethod
+    def search(self, query_embedding: list[float], top_k: int = None,
+               user_id: str = None, project_id: str = None,
+               ef_search: int = None, probes: int = None,
+               query_text: str = None, mode: str = None,
+               with_embeddings: bool = False) -> list[dict]:
+        """
+        top_k chunks as {"content", "source", "chunk_index", "score"}, best first
+        (plus "embedding" if with_embeddings)
+        """
+
+    def search_batch(self, query_embeddings: list[list[float]], top_k: int = None,
+                     user_id: str = None, project_id: str = None,
+                     ef_search: int = None, probes: int = None,
+                     query_texts: list[str] = None, mode: str = None,
+                     with_embeddings: bool = False) -> list[list[dict]]:
+        """search() for many queries, one result list per query in the same order"""
+        texts = query_texts if query_texts is not None else [None] * len(query_embeddings)
+        return [
+            self.search(
+                query_embedding, top_k, user_id=user_id, project_id=project_id,
+                ef_search=ef_search, probes=probes, query_text=query_text, mode=mode,
+                with_embeddings=with_embeddings
+            )
+            for query_embedding, query_text in zip(query_embeddings, texts)
+        ]
+
+    @abstractmethod
+    def document_chunks(self, source: str, user_id: str = None,
+                        project_id: str = None) -> list[dict]:
+        """id, chunk_index and content_hash of the chunks of one document"""
+
+    @abstractmethod
+    def sync_document(self, source: str, pairs: Iterable[tuple[dict, list[float] | None]],
+                      user_id: str = None, project_id: str = None,
+                      document_hash: str = None, size_bytes: int = None,
+                      batch_size: int = None) -> dict:
+        """
+        Replace the chunks of one document and record it in the catalog,
+        returns {"added", "reused", "removed"}
+        """
+
+    @abstractmethod
+    def document(self, source: str, user_id: str = None, project_id: str = None) -> dict | None:
+        """
+        Catalog entry of one document: {"id", "source", "user_id", "project_id",
+        "document_hash", "chunk_count", "size_bytes", "indexed_at"}, None if not indexed
+        """
+
+    @abstractmethod
+    def list_documents(self, user_id: str = None, project_id: str = None,
+                       limit: int = None, after: int = None) -> list[dict]:
+        """Catalog entries by increasing id, starting after the id `after`"""
+
+    @abstractmethod
+    def delete_document(self, document_id: int, user_id: str = None,
+                        project_id: str = None) -> dict | None:
+        """Delete one document and its chunks, returns its entry (None if not found)"""
+
+    @abstractmethod
+    def clear(self, user_id: str = None, project_id: str = None):
+        """Delete chunks and documents (optionally filtered by user/project)"""
+
+
+def get_vector_store() -> VectorStoreBackend:
+    """Store du backend configure: "postgres" (pgvector) ou "numpy" (en memoire + mmap)"""
+    if settings.vector_backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Backend vectoriel non supporte: {settings.vector_backend}")
+    # Imports locaux: le backend numpy ne demande ni Postgres ni pgvector
+    if settings.vector_backend == "numpy":
+        from src.storage.numpy_store import NumpyVectorStore
+        return NumpyVectorStore()
+    from src.storage.vector_store import VectorStore
+    return VectorStore()
@@ -0,0 +1,71 @@
+# binary COPY encoding for bulk inserts into PostgreSQL / pgvector
+
+import io
+import struct
+from itertools import islice
+from typing import Iterable, Iterator
+import numpy as np
+from sqlalchemy import BigInteger, Integer, String, Text
+from pgvector.sqlalchemy import Vector
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+NULL_FIELD = struct.pack("!i", -1)
+
+
+def _encode_text(value) -> bytes:
+    return str(value).encode("utf-8")
+
+
+def _encode_int4(value) -> bytes:
+    return struct.pack("!i", value)
+
+
+def _encode_int8(value) -> bytes:
+    return struct.pack("!q", value)
+
+
+def _encode_vector(value) -> bytes:
+    """Format binaire pgvector (vector_recv): dim int16, reserve int16, float32 big-endian"""
+    vector = np.asarray(value, dtype=">f4")
+    return struct.pack("!hh", vector.shape[0], 0) + vector.tobytes()
+
+
+def column_encoder(column_type):
+    """Encodeur COPY binaire correspondant au type SQLAlchemy d'une colonne"""
+    if isinstance(column_type, Vector):
+        return _encode_vector
+    if isinstance(column_type, BigInteger):
+        return _encode_int8
+    if isinstance(column_type, Integer):
+        return _encode_int4
+    if isinstance(column_type, (String, Text)):
+        return _encode_text
+    raise TypeError(f"Type de colonne non supporte par COPY binaire: {column_type!r}")
+
+
+def encode_copy_rows(rows: Iterable[tuple], encoders: list) -> bytes:
+    """Encode des lignes au format COPY ... FROM STDIN WITH (FORMAT binary)"""
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    field_count = struct.pack("!h", len(encoders))
+
+    for row in rows:
+        buffer.write(field_count)
+        for value, encode in zip(row, encoders):
+            if value is None:
+                buffer.write(NULL_FIELD)
+                continue
+            data = encode(value)
+            buffer.write(struct.pack("!i", len(data)))
+            buffer.write(data)
+
+    buffer.write(COPY_TRAILER)
+    return buffer.getvalue()
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Decoupe un iterable en listes de taille <= size sans le materialiser"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
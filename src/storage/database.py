@@ -0,0 +1,97 @@
+# shared SQLAlchemy engines (one sync and one asyncio pool per process) and per-operation sessions
+
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from config.settings import settings
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """
+    Engine partage par tous les composants du processus.
+
+    Le pool est dimensionne par Settings. Avec le pool de get_async_engine(),
+    N workers uvicorn ouvrent au plus
+    N * (db_pool_size + db_max_overflow + db_async_pool_size + db_async_max_overflow)
+    connexions: c'est ce total qui doit rester sous max_connections de Postgres.
+    """
+    if not settings.database_url:
+        raise ValueError("DATABASE_URL manquant (requis par le backend vectoriel postgres)")
+    return create_engine(
+        settings.database_url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_engine() -> AsyncEngine:
+    """
+    Engine asyncio (driver asyncpg) des requetes servies par les endpoints async,
+    meme URL que get_engine() mais son propre pool (db_async_pool_size,
+    db_async_max_overflow). db_command_timeout borne chaque requete SQL cote client.
+    """
+    if not settings.database_url:
+        raise ValueError("DATABASE_URL manquant (requis par le backend vectoriel postgres)")
+    url = make_url(settings.database_url).set(drivername="postgresql+asyncpg")
+    return create_async_engine(
+        url,
+        pool_size=settings.db_async_pool_size,
+        max_overflow=settings.db_async_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={"command_timeout": settings.db_command_timeout or None}
+    )
+
+
+@lru_cache(maxsize=None)
+def _sessionmaker(engine: Engine) -> sessionmaker:
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@contextmanager
+def session_scope(engine: Engine = None) -> Iterator[Session]:
+    """
+    Session courte pour une operation: une connexion est empruntee au pool,
+    commit en cas de succes, rollback sinon, puis rendue au pool.
+    """
+    session = _sessionmaker(engine or get_engine())()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def pool_status(engine: Engine = None) -> dict:
+    """Occupation du pool synchrone (pour dimensionner db_pool_size)"""
+    return _pool_status((engine or get_engine()).pool, settings.db_max_overflow)
+
+
+def async_pool_status(engine: AsyncEngine = None) -> dict:
+    """Occupation du pool async, celui des requetes (pour dimensionner db_async_pool_size)"""
+    return _pool_status((engine or get_async_engine()).pool, settings.db_async_max_overflow)
+
+
+def _pool_status(pool, max_overflow: int) -> dict:
+    size = pool.size()
+    return {
+        "pool_size": size,
+        "max_overflow": max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "capacity": size + max_overflow
+    }
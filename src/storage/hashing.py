@@ -0,0 +1,17 @@
+# content hashes used to detect unchanged documents and chunks
+
+import hashlib
+
+
+def content_hash(text: str) -> str:
+    """sha256 hexadecimal du texte d'un chunk"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """sha256 hexadecimal d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,111 @@
+# maintenance commands for the vector index
+#
+#   python -m src.storage.maintenance migrate
+#   python -m src.storage.maintenance index-info
+#   python -m src.storage.maintenance create-index
+#   python -m src.storage.maintenance rebuild-index [--no-concurrently]
+#   python -m src.storage.maintenance reindex [--no-concurrently]
+#   python -m src.storage.maintenance backfill-hashes
+#   python -m src.storage.maintenance partitions
+#   python -m src.storage.maintenance partition-table
+#   python -m src.storage.maintenance recall-report [--sample 100] [--top-k 10] [--rescore-factors 1,2,4,8]
+
+import argparse
+from src.storage.vector_store import VectorStore
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Maintenance de l'index vectoriel pgvector")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser(
+        "migrate",
+        help="Cree les tables, applique les migrations et cree l'index (a lancer au deploiement)"
+    )
+    subparsers.add_parser("index-info", help="Affiche la definition et la taille de l'index")
+    subparsers.add_parser("create-index", help="Cree l'index s'il n'existe pas")
+    subparsers.add_parser(
+        "backfill-hashes",
+        help="Calcule le hash des chunks indexes avant la re-indexation incrementale"
+    )
+    subparsers.add_parser("partitions", help="Liste les partitions de document_chunks")
+    subparsers.add_parser(
+        "partition-table",
+        help="Convertit document_chunks en table partitionnee selon chunk_partitioning"
+    )
+    recall = subparsers.add_parser(
+        "recall-report",
+        help="Rappel de la recherche indexee (vector_storage actuel) contre un scan exact"
+    )
+    recall.add_argument("--sample", type=int, default=100, help="Nombre de chunks pris comme questions")
+    recall.add_argument("--top-k", type=int, default=10)
+    recall.add_argument(
+        "--rescore-factors",
+        type=lambda value: [int(factor) for factor in value.split(",")],
+        default=None,
+        help="Facteurs de rescoring a comparer, ex: 1,2,4,8 (defaut: vector_rescore_factor)"
+    )
+    recall.add_argument("--user-id", default=None)
+    recall.add_argument("--project-id", default=None)
+    for name, help_text in [
+        ("rebuild-index", "Reconstruit l'index avec les parametres actuels de Settings"),
+        ("reindex", "Reconstruit l'index existant a l'identique"),
+    ]:
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument(
+            "--no-concurrently",
+            dest="concurrently",
+            action="store_false",
+            help="Bloque les ecritures pendant la construction (plus rapide)"
+        )
+
+    args = parser.parse_args(argv)
+    store = VectorStore()
+
+    if args.command == "migrate":
+        store.ensure_schema()
+        print(f"Schema a jour (partitionnement: {store.partitioning})")
+        return
+
+    if args.command == "backfill-hashes":
+        print(f"{store.backfill_hashes()} chunks mis a jour")
+        return
+
+    if args.command == "partition-table":
+        print(f"{store.partition_table()} chunks copies (partitionnement: {store.partitioning})")
+        return
+
+    if args.command == "recall-report":
+        report = store.recall_report(
+            args.sample, args.top_k, args.rescore_factors,
+            user_id=args.user_id, project_id=args.project_id
+        )
+        if not report:
+            print("Aucun chunk a echantillonner")
+        for row in report:
+            factor = "" if row["rescore_factor"] is None else f" x{row['rescore_factor']}"
+            print(f"{row['search'] + factor:<12} recall@{args.top_k}: {row['recall']:.3f}"
+                  f"\t{row['latency_ms']:.2f} ms/requete")
+        return
+
+    if args.command == "partitions":
+        for partition in store.partitions():
+            print(f"{partition['name']}\t{partition['bound']}\t~{partition['estimated_rows']} lignes")
+        return
+
+    if args.command == "create-index":
+        store.ensure_index()
+    elif args.command == "rebuild-index":
+        store.rebuild_index(concurrently=args.concurrently)
+    elif args.command == "reindex":
+        store.reindex(concurrently=args.concurrently)
+
+    info = store.index_info()
+    if info is None:
+        print("Aucun index vectoriel")
+    else:
+        print(f"{info['indexdef']}\nvalide: {info['valid']} - taille: {info['size_bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,585 @@
+# in-process vector store: one float32 NumPy matrix per tenant, persisted in memory-mapped files
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+import numpy as np
+from config.settings import settings
+from src.storage.backend import VectorStoreBackend
+from src.storage.hashing import content_hash
+
+
+class _Tenant:
+    """
+    Chunks d'un (user_id, project_id) dans un repertoire:
+      - tenant.json: cle du tenant et generation courante
+      - vectors.<gen>.f32: matrice n x dim float32 (vecteurs normalises), lue en mmap
+      - rows.<gen>.jsonl: une ligne JSON de metadonnees par ligne de la matrice
+
+    Un ajout ecrit a la fin des fichiers de la generation courante; une
+    suppression reecrit une nouvelle generation, publiee en remplacant
+    tenant.json. Les lectures travaillent sur un instantane (matrice, lignes)
+    qui n'est jamais modifie en place.
+    """
+
+    def __init__(self, directory: Path, user_id: str | None, project_id: str | None, dim: int):
+        self.directory = directory
+        self.user_id = user_id
+        self.project_id = project_id
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.generation = 0
+        self._state = None  # (matrice, lignes), charge au premier acces
+        self.dropped = False  # supprime par clear(): ne plus y ecrire
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.directory / f"vectors.{generation}.f32"
+
+    def _rows_path(self, generation: int) -> Path:
+        return self.directory / f"rows.{generation}.jsonl"
+
+    def snapshot(self) -> tuple[np.ndarray, list[dict]]:
+        state = self._state
+        if state is None:
+            with self.lock:
+                if self._state is None:
+                    self._load()
+                state = self._state
+        return state
+
+    def state(self) -> tuple[np.ndarray, list[dict]]:
+        """Comme snapshot(), a appeler sous self.lock"""
+        if self._state is None:
+            self._load()
+        return self._state
+
+    def _map(self, count: int) -> np.ndarray:
+        if count == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self._vectors_path(self.generation), dtype=np.float32,
+                         mode="r", shape=(count, self.dim))
+
+    def _load(self):
+        rows = []
+        rows_path = self._rows_path(self.generation)
+        if rows_path.exists():
+            with open(rows_path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.endswith("\n")]
+        vectors_path = self._vectors_path(self.generation)
+        stored = vectors_path.stat().st_size // (4 * self.dim) if vectors_path.exists() else 0
+
+        # Ajout interrompu: on revient au plus grand prefixe commun aux deux fichiers
+        count = min(len(rows), stored)
+        if stored > count:
+            os.truncate(vectors_path, count * 4 * self.dim)
+        if len(rows) > count:
+            rows = rows[:count]
+            self._write_rows(rows_path, rows)
+        self._state = (self._map(count), rows)
+
+    def _write_rows(self, path: Path, rows: list[dict], mode: str = "w"):
+        with open(path, mode, encoding="utf-8") as f:
+            f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def save_key(self):
+        tmp = self.directory / "tenant.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "user_id": self.user_id,
+                "project_id": self.project_id,
+                "dim": self.dim,
+                "generation": self.generation
+            }, f)
+        os.replace(tmp, self.directory / "tenant.json")
+
+    def append(self, rows: list[dict], vectors: np.ndarray):
+        """Ajoute des lignes (a appeler sous self.lock)"""
+        _, current = self.state()
+        # Vecteurs d'abord: au rechargement, des vecteurs sans metadonnees sont ignores
+        with open(self._vectors_path(self.generation), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._write_rows(self._rows_path(self.generation), rows, mode="a")
+        rows = current + rows
+        self._state = (self._map(len(rows)), rows)
+
+    def rewrite(self, rows: list[dict], vectors: np.ndarray):
+        """Remplace tout le contenu par une nouvelle generation (a appeler sous self.lock)"""
+        previous = self.generation
+        self.generation += 1
+        with open(self._vectors_path(self.generation), "wb") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._write_rows(self._rows_path(self.generation), rows)
+        self.save_key()
+        # Les instantanes en cours gardent leur mmap: le fichier supprime reste lisible
+        self._vectors_path(previous).unlink(missing_ok=True)
+        self._rows_path(previous).unlink(missing_ok=True)
+        self._state = (self._map(len(rows)), rows)
+
+
+class _Catalog:
+    """
+    Catalogue des documents de tous les tenants, journal documents.jsonl:
+    chaque ligne est l'etat complet d'un document ({"id", ..., "deleted": true}
+    pour une suppression), la derniere ligne d'un id l'emporte. Le journal est
+    relu au demarrage et compacte par ensure_schema.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = {}  # id -> document, par id croissant
+        self.keys = {}  # (user_id, project_id, source) -> id
+        self.next_id = 1
+        self.complete = False  # chunks anterieurs au catalogue deja repris
+        self.lines = 0
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        self._apply(json.loads(line))
+                        self.lines += 1
+
+    def _apply(self, record: dict):
+        if "complete" in record:
+            self.complete = record["complete"]
+            return
+        self.next_id = max(self.next_id, record["id"] + 1)
+        previous = self.entries.get(record["id"])
+        if previous is not None:
+            self.keys.pop(self.key(previous), None)
+        if record.get("deleted"):
+            self.entries.pop(record["id"], None)
+        else:
+            # Une mise a jour garde sa place: entries reste trie par id
+            self.entries[record["id"]] = record
+            self.keys[self.key(record)] = record["id"]
+
+    @staticmethod
+    def key(entry: dict) -> tuple:
+        return entry["user_id"], entry["project_id"], entry["source"]
+
+    def get(self, user_id: str | None, project_id: str | None, source: str | None) -> dict | None:
+        document_id = self.keys.get((user_id, project_id, source))
+        return self.entries.get(document_id) if document_id is not None else None
+
+    def write(self, records: list[dict]):
+        """Ajoute des lignes au journal et les applique"""
+        if not records:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        for record in records:
+            self._apply(record)
+        self.lines += len(records)
+
+    def upsert(self, user_id: str | None, project_id: str | None, source: str | None, **fields) -> dict:
+        """Etat du document apres mise a jour de fields (cree s'il n'existe pas), non ecrit"""
+        entry = self.get(user_id, project_id, source) or {
+            "id": self.next_id, "source": source, "user_id": user_id, "project_id": project_id,
+            "document_hash": None, "chunk_count": 0, "size_bytes": None
+        }
+        if entry["id"] == self.next_id:
+            self.next_id += 1
+        return {**entry, **fields, "indexed_at": datetime.now(timezone.utc).isoformat()}
+
+    def compact(self):
+        """Reecrit le journal avec une ligne par document"""
+        tmp = self.path.with_suffix(".jsonl.tmp")
+        records = [*self.entries.values(), {"complete": self.complete}]
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        os.replace(tmp, self.path)
+        self.lines = len(records)
+
+
+class NumpyVectorStore(VectorStoreBackend):
+    """
+    Store sans base de donnees, pour les petits tenants, l'embarque et les tests.
+
+    Recherche exacte par produit matrice-vecteur sur les vecteurs normalises
+    (score = similarite cosinus, comme le backend pgvector) et top-k par
+    argpartition. Seul le mode de recherche "vector" est disponible.
+    Au demarrage seules les cles des tenants et le catalogue des documents
+    sont lus; les fichiers des tenants sont mappes en memoire au premier acces.
+    Verrous: celui d'un tenant avant celui du store (tenants et catalogue).
+
+    Un seul processus par repertoire (verrou exclusif sur store.lock, pris a la
+    construction): les ajouts de plusieurs processus aux memes fichiers
+    s'entrelaceraient et les ids se repeteraient.
+    """
+
+    def __init__(self, path: str = None, dim: int = None):
+        super().__init__()
+        self.path = Path(path or settings.numpy_store_path)
+        self.dim = dim or settings.embedding_dim
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.path / "store.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(
+                f"{self.path} est deja ouvert par un autre processus "
+                f"(backend numpy mono-processus: un seul worker, pas de CLI en parallele)"
+            ) from None
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self._catalog = _Catalog(self.path / "documents.jsonl")
+        for key_file in self.path.glob("*/tenant.json"):
+            with open(key_file, encoding="utf-8") as f:
+                key = json.load(f)
+            if key["dim"] != self.dim:
+                raise ValueError(
+                    f"{key_file.parent}: vecteurs de dimension {key['dim']}, attendu {self.dim}"
+                )
+            tenant = _Tenant(key_file.parent, key["user_id"], key["project_id"], self.dim)
+            tenant.generation = key["generation"]
+            self._tenants[(tenant.user_id, tenant.project_id)] = tenant
+
+    def close(self):
+        """Libere le repertoire pour un autre processus"""
+        self._lock_file.close()
+
+    def _tenant(self, user_id: str = None, project_id: str = None, create: bool = False) -> _Tenant | None:
+        with self._lock:
+            tenant = self._tenants.get((user_id, project_id))
+            if tenant is None and create:
+                digest = hashlib.sha1(json.dumps([user_id, project_id]).encode("utf-8")).hexdigest()[:16]
+                directory = self.path / digest
+                directory.mkdir(exist_ok=True)
+                tenant = _Tenant(directory, user_id, project_id, self.dim)
+                tenant.save_key()
+                self._tenants[(user_id, project_id)] = tenant
+            return tenant
+
+    @contextmanager
+    def _locked_tenant(self, user_id: str = None, project_id: str = None, create: bool = False):
+        """
+        Tenant verrouille pour une ecriture (None s'il n'existe pas et create est faux).
+        Un tenant supprime par clear() pendant l'attente du verrou est recherche a nouveau.
+        """
+        while True:
+            tenant = self._tenant(user_id, project_id, create=create)
+            if tenant is None:
+                yield None
+                return
+            with tenant.lock:
+                if not tenant.dropped:
+                    yield tenant
+                    return
+
+    def _matching(self, user_id: str = None, project_id: str = None) -> list[_Tenant]:
+        """Tenants vus par un filtre de recherche (None = tous)"""
+        with self._lock:
+            return [
+                tenant for (tenant_user, tenant_project), tenant in self._tenants.items()
+                if (user_id is None or tenant_user == user_id)
+                and (project_id is None or tenant_project == project_id)
+            ]
+
+    def _normalize(self, embeddings) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _row(self, chunk: dict, row_id: int) -> dict:
+        return {
+            "id": row_id,
+            "content": chunk["content"],
+            "source": chunk.get("source"),
+            "chunk_index": chunk.get("chunk_index"),
+            "content_hash": chunk.get("content_hash") or content_hash(chunk["content"])
+        }
+
+    def _next_id(self, rows: list[dict]) -> int:
+        return max((row["id"] for row in rows), default=0) + 1
+
+    def add(self, content: str, embedding: list[float], source: str = None,
+            chunk_index: int = None, user_id: str = None, project_id: str = None):
+        """Add a chunk with its embedding"""
+        self.add_batch(
+            [{"content": content, "source": source, "chunk_index": chunk_index}],
+            [embedding], user_id=user_id, project_id=project_id
+        )
+
+    def add_batch(self, chunks: list[dict], embeddings: list[list[float]],
+                  user_id: str = None, project_id: str = None) -> int:
+        """Add many chunks at once"""
+        if not chunks:
+            return 0
+        vectors = self._normalize(embeddings)
+        with self._locked_tenant(user_id, project_id, create=True) as tenant:
+            _, rows = tenant.state()
+            first_id = self._next_id(rows)
+            tenant.append(
+                [self._row(chunk, first_id + i) for i, chunk in enumerate(chunks)],
+                vectors
+            )
+            counts = {}
+            for chunk in chunks:
+                counts[chunk.get("source")] = counts.get(chunk.get("source"), 0) + 1
+            with self._lock:
+                records = []
+                for source, added in counts.items():
+                    current = self._catalog.get(user_id, project_id, source)
+                    chunk_count = added + (current["chunk_count"] if current else 0)
+                    records.append(self._catalog.upsert(user_id, project_id, source, chunk_count=chunk_count))
+                self._catalog.write(records)
+        self._notify_change(user_id, project_id)
+        return len(chunks)
+
+    def document_chunks(self, source: str, user_id: str = None,
+                        project_id: str = None) -> list[dict]:
+        """
+        id, chunk_index and content_hash of the chunks of one document.
+        The tenant must match exactly: user_id=None means rows without user.
+        """
+        tenant = self._tenant(user_id, project_id)
+        if tenant is None:
+            return []
+        _, rows = tenant.snapshot()
+        return [
+            {field: row[field] for field in ("id", "chunk_index", "content_hash")}
+            for row in rows if row["source"] == source
+        ]
+
+    def sync_document(self, source: str, pairs: Iterable[tuple[dict, list[float] | None]],
+                      user_id: str = None, project_id: str = None,
+                      document_hash: str = None, size_bytes: int = None,
+                      batch_size: int = None) -> dict:
+        """
+        Replace the chunks of (source, user_id, project_id) and record the document, like
+        VectorStore.sync_document. pairs is consumed before anything is written:
+        an exception while producing it leaves the document unchanged.
+        """
+        new_chunks, new_embeddings, kept = [], [], {}
+        for chunk, embedding in pairs:
+            if embedding is None:
+                kept[chunk["id"]] = chunk.get("chunk_index")
+            else:
+                new_chunks.append(chunk)
+                new_embeddings.append(embedding)
+
+        with self._locked_tenant(user_id, project_id, create=True) as tenant:
+            matrix, rows = tenant.state()
+            existing = {row["id"] for row in rows if row["source"] == source}
+            missing = kept.keys() - existing
+            if missing:
+                raise RuntimeError(
+                    f"{len(missing)} chunks a reutiliser ont ete supprimes pendant l'indexation"
+                )
+            stale = existing - kept.keys()
+
+            first_id = self._next_id(rows)
+            added_rows = [
+                self._row(chunk, first_id + i) for i, chunk in enumerate(new_chunks)
+            ]
+            added_vectors = self._normalize(new_embeddings) if new_chunks else np.empty((0, self.dim), np.float32)
+
+            if not kept and not stale:
+                if added_rows:
+                    tenant.append(added_rows, added_vectors)
+            else:
+                keep = [i for i, row in enumerate(rows) if row["id"] not in stale]
+                updated = []
+                for i in keep:
+                    row = rows[i]
+                    if row["id"] in kept:
+                        row = {**row, "chunk_index": kept[row["id"]]}
+                    updated.append(row)
+                tenant.rewrite(updated + added_rows, np.concatenate([matrix[keep], added_vectors]))
+
+            with self._lock:
+                self._catalog.write([self._catalog.upsert(
+                    user_id, project_id, source,
+                    document_hash=document_hash,
+                    chunk_count=len(kept) + len(added_rows),
+                    size_bytes=size_bytes
+                )])
+
+        if added_rows or stale:
+            self._notify_change(user_id, project_id)
+        return {"added": len(added_rows), "reused": len(kept), "removed": len(stale)}
+
+    def ensure_schema(self):
+        """
+        Catalogue des chunks ecrits avant son introduction (une seule fois: tous
+        les tenants sont lus), puis compaction du journal du catalogue.
+        """
+        with self._lock:
+            tenants = [] if self._catalog.complete else list(self._tenants.values())
+        for tenant in tenants:
+            with tenant.lock:
+                if tenant.dropped:
+                    continue
+                _, rows = tenant.state()
+                by_source = {}
+                for row in rows:
+                    by_source.setdefault(row["source"], []).append(row)
+                with self._lock:
+                    records = []
+                    for source, source_rows in by_source.items():
+                        if self._catalog.get(tenant.user_id, tenant.project_id, source) is not None:
+                            continue
+                        # Hash de fichier stocke sur chaque ligne par les versions precedentes
+                        hashes = {row.get("document_hash") for row in source_rows}
+                        records.append(self._catalog.upsert(
+                            tenant.user_id, tenant.project_id, source,
+                            document_hash=hashes.pop() if len(hashes) == 1 else None,
+                            chunk_count=len(source_rows)
+                        ))
+                    self._catalog.write(records)
+        with self._lock:
+            if not self._catalog.complete:
+                self._catalog.write([{"complete": True}])
+            if self._catalog.lines > len(self._catalog.entries) + 1:
+                self._catalog.compact()
+
+    def _entry(self, entry: dict) -> dict:
+        return {
+            **{key: value for key, value in entry.items() if key != "indexed_at"},
+            "indexed_at": datetime.fromisoformat(entry["indexed_at"])
+        }
+
+    def document(self, source: str, user_id: str = None, project_id: str = None) -> dict | None:
+        """Catalog entry of one document (exact tenant), None if it is not indexed"""
+        with self._lock:
+            entry = self._catalog.get(user_id, project_id, source)
+        return self._entry(entry) if entry is not None else None
+
+    def list_documents(self, user_id: str = None, project_id: str = None,
+                       limit: int = None, after: int = None) -> list[dict]:
+        """Catalog entries by increasing id (optionally filtered by user/project), after the id `after`"""
+        limit = limit or settings.documents_page_size
+        page = []
+        with self._lock:
+            # Les ids sont attribues en ordre croissant: l'ordre d'insertion du dict
+            for document_id, entry in self._catalog.entries.items():
+                if after is not None and document_id <= after:
+                    continue
+                if user_id is not None and entry["user_id"] != user_id:
+                    continue
+                if project_id is not None and entry["project_id"] != project_id:
+                    continue
+                page.append(entry)
+                if len(page) == limit:
+                    break
+        return [self._entry(entry) for entry in page]
+
+    def delete_document(self, document_id: int, user_id: str = None,
+                        project_id: str = None) -> dict | None:
+        """
+        Delete one document: its rows are removed from the tenant (new generation).
+        user_id / project_id, when given, must match the document.
+        """
+        with self._lock:
+            entry = self._catalog.entries.get(document_id)
+        if (
+            entry is None
+            or (user_id is not None and entry["user_id"] != user_id)
+            or (project_id is not None and entry["project_id"] != project_id)
+        ):
+            return None
+
+        with self._locked_tenant(entry["user_id"], entry["project_id"]) as tenant:
+            with self._lock:
+                # Document supprime ou remplace pendant l'attente du verrou du tenant
+                if self._catalog.entries.get(document_id) is not entry:
+                    return None
+            if tenant is not None:
+                matrix, rows = tenant.state()
+                keep = [i for i, row in enumerate(rows) if row["source"] != entry["source"]]
+                if len(keep) < len(rows):
+                    tenant.rewrite([rows[i] for i in keep], matrix[keep])
+            with self._lock:
+                self._catalog.write([{**entry, "deleted": True}])
+        self._notify_change(entry["user_id"], entry["project_id"])
+        return self._entry(entry)
+
+    def _check_mode(self, mode: str = None):
+        mode = mode or settings.search_mode
+        if mode != "vector":
+            raise ValueError(f"Le backend numpy ne supporte que la recherche vectorielle (mode {mode})")
+
+    def search(self, query_embedding: list[float], top_k: int = None,
+               user_id: str = None, project_id: str = None,
+               ef_search: int = None, probes: int = None,
+               query_text: str = None, mode: str = None,
+               with_embeddings: bool = False) -> list[dict]:
+        """Exact cosine search (ef_search / probes are ignored, there is no ANN index)"""
+        return self.search_batch(
+            [query_embedding], top_k, user_id=user_id, project_id=project_id,
+            mode=mode, with_embeddings=with_embeddings
+        )[0]
+
+    def search_batch(self, query_embeddings: list[list[float]], top_k: int = None,
+                     user_id: str = None, project_id: str = None,
+                     ef_search: int = None, probes: int = None,
+                     query_texts: list[str] = None, mode: str = None,
+                     with_embeddings: bool = False) -> list[list[dict]]:
+        """
+        All queries at once: one matrix product per tenant, then the top_k of
+        each query (argpartition) merged across the tenants of the filter.
+        """
+        if not query_embeddings:
+            return []
+        self._check_mode(mode)
+        if top_k is None:
+            top_k = settings.top_k_results
+
+        queries = self._normalize(query_embeddings)
+        hits = [[] for _ in query_embeddings]  # (score, hit) par question
+        for tenant in self._matching(user_id, project_id):
+            matrix, rows = tenant.snapshot()
+            if not rows:
+                continue
+            scores = matrix @ queries.T  # n x nombre de questions
+            k = min(top_k, len(rows))
+            if k < len(rows):
+                best = np.argpartition(-scores, k - 1, axis=0)[:k]
+            else:
+                best = np.broadcast_to(np.arange(len(rows))[:, None], scores.shape)
+            for q in range(len(query_embeddings)):
+                for i in best[:, q]:
+                    hit = {
+                        "content": rows[i]["content"],
+                        "source": rows[i]["source"],
+                        "chunk_index": rows[i]["chunk_index"],
+                        "score": float(scores[i, q])
+                    }
+                    if with_embeddings:
+                        hit["embedding"] = np.array(matrix[i])
+                    hits[q].append(hit)
+
+        return [
+            sorted(query_hits, key=lambda hit: -hit["score"])[:top_k]
+            for query_hits in hits
+        ]
+
+    def clear(self, user_id: str = None, project_id: str = None):
+        """
+        Delete chunks and documents (optionally filtered by user/project):
+        the tenant files are removed
+        """
+        for tenant in self._matching(user_id, project_id):
+            with tenant.lock:
+                if tenant.dropped:
+                    continue
+                # Les ecrivains en attente du verrou verront dropped et rechercheront le tenant:
+                # le repertoire est supprime avant qu'un nouveau tenant puisse le recreer
+                tenant.dropped = True
+                shutil.rmtree(tenant.directory, ignore_errors=True)
+                tenant._state = (np.empty((0, self.dim), dtype=np.float32), [])
+                with self._lock:
+                    self._tenants.pop((tenant.user_id, tenant.project_id), None)
+                    self._catalog.write([
+                        {**entry, "deleted": True} for entry in self._catalog.entries.values()
+                        if (entry["user_id"], entry["project_id"]) == (tenant.user_id, tenant.project_id)
+                    ])
+        self._notify_change(user_id, project_id)
@@ -1,103 +1,1225 @@
 # handle storage and research of vectors in PostgresSQL
 
-from sqlalchemy import create_engine, Column, Integer, String, Text
-from sqlalchemy.orm import sessionmaker, declarative_base
-from pgvector.sqlalchemy import Vector
+import hashlib
+import io
+import time
+from typing import Iterable
+from sqlalchemy import (
+    text, bindparam, cast, column, delete, func, literal, select, true, union_all, update, values,
+    BigInteger, Column, Computed, DateTime, ForeignKey, Identity, Index, Integer, String, Text
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+from sqlalchemy.orm import Session, declarative_base
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
 from config.settings import settings
+from src.storage.backend import VectorStoreBackend
+from src.storage.bulk import batched, column_encoder, encode_copy_rows
+from src.storage.database import get_engine, session_scope
+from src.storage.hashing import content_hash
 
 Base = declarative_base()
 
+VECTOR_INDEX_NAME = "ix_document_chunks_embedding"
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+PARTITION_STRATEGIES = {"list": "LIST (project_id)", "hash": "HASH (project_id)"}
+PARTITIONED = settings.chunk_partitioning in PARTITION_STRATEGIES
+VECTOR_STORAGES = ("vector", "halfvec", "binary")
+BINARY_QUANTIZED = settings.vector_storage == "binary"
+
+
+class Document(Base):
+    """Catalog of indexed documents: one row per (source, user_id, project_id)"""
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String(500))
+    user_id = Column(String(100))
+    project_id = Column(String(100))
+    # Hash du fichier source: un re-upload identique n'est pas re-indexe
+    document_hash = Column(String(64))
+    chunk_count = Column(Integer, nullable=False, server_default="0")
+    size_bytes = Column(BigInteger)
+    indexed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # Un document par tenant et source (NULL compte comme une valeur)
+        Index(
+            "ux_documents_tenant_source",
+            func.coalesce(user_id, ""), func.coalesce(project_id, ""), func.coalesce(source, ""),
+            unique=True
+        ),
+        # Listing pagine d'un tenant par id croissant
+        Index("ix_documents_tenant", "user_id", "project_id", "id"),
+    )
+
+
+class DataVersion(Base):
+    """Write counter per tenant, bumped in the transaction of each write"""
+    __tablename__ = "data_versions"
+
+    # '' pour NULL, comme la cle du catalogue
+    user_id = Column(String(100), primary_key=True)
+    project_id = Column(String(100), primary_key=True)
+    version = Column(BigInteger, nullable=False, server_default="0")
+
+
+# Expressions of ux_documents_tenant_source, target of the catalog upserts
+DOCUMENT_KEY = [
+    func.coalesce(Document.user_id, ""),
+    func.coalesce(Document.project_id, ""),
+    func.coalesce(Document.source, "")
+]
+
 
 class DocumentChunk(Base):
     """Table to stock chunks and their embeddings"""
     __tablename__ = "document_chunks"
 
-    id = Column(Integer, primary_key=True)
+    if PARTITIONED:
+        # Une cle primaire doit inclure project_id, qui peut etre NULL:
+        # id reste unique (identity) et sert de cle a l'ORM
+        id = Column(Integer, Identity(), nullable=False, index=True)
+        __mapper_args__ = {"primary_key": [id]}
+    else:
+        id = Column(Integer, primary_key=True)
     content = Column(Text, nullable=False)
     source = Column(String(500))
     chunk_index = Column(Integer)
     embedding = Column(Vector(settings.embedding_dim))
+    if BINARY_QUANTIZED:
+        # Un bit (le signe) par dimension: c'est cette colonne qui est indexee
+        embedding_bits = Column(
+            BIT(settings.embedding_dim),
+            Computed(f"binary_quantize(embedding)::bit({settings.embedding_dim})", persisted=True)
+        )
 
     # Multi-tenancy: isolation par utilisateur et projet
     user_id = Column(String(100), nullable=True, index=True)
     project_id = Column(String(100), nullable=True, index=True)
 
+    # Document du catalogue: le supprimer supprime ses chunks
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
+
+    # Re-indexation incrementale: hash du chunk (celui du fichier est dans le catalogue)
+    content_hash = Column(String(64))
+
+    # Full-text: tsvector genere par Postgres a partir du contenu
+    content_tsv = Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{settings.text_search_config}', content)", persisted=True)
+    )
+
+    __table_args__ = (
+        Index("ix_document_chunks_content_tsv", "content_tsv", postgresql_using="gin"),
+        Index("ix_document_chunks_source", "source"),
+        {"postgresql_partition_by": PARTITION_STRATEGIES[settings.chunk_partitioning]} if PARTITIONED else {}
+    )
+
+
+# Schema changes for tables created by an older version (create_all never alters
+# an existing table), as (column or index created, DDL). Even with IF NOT EXISTS,
+# ALTER TABLE / CREATE INDEX lock document_chunks: only the missing ones are run.
+MIGRATIONS = [
+    ("content_tsv",
+     f"ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+     f"GENERATED ALWAYS AS (to_tsvector('{settings.text_search_config}', content)) STORED"),
+    ("ix_document_chunks_content_tsv",
+     "CREATE INDEX IF NOT EXISTS ix_document_chunks_content_tsv "
+     "ON document_chunks USING gin (content_tsv)"),
+    ("content_hash", "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS content_hash varchar(64)"),
+    ("ix_document_chunks_source",
+     "CREATE INDEX IF NOT EXISTS ix_document_chunks_source ON document_chunks (source)"),
+    ("document_id",
+     "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS document_id integer "
+     "REFERENCES documents (id) ON DELETE CASCADE"),
+    ("ix_document_chunks_document_id",
+     "CREATE INDEX IF NOT EXISTS ix_document_chunks_document_id ON document_chunks (document_id)"),
+]
+if BINARY_QUANTIZED:
+    # Calcule embedding_bits pour les lignes existantes (reecriture de la table)
+    MIGRATIONS.append((
+        "embedding_bits",
+        f"ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS embedding_bits bit({settings.embedding_dim}) "
+        f"GENERATED ALWAYS AS (binary_quantize(embedding)::bit({settings.embedding_dim})) STORED"
+    ))
+
 
-class VectorStore:
+class VectorStore(VectorStoreBackend):
+
+    def __init__(self, engine: Engine = None):
+        super().__init__()
+        # Engine partage: une session courte par operation, empruntee au pool
+        self.engine = engine or get_engine()
+        # Le schema n'est pas cree ici (aucun acces a la base a la construction):
+        # ensure_schema() est appele au demarrage (auto_migrate) ou par la commande migrate
+        self._partitioning = None
+        self._partitions = set()  # project_id des partitions "list" deja creees
+
+    def _session(self):
+        return session_scope(self.engine)
+
+    @property
+    def partitioning(self) -> str:
+        """Strategie reelle de la table, lue au premier usage: elle a pu etre creee avec d'autres Settings"""
+        if self._partitioning is None:
+            with self.engine.connect() as conn:
+                self._partitioning = self._read_partitioning(conn)
+        return self._partitioning
+
+    @partitioning.setter
+    def partitioning(self, value: str):
+        self._partitioning = value
+
+    def _read_partitioning(self, conn) -> str:
+        return {"l": "list", "h": "hash"}.get(conn.execute(text(
+            "SELECT partstrat FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass('document_chunks')"
+        )).scalar(), "none")
+
+    def ensure_schema(self):
+        """Create missing tables, apply MIGRATIONS and create the ANN index (idempotent)"""
+        if settings.chunk_partitioning not in ("none", *PARTITION_STRATEGIES):
+            raise ValueError(f"Partitionnement non supporte: {settings.chunk_partitioning}")
+        if settings.vector_storage not in VECTOR_STORAGES:
+            raise ValueError(f"Stockage vectoriel non supporte: {settings.vector_storage}")
+
+        with self.engine.begin() as conn:
+            # Chaque worker migre au demarrage: un seul a la fois, les suivants trouvent
+            # le schema a jour (sinon le backfill du catalogue compterait les chunks deux fois)
+            conn.execute(text(f"SELECT pg_advisory_xact_lock(hashtext('{DocumentChunk.__tablename__}_schema'))"))
+            new_versions = conn.execute(
+                text("SELECT to_regclass(:name)"), {"name": DataVersion.__tablename__}
+            ).scalar() is None
+            Base.metadata.create_all(conn)
+            existing = self._schema_objects(conn)
+            for name, statement in MIGRATIONS:
+                if name not in existing:
+                    conn.execute(text(statement))
+            self._backfill_documents(conn)
+            if new_versions:
+                # Une ligne par tenant deja indexe: clear() n'incremente que les lignes existantes
+                conn.execute(text(
+                    "INSERT INTO data_versions (user_id, project_id) "
+                    "SELECT DISTINCT coalesce(user_id, ''), coalesce(project_id, '') FROM documents "
+                    "ON CONFLICT DO NOTHING"
+                ))
+            self.partitioning = self._read_partitioning(conn)
+            if self.partitioning == "hash":
+                self._create_hash_partitions(conn)
+            self._ensure_index(conn)
+
+    def _schema_objects(self, conn) -> set[str]:
+        """Columns and indexes of document_chunks (catalog reads, no lock on the table)"""
+        table = DocumentChunk.__tablename__
+        return set(conn.execute(text(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = :table "
+            "UNION SELECT indexname FROM pg_indexes WHERE tablename = :table"
+        ), {"table": table}).scalars())
+
+    def _backfill_documents(self, conn):
+        """
+        Catalogue des chunks indexes avant la table documents: un document par
+        (source, user_id, project_id), puis lien des chunks. Le hash de fichier,
+        jusque-la stocke sur chaque chunk, est repris s'il etait le meme pour
+        tous les chunks du document, et sa colonne est supprimee.
+        """
+        legacy_hash = conn.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'document_chunks' AND column_name = 'document_hash'"
+        )).scalar() is not None
+        # Passe par l'index sur document_id: rien a faire une fois le catalogue rempli
+        if conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM document_chunks WHERE document_id IS NULL)"
+        )).scalar():
+            document_hash = (
+                "CASE WHEN count(DISTINCT document_hash) = 1 AND count(document_hash) = count(*) "
+                "THEN min(document_hash) END"
+            ) if legacy_hash else "NULL"
+            key = "coalesce(user_id, ''), coalesce(project_id, ''), coalesce(source, '')"
+            conn.execute(text(
+                f"INSERT INTO documents (source, user_id, project_id, document_hash, chunk_count) "
+                f"SELECT source, user_id, project_id, {document_hash}, count(*) "
+                f"FROM document_chunks WHERE document_id IS NULL "
+                f"GROUP BY source, user_id, project_id "
+                f"ON CONFLICT ({key}) DO UPDATE "
+                f"SET chunk_count = documents.chunk_count + excluded.chunk_count"
+            ))
+            conn.execute(text(
+                "UPDATE document_chunks c SET document_id = d.id FROM documents d "
+                "WHERE c.document_id IS NULL "
+                "AND coalesce(c.user_id, '') = coalesce(d.user_id, '') "
+                "AND coalesce(c.project_id, '') = coalesce(d.project_id, '') "
+                "AND coalesce(c.source, '') = coalesce(d.source, '')"
+            ))
+        if legacy_hash:
+            conn.execute(text("ALTER TABLE document_chunks DROP COLUMN document_hash"))
+
+    def _create_hash_partitions(self, conn):
+        # Le nombre de partitions est fixe a la creation: le changer impose de repartitionner
+        if conn.execute(text(
+            "SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass('document_chunks')"
+        )).scalar():
+            return
+        modulus = settings.chunk_hash_partitions
+        for remainder in range(modulus):
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {DocumentChunk.__tablename__}_h{remainder} "
+                f"PARTITION OF {DocumentChunk.__tablename__} "
+                f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})"
+            ))
+
+    def partition_name(self, project_id: str | None) -> str:
+        """Nom de la partition "list" d'un projet (stable, valide quel que soit project_id)"""
+        if project_id is None:
+            return f"{DocumentChunk.__tablename__}_p_null"
+        digest = hashlib.sha1(project_id.encode("utf-8")).hexdigest()[:16]
+        return f"{DocumentChunk.__tablename__}_p_{digest}"
+
+    def ensure_partition(self, project_id: str = None):
+        """
+        Cree la partition d'un projet avant son premier insert (mode "list").
+
+        La partition est creee a part puis attachee: ATTACH PARTITION ne bloque
+        ni les recherches ni les ecritures des autres projets, contrairement a
+        CREATE TABLE ... PARTITION OF. L'index vectoriel du parent y est cree
+        automatiquement.
+        """
+        if self.partitioning != "list" or project_id in self._partitions:
+            return
+        with self.engine.begin() as conn:
+            self._create_list_partition(conn, project_id)
+        self._partitions.add(project_id)
+
+    def _create_list_partition(self, conn, project_id: str | None):
+        name = self.partition_name(project_id)
+        table = DocumentChunk.__tablename__
+        # Serialise les creations concurrentes (plusieurs workers, plusieurs process)
+        conn.execute(text(f"SELECT pg_advisory_xact_lock(hashtext('{table}_partitions'))"))
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            return
+
+        if project_id is None:
+            bound = "NULL"
+        else:
+            bound = String().literal_processor(conn.dialect)(project_id)
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED)"))
+        conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES IN ({bound})"))
+
+    def partitions(self) -> list[dict]:
+        """Partitions de document_chunks: nom, borne et nombre de lignes estime"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound, "
+                "c.reltuples::bigint AS estimated_rows "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('document_chunks') "
+                "ORDER BY c.relname"
+            )).mappings().all()
+        return [dict(row) for row in rows]
+
+    def partition_table(self) -> int:
+        """
+        Convertit une table document_chunks non partitionnee selon
+        settings.chunk_partitioning: les lignes (et leurs ids) sont copiees dans
+        la nouvelle table en une seule transaction, puis l'index ANN est recree.
+        Retourne le nombre de lignes copiees.
+        """
+        if not PARTITIONED:
+            raise ValueError("chunk_partitioning doit valoir 'list' ou 'hash'")
+        if self.partitioning != "none":
+            return 0
+
+        table = DocumentChunk.__tablename__
+        old = f"{table}_unpartitioned"
+        columns = ", ".join(
+            c.name for c in DocumentChunk.__table__.columns if c.computed is None
+        )
+        with self.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+            # Liberer les noms d'index et la sequence repris par la nouvelle table
+            for (index_name,) in conn.execute(text(
+                "SELECT i.indexname FROM pg_indexes i "
+                "WHERE i.tablename = :old AND NOT EXISTS ("
+                "  SELECT 1 FROM pg_constraint k WHERE k.conname = i.indexname)"
+            ), {"old": old}):
+                conn.execute(text(f'DROP INDEX "{index_name}"'))
+            conn.execute(text(f"ALTER TABLE {old} ALTER COLUMN id DROP DEFAULT"))
+            conn.execute(text(f"DROP SEQUENCE IF EXISTS {table}_id_seq"))
 
-    def __init__(self):
-        self.engine = create_engine(settings.database_url)
-        Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+            Base.metadata.create_all(conn)
+            self.partitioning = settings.chunk_partitioning
+            if self.partitioning == "hash":
+                self._create_hash_partitions(conn)
+            else:
+                for (project_id,) in conn.execute(text(f"SELECT DISTINCT project_id FROM {old}")):
+                    self._create_list_partition(conn, project_id)
+
+            copied = conn.execute(text(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}"
+            )).rowcount
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"coalesce(max(id), 0) + 1, false) FROM {table}"
+            ))
+            conn.execute(text(f"DROP TABLE {old}"))
+
+        # Index ANN construit apres la copie (plus rapide qu'en insertion)
+        self.ensure_index()
+        return copied
+
+    def _index_ddl(self, name: str, concurrently: bool = False,
+                   table: str = None, only: bool = False) -> str:
+        """
+        DDL de l'index ANN selon settings.vector_index_type, sur embedding ou sa
+        forme compacte selon settings.vector_storage.
+        only: index du seul parent partitionne, sans ses partitions (invalide
+        tant que l'index de chaque partition n'y est pas attache).
+        """
+        index_type = settings.vector_index_type
+        if index_type == "hnsw":
+            params = f"m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction}"
+        elif index_type == "ivfflat":
+            params = f"lists = {settings.ivfflat_lists}"
+        else:
+            raise ValueError(f"Type d'index vectoriel non supporte: {index_type}")
+
+        indexed = {
+            "vector": "embedding vector_cosine_ops",
+            "halfvec": f"(embedding::halfvec({settings.embedding_dim})) halfvec_cosine_ops",
+            "binary": "embedding_bits bit_hamming_ops"
+        }[settings.vector_storage]
+
+        concurrent = " CONCURRENTLY" if concurrently else ""
+        target = ("ONLY " if only else "") + (table or DocumentChunk.__tablename__)
+        return (
+            f"CREATE INDEX{concurrent} IF NOT EXISTS {name} "
+            f"ON {target} "
+            f"USING {index_type} ({indexed}) WITH ({params})"
+        )
+
+    def ensure_index(self):
+        """Cree l'index ANN s'il n'existe pas (rien a faire si vector_index_type = 'none')"""
+        with self.engine.begin() as conn:
+            self._ensure_index(conn)
+
+    def _ensure_index(self, conn):
+        # Verifie d'abord le catalogue: CREATE INDEX IF NOT EXISTS verrouille la table meme si l'index existe
+        if settings.vector_index_type == "none":
+            return
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": VECTOR_INDEX_NAME}).scalar() is None:
+            conn.execute(text(self._index_ddl(VECTOR_INDEX_NAME)))
+
+    def rebuild_index(self, concurrently: bool = True):
+        """
+        Reconstruit l'index avec les parametres actuels de Settings
+        (changement de type, de m, de lists, de vector_storage...).
+
+        Le nouvel index est construit sous un nom temporaire puis remplace
+        l'ancien: les recherches continuent d'utiliser l'ancien pendant la construction.
+        """
+        tmp_name = f"{VECTOR_INDEX_NAME}_new"
+        concurrent = " CONCURRENTLY" if concurrently else ""
+
+        # CREATE/DROP INDEX CONCURRENTLY ne peuvent pas tourner dans une transaction
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if self.partitioning != "none":
+                self._rebuild_partitioned_index(conn, concurrently)
+                return
+
+            # Reste eventuel (invalide) d'une reconstruction interrompue
+            conn.execute(text(f"DROP INDEX{concurrent} IF EXISTS {tmp_name}"))
+
+            if settings.vector_index_type == "none":
+                conn.execute(text(f"DROP INDEX{concurrent} IF EXISTS {VECTOR_INDEX_NAME}"))
+                return
+
+            conn.execute(text(self._index_ddl(tmp_name, concurrently)))
+            conn.execute(text(f"DROP INDEX{concurrent} IF EXISTS {VECTOR_INDEX_NAME}"))
+            conn.execute(text(f"ALTER INDEX {tmp_name} RENAME TO {VECTOR_INDEX_NAME}"))
+
+    def _rebuild_partitioned_index(self, conn, concurrently: bool):
+        """
+        CREATE/DROP INDEX CONCURRENTLY n'existent pas pour une table partitionnee:
+        le nouvel index est cree sur le seul parent, chaque partition est indexee
+        concurremment puis attachee, ce qui rend l'index parent valide.
+        """
+        tmp_name = f"{VECTOR_INDEX_NAME}_new"
+        conn.execute(text(f"DROP INDEX IF EXISTS {tmp_name}"))
+        if settings.vector_index_type == "none":
+            conn.execute(text(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}"))
+            return
+
+        if not concurrently:
+            conn.execute(text(self._index_ddl(tmp_name)))
+        else:
+            conn.execute(text(self._index_ddl(tmp_name, only=True)))
+            for partition in self.partitions():
+                child = f"{partition['name']}_embedding_new"
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {child}"))
+                conn.execute(text(self._index_ddl(child, concurrently=True, table=partition["name"])))
+                conn.execute(text(f"ALTER INDEX {tmp_name} ATTACH PARTITION {child}"))
+
+        # Supprimer l'index parent supprime aussi ceux des partitions
+        conn.execute(text(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}"))
+        conn.execute(text(f"ALTER INDEX {tmp_name} RENAME TO {VECTOR_INDEX_NAME}"))
+        if concurrently:
+            for partition in self.partitions():
+                conn.execute(text(
+                    f"ALTER INDEX IF EXISTS {partition['name']}_embedding_new "
+                    f"RENAME TO {partition['name']}_embedding"
+                ))
+
+    def reindex(self, concurrently: bool = True):
+        """Reconstruit l'index existant a l'identique (ex: apres beaucoup d'insertions/suppressions)"""
+        concurrent = " CONCURRENTLY" if concurrently else ""
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"REINDEX INDEX{concurrent} {VECTOR_INDEX_NAME}"))
+
+    def index_info(self) -> dict | None:
+        """Definition, taille et validite de l'index ANN (None s'il n'existe pas)"""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(
+                    "SELECT i.indexdef, x.indisvalid AS valid, "
+                    # Un index partitionne n'a pas de stockage propre: somme des partitions
+                    "(SELECT coalesce(sum(pg_relation_size(t.relid)), 0)::bigint "
+                    " FROM pg_partition_tree(x.indexrelid) t) AS size_bytes "
+                    "FROM pg_indexes i "
+                    "JOIN pg_class c ON c.relname = i.indexname "
+                    "JOIN pg_index x ON x.indexrelid = c.oid "
+                    "WHERE i.indexname = :name"
+                ),
+                {"name": VECTOR_INDEX_NAME}
+            ).mappings().first()
+        return dict(row) if row else None
+
+    def recall_report(self, sample: int = 100, top_k: int = 10, rescore_factors: list[int] = None,
+                      user_id: str = None, project_id: str = None) -> list[dict]:
+        """
+        Recall@top_k of the indexed vector search against an exact scan, with
+        `sample` stored embeddings as queries. One row per rescoring factor
+        (a single one with vector_storage = "vector"): recall and mean latency,
+        plus the exact scan for reference.
+        """
+        filters = self._filters(user_id, project_id)
+        if settings.vector_storage == "vector":
+            rescore_factors = [1]
+        else:
+            rescore_factors = rescore_factors or [settings.vector_rescore_factor]
+
+        with self._session() as session:
+            queries = session.scalars(
+                select(DocumentChunk.embedding).where(*filters).order_by(func.random()).limit(sample)
+            ).all()
+        if not queries:
+            return []
+
+        def run(statement_for, tune_size: int = None, exact: bool = False):
+            results, seconds = [], 0.0
+            for query_embedding in queries:
+                with self._session() as session:
+                    if exact:
+                        session.execute(text("SELECT set_config('enable_indexscan', 'off', true)"))
+                    else:
+                        self._tune_search(session, tune_size)
+                    start = time.perf_counter()
+                    results.append(set(session.scalars(statement_for(query_embedding))))
+                    seconds += time.perf_counter() - start
+            return results, seconds * 1000 / len(queries)
+
+        distance = DocumentChunk.embedding.cosine_distance
+        truth, exact_ms = run(
+            lambda q: select(DocumentChunk.id).where(*filters).order_by(distance(q)).limit(top_k),
+            exact=True
+        )
+        report = [{"search": "exact", "rescore_factor": None, "recall": 1.0, "latency_ms": exact_ms}]
+        for factor in rescore_factors:
+            found, latency_ms = run(
+                lambda q: self._nearest(q, top_k, filters, DocumentChunk.id, rescore_factor=factor),
+                tune_size=self._shortlist_size(top_k, factor)
+            )
+            hits = sum(len(f & t) for f, t in zip(found, truth))
+            report.append({
+                "search": settings.vector_storage,
+                "rescore_factor": factor if settings.vector_storage != "vector" else None,
+                "recall": hits / sum(len(t) for t in truth),
+                "latency_ms": latency_ms
+            })
+        return report
+
+    def _tune_search(self, session: Session, top_k: int,
+                     ef_search: int = None, probes: int = None):
+        """
+        Regle le compromis rappel/latence de l'index pour la transaction courante.
+        hnsw.ef_search doit etre >= top_k pour pouvoir retourner top_k resultats.
+        """
+        tuning = self._tuning_statement(top_k, ef_search=ef_search, probes=probes)
+        if tuning is not None:
+            session.execute(tuning)
+
+    def search_tuning(self, top_k: int, mode: str, ef_search: int = None, probes: int = None):
+        """
+        Index tuning statement of a search (None without ANN index), sized for the
+        vector candidate list of the mode; to run in the search transaction
+        """
+        return self._tuning_statement(self._tuning_size(top_k, mode), ef_search=ef_search, probes=probes)
+
+    def _tuning_statement(self, top_k: int, ef_search: int = None, probes: int = None):
+        """Reglage de l'index pour la transaction courante (None sans index ANN)"""
+        if settings.vector_index_type == "hnsw":
+            name, value = "hnsw.ef_search", max(ef_search or settings.hnsw_ef_search, top_k)
+        elif settings.vector_index_type == "ivfflat":
+            name, value = "ivfflat.probes", probes or settings.ivfflat_probes
+        else:
+            return None
+        # set_config(..., true) equivaut a SET LOCAL mais accepte un parametre lie
+        return text("SELECT set_config(:name, :value, true)").bindparams(name=name, value=str(value))
 
     def add(self, content: str, embedding: list[float], source: str = None,
             chunk_index: int = None, user_id: str = None, project_id: str = None):
         """Add a chunk with its embedding"""
-        chunk = DocumentChunk(
-            content=content,
-            source=source,
-            chunk_index=chunk_index,
-            embedding=embedding,
-            user_id=user_id,
-            project_id=project_id
+        self.add_batch(
+            [{"content": content, "source": source, "chunk_index": chunk_index}],
+            [embedding], user_id=user_id, project_id=project_id
         )
-        self.session.add(chunk)
-        self.session.commit()
 
     def add_batch(self, chunks: list[dict], embeddings: list[list[float]],
-                  user_id: str = None, project_id: str = None):
+                  user_id: str = None, project_id: str = None) -> int:
         """Add many chunks at once"""
-        for chunk, embedding in zip(chunks, embeddings):
-            db_chunk = DocumentChunk(
-                content=chunk["content"],
-                source=chunk.get("source"),
-                chunk_index=chunk.get("chunk_index"),
-                embedding=embedding,
-                user_id=user_id,
-                project_id=project_id
+        return self.add_stream(zip(chunks, embeddings), user_id=user_id, project_id=project_id)
+
+    def add_stream(self, pairs: Iterable[tuple[dict, list[float]]],
+                   user_id: str = None, project_id: str = None,
+                   batch_size: int = None) -> int:
+        """
+        Bulk insert of (chunk, embedding) pairs, consumed lazily by batches of
+        `bulk_insert_batch_size` rows. Uses binary COPY when the driver supports it,
+        multi-row executemany otherwise. All batches are committed together.
+        The chunks are appended to the catalog document of their source.
+        Returns the number of inserted rows.
+        """
+        batch_size = batch_size or settings.bulk_insert_batch_size
+        total = 0
+        counts = {}  # document_id -> chunks ajoutes
+        document_ids = {}  # source -> document_id
+        self.ensure_partition(project_id)
+        with self._session() as session:
+            for batch in batched(pairs, batch_size):
+                rows = []
+                for chunk, embedding in batch:
+                    source = chunk.get("source")
+                    if source not in document_ids:
+                        document_ids[source] = self._upsert_document(session, source, user_id, project_id)
+                    document_id = document_ids[source]
+                    counts[document_id] = counts.get(document_id, 0) + 1
+                    rows.append(self._chunk_row(chunk, embedding, user_id, project_id, document_id))
+                self._bulk_insert(session, rows)
+                total += len(rows)
+            if counts:
+                table = Document.__table__
+                session.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("document_id"))
+                    .values(chunk_count=table.c.chunk_count + bindparam("added"), indexed_at=func.now()),
+                    [{"document_id": document_id, "added": n} for document_id, n in counts.items()]
+                )
+            if total:
+                self._bump_version(session, user_id, project_id)
+        if total:
+            self._notify_change(user_id, project_id)
+        return total
+
+    def _chunk_row(self, chunk: dict, embedding: list[float],
+                   user_id: str = None, project_id: str = None,
+                   document_id: int = None) -> dict:
+        """Column values of a document_chunks row"""
+        return {
+            "content": chunk["content"],
+            "source": chunk.get("source"),
+            "chunk_index": chunk.get("chunk_index"),
+            "embedding": embedding,
+            "user_id": user_id,
+            "project_id": project_id,
+            "content_hash": chunk.get("content_hash") or content_hash(chunk["content"]),
+            "document_id": document_id
+        }
+
+    def _bulk_insert(self, session: Session, rows: list[dict]):
+        """Insert one batch of rows in the current session transaction"""
+        table = DocumentChunk.__table__
+        columns = list(rows[0])
+        sql = (
+            f"COPY {table.name} ({', '.join(columns)}) "
+            f"FROM STDIN WITH (FORMAT binary)"
+        )
+
+        dbapi_connection = session.connection().connection.dbapi_connection
+        cursor = dbapi_connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert") or hasattr(cursor, "copy"):
+                data = encode_copy_rows(
+                    (tuple(row[c] for c in columns) for row in rows),
+                    [column_encoder(table.c[c].type) for c in columns]
+                )
+                if hasattr(cursor, "copy_expert"):  # psycopg2
+                    cursor.copy_expert(sql, io.BytesIO(data))
+                else:  # psycopg 3
+                    with cursor.copy(sql) as copy:
+                        copy.write(data)
+                return
+        finally:
+            cursor.close()
+
+        # Driver sans COPY: INSERT multi-lignes
+        session.execute(table.insert(), rows)
+
+    def document_chunks(self, source: str, user_id: str = None,
+                        project_id: str = None) -> list[dict]:
+        """
+        id, chunk_index and content_hash of the chunks of one document.
+        The tenant must match exactly: user_id=None means rows without user.
+        """
+        with self._session() as session:
+            rows = session.execute(
+                select(
+                    DocumentChunk.id,
+                    DocumentChunk.chunk_index,
+                    DocumentChunk.content_hash
+                ).where(*self._document_filters(source, user_id, project_id))
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def sync_document(self, source: str, pairs: Iterable[tuple[dict, list[float] | None]],
+                      user_id: str = None, project_id: str = None,
+                      document_hash: str = None, size_bytes: int = None,
+                      batch_size: int = None) -> dict:
+        """
+        Replace the chunks of (source, user_id, project_id) in one transaction,
+        and record the document in the catalog.
+
+        pairs yields (chunk, embedding) for chunks to insert, and (chunk, None)
+        for chunks whose chunk["id"] is an existing row to keep (its chunk_index
+        is updated). Existing rows that are not kept are deleted.
+        Returns {"added": n, "reused": n, "removed": n}.
+        """
+        batch_size = batch_size or settings.bulk_insert_batch_size
+        table = DocumentChunk.__table__
+        added = 0
+        kept = {}
+
+        self.ensure_partition(project_id)
+        with self._session() as session:
+            # Verrouille la ligne du catalogue: deux re-uploads concurrents s'attendent
+            document_id = self._upsert_document(session, source, user_id, project_id)
+            existing = set(session.scalars(
+                select(DocumentChunk.id).where(*self._document_filters(source, user_id, project_id))
+            ))
+
+            for batch in batched(pairs, batch_size):
+                rows = []
+                for chunk, embedding in batch:
+                    if embedding is None:
+                        kept[chunk["id"]] = chunk.get("chunk_index")
+                    else:
+                        rows.append(self._chunk_row(chunk, embedding, user_id, project_id, document_id))
+                if rows:
+                    self._bulk_insert(session, rows)
+                    added += len(rows)
+
+            missing = kept.keys() - existing
+            if missing:
+                raise RuntimeError(
+                    f"{len(missing)} chunks a reutiliser ont ete supprimes pendant l'indexation"
+                )
+
+            if kept:
+                session.execute(
+                    update(table)
+                    # Le filtre projet limite la mise a jour a une seule partition
+                    .where(table.c.id == bindparam("kept_id"), table.c.project_id == project_id)
+                    .values(chunk_index=bindparam("new_index"), document_id=document_id),
+                    [{"kept_id": chunk_id, "new_index": index} for chunk_id, index in kept.items()]
+                )
+
+            stale = list(existing - kept.keys())
+            if stale:
+                session.execute(
+                    delete(table).where(table.c.id.in_(stale), table.c.project_id == project_id)
+                )
+
+            session.execute(
+                update(Document)
+                .where(Document.id == document_id)
+                .values(
+                    document_hash=document_hash,
+                    chunk_count=added + len(kept),
+                    size_bytes=size_bytes,
+                    indexed_at=func.now()
+                )
             )
-            self.session.add(db_chunk)
-        self.session.commit()
+            if added or stale:
+                self._bump_version(session, user_id, project_id)
 
-    def search(self, query_embedding: list[float], top_k: int = None,
-               user_id: str = None, project_id: str = None) -> list[dict]:
-        """Search most similar chunks with optional user/project filter"""
-        if top_k is None:
-            top_k = settings.top_k_results
+        if added or stale:
+            self._notify_change(user_id, project_id)
+        return {"added": added, "reused": len(kept), "removed": len(stale)}
+
+    def _upsert_document(self, session: Session, source: str,
+                         user_id: str = None, project_id: str = None) -> int:
+        """id of the catalog document, created if missing; its row stays locked until commit"""
+        statement = insert(Document).values(source=source, user_id=user_id, project_id=project_id)
+        # DO UPDATE (sans effet) plutot que DO NOTHING: verrouille la ligne et la retourne
+        return session.execute(
+            statement
+            .on_conflict_do_update(index_elements=DOCUMENT_KEY, set_={"source": statement.excluded.source})
+            .returning(Document.id)
+        ).scalar_one()
+
+    def document(self, source: str, user_id: str = None, project_id: str = None) -> dict | None:
+        """Catalog entry of one document (exact tenant), None if it is not indexed"""
+        with self._session() as session:
+            row = session.execute(
+                # Memes expressions que ux_documents_tenant_source: une recherche dans l'index unique
+                select(*self._document_columns()).where(*(
+                    expression == (value or "")
+                    for expression, value in zip(DOCUMENT_KEY, (user_id, project_id, source))
+                ))
+            ).mappings().first()
+        return dict(row) if row is not None else None
 
-        # Build query with optional filters
-        query = self.session.query(
-            DocumentChunk.content,
-            DocumentChunk.source,
-            DocumentChunk.embedding.cosine_distance(query_embedding).label("distance")
+    def list_documents(self, user_id: str = None, project_id: str = None,
+                       limit: int = None, after: int = None) -> list[dict]:
+        """
+        Catalog entries by increasing id (optionally filtered by user/project).
+        Keyset pagination: pass the last id of a page as `after` to get the next one.
+        """
+        statement = select(*self._document_columns()).order_by(Document.id)
+        if user_id is not None:
+            statement = statement.where(Document.user_id == user_id)
+        if project_id is not None:
+            statement = statement.where(Document.project_id == project_id)
+        if after is not None:
+            statement = statement.where(Document.id > after)
+        with self._session() as session:
+            rows = session.execute(
+                statement.limit(limit or settings.documents_page_size)
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def delete_document(self, document_id: int, user_id: str = None,
+                        project_id: str = None) -> dict | None:
+        """
+        Delete one document and its chunks (ON DELETE CASCADE, through the
+        index on document_chunks.document_id). user_id / project_id, when given,
+        must match the document. Returns the deleted entry, None if not found.
+        """
+        statement = delete(Document).where(Document.id == document_id)
+        if user_id is not None:
+            statement = statement.where(Document.user_id == user_id)
+        if project_id is not None:
+            statement = statement.where(Document.project_id == project_id)
+        with self._session() as session:
+            row = session.execute(statement.returning(*self._document_columns())).mappings().first()
+            if row is not None:
+                self._bump_version(session, row["user_id"], row["project_id"])
+        if row is None:
+            return None
+        self._notify_change(row["user_id"], row["project_id"])
+        return dict(row)
+
+    def _bump_version(self, session: Session, user_id: str = None, project_id: str = None):
+        """Increment the data version of one tenant, last step of a write transaction"""
+        statement = insert(DataVersion).values(user_id=user_id or "", project_id=project_id or "", version=1)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[DataVersion.user_id, DataVersion.project_id],
+            set_={"version": DataVersion.version + 1}
+        ))
+
+    def data_version(self, user_id: str = None, project_id: str = None) -> int:
+        """Sum of the versions of the tenants matching the filter: grows with each write"""
+        with self._session() as session:
+            return int(session.execute(self.data_version_statement(user_id, project_id)).scalar())
+
+    def data_version_statement(self, user_id: str = None, project_id: str = None) -> Select:
+        """SELECT of data_version()"""
+        return select(func.coalesce(func.sum(DataVersion.version), 0)).where(
+            *self._version_filters(user_id, project_id)
         )
 
-        # Filter by user_id and/or project_id if provided
+    def _version_filters(self, user_id: str = None, project_id: str = None) -> list:
+        filters = []
         if user_id is not None:
-            query = query.filter(DocumentChunk.user_id == user_id)
+            filters.append(DataVersion.user_id == user_id)
         if project_id is not None:
-            query = query.filter(DocumentChunk.project_id == project_id)
+            filters.append(DataVersion.project_id == project_id)
+        return filters
 
-        results = query.order_by("distance").limit(top_k).all()
+    def _document_columns(self) -> list:
+        return [
+            Document.id, Document.source, Document.user_id, Document.project_id,
+            Document.document_hash, Document.chunk_count, Document.size_bytes, Document.indexed_at
+        ]
 
+    def backfill_hashes(self) -> int:
+        """Compute content_hash for rows indexed before hashing existed"""
+        with self._session() as session:
+            result = session.execute(text(
+                "UPDATE document_chunks "
+                "SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex') "
+                "WHERE content_hash IS NULL"
+            ))
+        return result.rowcount
+
+    def _document_filters(self, source: str, user_id: str = None, project_id: str = None) -> list:
+        # == None est traduit en IS NULL par SQLAlchemy
         return [
-            {
-                "content": r.content,
-                "source": r.source,
-                "score": 1 - r.distance
-            }
-            for r in results
+            DocumentChunk.source == source,
+            DocumentChunk.user_id == user_id,
+            DocumentChunk.project_id == project_id
         ]
 
-    def clear(self, user_id: str = None, project_id: str = None):
-        """Delete chunks (optionally filtered by user/project)"""
-        query = self.session.query(DocumentChunk)
+    def search(self, query_embedding: list[float], top_k: int = None,
+               user_id: str = None, project_id: str = None,
+               ef_search: int = None, probes: int = None,
+               query_text: str = None, mode: str = None,
+               with_embeddings: bool = False) -> list[dict]:
+        """
+        Search most similar chunks with optional user/project filter.
+        Each hit has content, source, chunk_index, score (and embedding if with_embeddings).
+
+        mode (default settings.search_mode):
+          - "vector": cosine distance on embeddings
+          - "lexical": Postgres full-text search on query_text
+          - "hybrid": both candidate lists fused by reciprocal rank fusion,
+            in a single SQL statement
+        ef_search (hnsw) / probes (ivfflat) override the Settings value for this query.
+        """
+        if top_k is None:
+            top_k = settings.top_k_results
+
+        mode = self.search_mode(mode, bool(query_text))
+        statement = self.search_statement(
+            query_embedding, top_k, user_id, project_id, query_text, mode, with_embeddings
+        )
+        with self._session() as session:
+            # Le reglage SET LOCAL ne vit que dans la transaction de cette session
+            self._tune_search(session, self._tuning_size(top_k, mode), ef_search=ef_search, probes=probes)
+            results = session.execute(statement).all()
+
+        return [self.hit(r, with_embeddings) for r in results]
+
+    def search_batch(self, query_embeddings: list[list[float]], top_k: int = None,
+                     user_id: str = None, project_id: str = None,
+                     ef_search: int = None, probes: int = None,
+                     query_texts: list[str] = None, mode: str = None,
+                     with_embeddings: bool = False) -> list[list[dict]]:
+        """
+        search() for many queries in a single SQL statement: the queries are a
+        VALUES list joined LATERAL to the per-query search, so each one is
+        still served by the ANN / full-text indexes.
+        Returns one result list per query, in the same order.
+        """
+        if not query_embeddings:
+            return []
+        if top_k is None:
+            top_k = settings.top_k_results
+
+        mode = self.search_mode(mode, query_texts is not None and all(query_texts))
+        statement = self.search_batch_statement(
+            query_embeddings, top_k, user_id, project_id, query_texts, mode, with_embeddings
+        )
+        results = [[] for _ in query_embeddings]
+        with self._session() as session:
+            self._tune_search(session, self._tuning_size(top_k, mode), ef_search=ef_search, probes=probes)
+            for r in session.execute(statement):
+                results[r.idx].append(self.hit(r, with_embeddings))
+        return results
+
+    def search_batch_statement(self, query_embeddings: list[list[float]], top_k: int,
+                               user_id: str = None, project_id: str = None,
+                               query_texts: list[str] = None, mode: str = None,
+                               with_embeddings: bool = False) -> Select:
+        """Rows (idx, hit columns, score) of all the queries, ordered by idx then score"""
+        mode = self.search_mode(mode, query_texts is not None and all(query_texts))
+        texts = query_texts if query_texts is not None else [None] * len(query_embeddings)
+        queries = values(
+            column("idx", Integer),
+            column("embedding", Vector(settings.embedding_dim)),
+            column("query_text", Text),
+            name="queries"
+        ).data(list(zip(range(len(query_embeddings)), query_embeddings, texts)))
+        # Les parametres d'un VALUES arrivent en texte: cast explicite en vector
+        query_embedding = cast(queries.c.embedding, Vector(settings.embedding_dim))
+
+        if mode == "hybrid":
+            return self._hybrid_batch_statement(
+                queries, query_embedding, top_k, self._filters(user_id, project_id), with_embeddings
+            )
+        hits = self.search_statement(
+            query_embedding, top_k, user_id, project_id, queries.c.query_text, mode, with_embeddings
+        ).lateral("hits")
+        return (
+            select(queries.c.idx, *[hits.c[c.name] for c in self._hit_columns(with_embeddings)], hits.c.score)
+            .select_from(queries)
+            .join(hits, true())
+            .order_by(queries.c.idx, hits.c.score.desc())
+        )
+
+    def _hit_columns(self, with_embeddings: bool = False) -> list:
+        """Chunk columns returned with each search hit"""
+        columns = [DocumentChunk.content, DocumentChunk.source, DocumentChunk.chunk_index]
+        if with_embeddings:
+            columns.append(DocumentChunk.embedding)
+        return columns
 
+    def hit(self, row, with_embeddings: bool = False) -> dict:
+        """Result dict of one row of search_statement / search_batch_statement"""
+        hit = {
+            "content": row.content,
+            "source": row.source,
+            "chunk_index": row.chunk_index,
+            "score": float(row.score)
+        }
+        if with_embeddings:
+            hit["embedding"] = row.embedding
+        return hit
+
+    def _hybrid_batch_statement(self, queries, query_embedding, top_k: int, filters: list,
+                                with_embeddings: bool = False) -> Select:
+        """
+        Hybrid search of search_batch: the candidate lists are LATERAL joins at
+        the first level (a deeper subquery could not reference the queries),
+        numbered and fused per query, then cut to top_k per query.
+        """
+        candidates = self._vector_candidates_count(top_k, "hybrid")
+        vector_hits = self._vector_candidates(query_embedding, candidates, filters).lateral("vector_hits")
+        lexical_hits = self._lexical_candidates(queries.c.query_text, candidates, filters).lateral("lexical_hits")
+        ranked = union_all(*[
+            select(
+                queries.c.idx,
+                hits.c.id,
+                func.row_number().over(partition_by=queries.c.idx, order_by=order).label("rank")
+            ).select_from(queries).join(hits, true())
+            for hits, order in [
+                (vector_hits, vector_hits.c.sort_key),
+                (lexical_hits, lexical_hits.c.sort_key.desc())
+            ]
+        ]).subquery("ranked")
+        fused = (
+            select(
+                ranked.c.idx,
+                ranked.c.id,
+                func.sum(1.0 / (settings.rrf_k + ranked.c.rank)).label("score")
+            )
+            .group_by(ranked.c.idx, ranked.c.id)
+            .subquery("fused")
+        )
+        positioned = select(
+            fused,
+            func.row_number().over(
+                partition_by=fused.c.idx, order_by=(fused.c.score.desc(), fused.c.id)
+            ).label("position")
+        ).subquery("positioned")
+        return (
+            select(positioned.c.idx, *self._hit_columns(with_embeddings), positioned.c.score)
+            .join(positioned, positioned.c.id == DocumentChunk.id)
+            .where(positioned.c.position <= top_k)
+            .order_by(positioned.c.idx, positioned.c.position)
+        )
+
+    def search_mode(self, mode: str = None, has_text: bool = False) -> str:
+        """Checked search mode (default settings.search_mode)"""
+        mode = mode or settings.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu: {mode} (attendu: {SEARCH_MODES})")
+        if mode != "vector" and not has_text:
+            raise ValueError(f"Le mode {mode} necessite le texte de la question")
+        return mode
+
+    def _filters(self, user_id: str = None, project_id: str = None) -> list:
+        """Filter by user_id and/or project_id if provided"""
+        filters = []
         if user_id is not None:
-            query = query.filter(DocumentChunk.user_id == user_id)
+            filters.append(DocumentChunk.user_id == user_id)
         if project_id is not None:
-            query = query.filter(DocumentChunk.project_id == project_id)
+            filters.append(DocumentChunk.project_id == project_id)
+        return filters
+
+    def search_statement(self, query_embedding: list[float], top_k: int,
+                         user_id: str = None, project_id: str = None,
+                         query_text: str = None, mode: str = None,
+                         with_embeddings: bool = False) -> Select:
+        """
+        SELECT _hit_columns, score of the top_k chunks for a search mode
+        (checked by search_mode). The query may be values or SQL expressions.
+        Shared with AsyncVectorStore, like the other public statement builders.
+        """
+        filters = self._filters(user_id, project_id)
+        columns = self._hit_columns(with_embeddings)
+
+        if mode == "vector":
+            distance = DocumentChunk.embedding.cosine_distance(query_embedding)
+            return self._nearest(
+                query_embedding, top_k, filters, *columns, (1 - distance).label("score")
+            )
+
+        if mode == "lexical":
+            rank = self._text_rank(query_text)
+            return (
+                select(*columns, rank.label("score"))
+                .where(self._text_match(query_text), *filters)
+                .order_by(rank.desc())
+                .limit(top_k)
+            )
+
+        # hybrid: reciprocal rank fusion des deux listes de candidats
+        candidates = self._vector_candidates_count(top_k, "hybrid")
+        ranked = union_all(
+            self._ranked_ids(self._vector_candidates(query_embedding, candidates, filters)),
+            self._ranked_ids(self._lexical_candidates(query_text, candidates, filters), descending=True)
+        ).subquery("ranked")
+        fused = (
+            select(
+                ranked.c.id,
+                func.sum(1.0 / (settings.rrf_k + ranked.c.rank)).label("score")
+            )
+            .group_by(ranked.c.id)
+            .subquery("fused")
+        )
+        return (
+            select(*columns, fused.c.score)
+            .join(fused, fused.c.id == DocumentChunk.id)
+            .order_by(fused.c.score.desc(), DocumentChunk.id)
+            .limit(top_k)
+        )
+
+    def _vector_candidates(self, query_embedding: list[float], limit: int, filters: list) -> Select:
+        """(id, sort_key) of the nearest chunks, served by the ANN index"""
+        distance = DocumentChunk.embedding.cosine_distance(query_embedding)
+        return self._nearest(query_embedding, limit, filters, DocumentChunk.id, distance.label("sort_key"))
+
+    def _nearest(self, query_embedding: list[float], limit: int, filters: list,
+                 *columns, rescore_factor: int = None) -> Select:
+        """
+        SELECT columns of the `limit` nearest chunks by exact cosine distance.
+
+        With a compact vector_storage, the index first returns
+        limit * vector_rescore_factor candidates on the halfvec / binary
+        representation, which are then re-sorted on the full-precision embedding.
+        """
+        distance = DocumentChunk.embedding.cosine_distance(query_embedding)
+        if settings.vector_storage == "vector":
+            return select(*columns).where(*filters).order_by(distance).limit(limit)
+
+        # correlate_except: in search_batch the query is a column of the
+        # enclosing VALUES, which must not be added to this FROM
+        shortlist = (
+            select(*columns, distance.label("exact_distance"))
+            .where(*filters)
+            .order_by(self._compact_distance(query_embedding))
+            .limit(self._shortlist_size(limit, rescore_factor))
+            .correlate_except(DocumentChunk)
+            .subquery("shortlist")
+        )
+        return (
+            select(*[shortlist.c[c.name] for c in columns])
+            .order_by(shortlist.c.exact_distance)
+            .limit(limit)
+        )
+
+    def _compact_distance(self, query_embedding: list[float]):
+        """Distance served by the index of a compact vector_storage (same expression as in _index_ddl)"""
+        dim = settings.embedding_dim
+        if settings.vector_storage == "halfvec":
+            return cast(DocumentChunk.embedding, HALFVEC(dim)).cosine_distance(
+                cast(query_embedding, HALFVEC(dim))
+            )
+        return DocumentChunk.embedding_bits.hamming_distance(
+            func.binary_quantize(cast(query_embedding, Vector(dim)))
+        )
+
+    def _vector_candidates_count(self, top_k: int, mode: str) -> int:
+        """Rows of the vector candidate list: hybrid fuses hybrid_candidates of them"""
+        return max(top_k, settings.hybrid_candidates) if mode == "hybrid" else top_k
+
+    def _tuning_size(self, top_k: int, mode: str) -> int:
+        """Rows the ANN index must be able to return for this search (hnsw.ef_search)"""
+        return self._shortlist_size(self._vector_candidates_count(top_k, mode))
+
+    def _shortlist_size(self, limit: int, rescore_factor: int = None) -> int:
+        """Number of rows asked to the ANN index for `limit` results"""
+        if settings.vector_storage == "vector":
+            return limit
+        return limit * max(1, rescore_factor or settings.vector_rescore_factor)
+
+    def _lexical_candidates(self, query_text: str, limit: int, filters: list) -> Select:
+        """(id, sort_key) of the best full-text matches, served by the GIN index"""
+        rank = self._text_rank(query_text)
+        return (
+            select(DocumentChunk.id, rank.label("sort_key"))
+            .where(self._text_match(query_text), *filters)
+            .order_by(rank.desc())
+            .limit(limit)
+        )
 
-        query.delete()
-        self.session.commit()
+    def _ranked_ids(self, candidates: Select, descending: bool = False) -> Select:
+        """Number candidates 1..n: the LIMIT stays in the subquery so the index is used"""
+        subquery = candidates.subquery()
+        order = subquery.c.sort_key.desc() if descending else subquery.c.sort_key
+        return select(subquery.c.id, func.row_number().over(order_by=order).label("rank"))
+
+    def _text_query(self, query_text: str):
+        return func.websearch_to_tsquery(
+            cast(literal(settings.text_search_config), REGCONFIG), query_text
+        )
+
+    def _text_match(self, query_text: str):
+        return DocumentChunk.content_tsv.op("@@")(self._text_query(query_text))
+
+    def _text_rank(self, query_text: str):
+        return func.ts_rank_cd(DocumentChunk.content_tsv, self._text_query(query_text))
+
+    def clear(self, user_id: str = None, project_id: str = None):
+        """
+        Delete chunks and catalog documents (optionally filtered by user/project).
+        On a partitioned table, clearing a whole project truncates its "list"
+        partition, and clearing everything truncates the tables.
+        """
+        table = DocumentChunk.__tablename__
+        with self._session() as session:
+            if user_id is None and project_id is None:
+                if self.partitioning != "none":
+                    session.execute(text(f"TRUNCATE {table}, {Document.__tablename__}"))
+                else:
+                    session.execute(delete(DocumentChunk))
+                    session.execute(delete(Document))
+            else:
+                if self.partitioning == "list" and user_id is None:
+                    partition = self.partition_name(project_id)
+                    if session.execute(text("SELECT to_regclass(:name)"), {"name": partition}).scalar():
+                        session.execute(text(f"TRUNCATE {partition}"))
+                else:
+                    query = session.query(DocumentChunk)
+
+                    if user_id is not None:
+                        query = query.filter(DocumentChunk.user_id == user_id)
+                    if project_id is not None:
+                        query = query.filter(DocumentChunk.project_id == project_id)
+
+                    query.delete()
+                # Chunks deja supprimes: la cascade n'a plus rien a faire
+                documents = delete(Document)
+                if user_id is not None:
+                    documents = documents.where(Document.user_id == user_id)
+                if project_id is not None:
+                    documents = documents.where(Document.project_id == project_id)
+                session.execute(documents)
+            # En dernier, comme les autres ecritures: les lignes de version sont verrouillees jusqu'au commit
+            session.execute(
+                update(DataVersion)
+                .where(*self._version_filters(user_id, project_id))
+                .values(version=DataVersion.version + 1)
+            )
+        self._notify_change(user_id, project_id)
@@ -0,0 +1,50 @@
+# round trip chunker -> context assembler: the merged chunks give back the original text
+
+import re
+from pathlib import Path
+import pytest
+from config.settings import settings
+from src.chunking.chunker import TextChunker
+from src.retrieval.context import ContextAssembler, overlap_length
+
+SAMPLE = (Path(__file__).parent.parent / "data" / "test.txt").read_text(encoding="utf-8")
+# Phrases courtes et ponctuees: le splitter classique coupe sur ". " et le garde en tete du chunk suivant
+PUNCTUATED = "\n\n".join(
+    " ".join(
+        f"Le paragraphe {p} contient la phrase {s}, avec une virgule; puis {p * s} mots{'!?.'[s % 3]}"
+        for s in range(1, 12)
+    )
+    for p in range(1, 6)
+)
+
+
+def squash(text: str) -> str:
+    # Les blancs aux frontieres des chunks ne sont pas conserves par les chunkers
+    return re.sub(r"\s+", "", text)
+
+
+@pytest.mark.parametrize("mode", ["classic", "semantic"])
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(200, 50), (500, 50)])
+@pytest.mark.parametrize("text", [SAMPLE, PUNCTUATED], ids=["sample", "punctuated"])
+def test_assembled_chunks_round_trip(monkeypatch, mode, chunk_size, chunk_overlap, text):
+    if mode == "classic":
+        pytest.importorskip("langchain_text_splitters")
+    monkeypatch.setattr(settings, "chunk_size", chunk_size)
+    monkeypatch.setattr(settings, "chunk_overlap", chunk_overlap)
+    chunks = TextChunker(mode=mode).chunk_with_metadata(text, "doc.txt")
+    assert len(chunks) > 1
+
+    assembler = ContextAssembler(token_budget=0, mmr_lambda=1.0, max_overlap=2 * chunk_overlap)
+    blocks = assembler.assemble([{**chunk, "score": 1.0} for chunk in chunks])["context"]
+
+    assert [block["chunk_indexes"] for block in blocks] == [list(range(len(chunks)))]
+    assert squash(blocks[0]["content"]) == squash(text)
+
+
+def test_overlap_before_punctuation():
+    # Overlap du splitter classique: le chunk suivant reprend ". Phrase 2" puis continue par ". "
+    assert overlap_length("Phrase 1. Phrase 2", ". Phrase 2. Phrase 3", 50) == len(". Phrase 2")
+
+
+def test_short_coincidental_repeat_is_kept():
+    assert overlap_length("il en reste un", "un autre chunk", 50) == 0